@@ -0,0 +1,342 @@
+"""
+Stack-In-A-Box: ASGI Application
+"""
+import logging
+import urllib.parse
+from wsgiref.util import is_hop_by_hop
+
+from stackinabox.server.core import BODILESS_STATUS_CODES
+from stackinabox.server.wsgi import PATH_SAFE_CHARACTERS
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    FileResponse,
+    close_body_async,
+    get_body_bytes,
+    get_body_length,
+    iterate_body_async
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class ASGIRequest(object):
+    """Request received through ASGI.
+
+    Provides the request to the StackInABoxService handlers.
+
+    Unless the application streams request bodies, the body has been
+    received in full and is available as `body`. Otherwise `body` is None
+    until the handler reads it; `async def` handlers may instead consume it
+    chunk by chunk as the client sends it:
+
+        async def upload(self, request, uri, headers):
+            digest = hashlib.sha256()
+            async for chunk in request.stream():
+                digest.update(chunk)
+    """
+
+    def __init__(self, method, url, path, headers, scope, receive,
+                 body=None):
+        """Initialize the request.
+
+        :param method: HTTP verb
+        :param url: full URL of the request including the query string
+        :param path: path and query string of the URL
+        :param headers: case-insensitive request headers
+        :param scope: ASGI connection scope of the request
+        :param receive: ASGI receive callable of the request
+        :param body: bytes of the request body if it has already been
+                     received, otherwise None
+        """
+        self.method = method
+        self.url = url
+        self.path = path
+        self.headers = headers
+        self.scope = scope
+        self.body = body
+        self.__receive = receive
+        self.__streamed = False
+        self.__body_reader = None
+
+    async def stream(self):
+        """Iterate over the chunks of the request body.
+
+        The chunks are received from the client as they are iterated over,
+        so a body that has not been received yet may only be iterated over
+        once.
+
+        :returns: asynchronous iterator of bytes
+        :raises: RuntimeError if the body has already been streamed,
+                 ConnectionResetError if the client disconnected
+        """
+        if self.body is not None:
+            if self.body:
+                yield self.body
+            return
+
+        if self.__streamed:
+            raise RuntimeError('The request body has already been streamed')
+        self.__streamed = True
+
+        while True:
+            message = await self.__receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionResetError('The client disconnected')
+
+            chunk = message.get('body', b'')
+            if chunk:
+                yield chunk
+            if not message.get('more_body', False):
+                break
+
+    @property
+    def body_reader(self):
+        """BodyReader of the request body once it has been received.
+
+        :raises: RuntimeError if the body has not been received, use
+                 stream() to receive it chunk by chunk instead
+        """
+        if self.body is None:
+            raise RuntimeError(
+                'The request body has not been received, use stream() or '
+                'read() first'
+            )
+        if self.__body_reader is None:
+            self.__body_reader = BodyReader(self.body)
+        return self.__body_reader
+
+    async def read(self):
+        """Receive the whole request body.
+
+        :returns: bytes of the request body, also available as `body`
+        """
+        if self.body is None:
+            self.body = b''.join([chunk async for chunk in self.stream()])
+        return self.body
+
+
+def get_path(scope):
+    """Get the path and query string of a request.
+
+    :param scope: ASGI connection scope of the request
+
+    :returns: string - the quoted path and the query string, if any
+    """
+    raw_path = scope.get('raw_path')
+    if raw_path:
+        path = raw_path.decode('latin-1')
+    else:
+        path = urllib.parse.quote(scope['path'], safe=PATH_SAFE_CHARACTERS)
+
+    query = scope.get('query_string', b'')
+    if query:
+        path = '{0}?{1}'.format(path, query.decode('latin-1'))
+    return path
+
+
+def get_headers(scope):
+    """Get the headers of a request.
+
+    :param scope: ASGI connection scope of the request
+
+    :returns: CaseInsensitiveDict of the request headers
+    """
+    headers = CaseInsensitiveDict()
+    for key, value in scope.get('headers', ()):
+        name = key.decode('latin-1')
+        value = value.decode('latin-1')
+        if name in headers:
+            headers[name] = '{0}, {1}'.format(headers[name], value)
+        else:
+            headers[name] = value
+    return headers
+
+
+class ASGIApplication(object):
+    """ASGI application handing all of its requests to Stack-In-A-Box.
+
+    The application may be hosted by any ASGI server, or called directly by
+    ASGI test transports without any network:
+
+        StackInABox.register_service(HelloService())
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=ASGIApplication())
+        )
+
+    Requests are dispatched asynchronously so `async def` handlers can
+    answer many requests concurrently. Services see an ASGIRequest.
+
+    Response bodies that are iterators, asynchronous iterators, or
+    file-like objects are sent as one `http.response.body` message per
+    chunk as they are produced. FileResponse bodies are handed to the
+    server as the file itself if it supports the
+    `http.response.zerocopysend` extension. With `stream_request_body` the
+    request body is left for the handler to receive, so uploads of any size
+    can be handled in constant memory.
+    """
+
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, instance=None, stream_request_body=False):
+        """Initialize the application.
+
+        :param instance: StackInABox instance handling the requests,
+                         defaults to the instance of the calling thread
+        :param stream_request_body: leave the request body for the handlers
+                                    to receive instead of receiving it
+                                    before calling them
+        """
+        self.instance = (
+            instance if instance is not None
+            else StackInABox.get_thread_instance()
+        )
+        self.stream_request_body = stream_request_body
+
+    async def get_request(self, scope, receive):
+        """Translate an ASGI connection scope into a request.
+
+        :param scope: ASGI connection scope of the request
+        :param receive: ASGI receive callable of the request
+
+        :returns: ASGIRequest object
+        """
+        path = get_path(scope)
+        request = ASGIRequest(
+            scope['method'],
+            'http://{0}{1}'.format(self.instance.base_url, path),
+            path,
+            get_headers(scope),
+            scope,
+            receive
+        )
+        if not self.stream_request_body:
+            await request.read()
+        return request
+
+    async def send_response(self, send, method, stackinabox_result,
+                            zero_copy_send=False):
+        """Send the result of Stack-In-A-Box as the response to a request.
+
+        :param send: ASGI send callable of the request
+        :param method: HTTP verb of the request
+        :param stackinabox_result: tuple - (int, dict, body) returned by
+                                   Stack-In-A-Box
+        :param zero_copy_send: does the server support the
+                               `http.response.zerocopysend` extension
+
+        :returns: n/a
+        """
+        status_code, output_headers, body = stackinabox_result
+
+        # ASGI leaves the connection management to the server
+        headers = [
+            (str(key).lower().encode('latin-1'),
+             str(value).encode('latin-1'))
+            for key, value in output_headers.items()
+            if not is_hop_by_hop(key)
+        ]
+
+        bodiless = status_code in BODILESS_STATUS_CODES
+        content = get_body_bytes(body)
+        length = get_body_length(body)
+        if length is not None and not bodiless and not any(
+            key == b'content-length' for key, _ in headers
+        ):
+            headers.append((b'content-length',
+                            str(length).encode('latin-1')))
+
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': headers,
+        })
+
+        if method == 'HEAD' or bodiless:
+            await close_body_async(body)
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        if content is not None:
+            await send({'type': 'http.response.body', 'body': bytes(content)})
+            return
+
+        if isinstance(body, FileResponse) and zero_copy_send:
+            try:
+                await send({
+                    'type': 'http.response.zerocopysend',
+                    'file': body.file,
+                    'offset': body.offset,
+                    'count': length,
+                })
+            finally:
+                body.close()
+            return
+
+        async for chunk in iterate_body_async(body, self.CHUNK_SIZE):
+            if chunk:
+                await send({
+                    'type': 'http.response.body',
+                    'body': bytes(chunk),
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def lifespan(self, receive, send):
+        """Acknowledge the startup and shutdown of the server.
+
+        :param receive: ASGI receive callable of the lifespan
+        :param send: ASGI send callable of the lifespan
+
+        :returns: n/a
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        """Handle a request.
+
+        :param scope: ASGI connection scope
+        :param receive: ASGI receive callable
+        :param send: ASGI send callable
+
+        :returns: n/a
+        :raises: ValueError for connections other than HTTP
+        """
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        if scope['type'] != 'http':
+            raise ValueError(
+                'Stack-In-A-Box does not support {0} connections'
+                .format(scope['type'])
+            )
+
+        request = await self.get_request(scope, receive)
+        if trace.ENABLED:
+            trace.debug(logger, 'ASGI: %s - %s', request.method, request.url)
+
+        # the handlers of the services use the instance of the application;
+        # clients such as httpx.ASGITransport await the application in their
+        # own task, so the binding is undone once the response is sent
+        with StackInABox.use_instance(self.instance):
+            await self.send_response(
+                send,
+                request.method,
+                await self.instance.call_async(request.method,
+                                               request,
+                                               request.url,
+                                               CaseInsensitiveDict()),
+                'http.response.zerocopysend' in (
+                    scope.get('extensions') or {}
+                )
+            )
@@ -0,0 +1,673 @@
+"""
+Stack-In-A-Box: Loopback HTTP/1.1 Server
+"""
+import asyncio
+import http.client
+import logging
+import threading
+import urllib.parse
+
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    FileResponse,
+    close_body_async,
+    get_body_bytes,
+    get_body_length,
+    iterate_body_async
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# reason phrases of the status codes Stack-In-A-Box uses to report its own
+# failures
+STACKINABOX_REASONS = {
+    595: 'Route Not Handled',
+    596: 'Service Handler Error',
+    597: 'Unknown Service',
+}
+
+# status codes of responses that never have a body
+BODILESS_STATUS_CODES = frozenset([204, 304])
+
+
+def get_reason_for_status(status_code):
+    """Lookup the HTTP reason text for a given status code.
+
+    :param status_code: int - HTTP status code
+
+    :returns: string - HTTP reason text
+    """
+    try:
+        return http.client.responses[status_code]
+    except KeyError:
+        return STACKINABOX_REASONS.get(
+            status_code,
+            'Unknown status code - {0}'.format(status_code)
+        )
+
+
+class RequestError(Exception):
+    """The client sent a request the server cannot handle."""
+
+    def __init__(self, status_code, message):
+        """Initialize the error.
+
+        :param status_code: int - HTTP status code of the error response
+        :param message: description of the error sent as the response body
+        """
+        super(RequestError, self).__init__(message)
+        self.status_code = status_code
+
+
+class ServerRequest(object):
+    """Request received by the StackInABoxServer.
+
+    Provides the request to the StackInABoxService handlers. The body is
+    available as `body` and through the BodyReader `body_reader`.
+    """
+
+    def __init__(self, method, url, path, version, headers, body,
+                 client_address=None):
+        """Initialize the request.
+
+        :param method: HTTP verb
+        :param url: full URL of the request including the query string
+        :param path: request target, the path and query string of the URL
+        :param version: HTTP version of the request, f.e `HTTP/1.1`
+        :param headers: case-insensitive request headers
+        :param body: bytes of the request body
+        :param client_address: tuple - (host, port) of the client
+        """
+        self.method = method
+        self.url = url
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+        self.body_reader = BodyReader(body)
+        self.client_address = client_address
+
+
+class StackInABoxServer(object):
+    """HTTP/1.1 server handing all of its requests to Stack-In-A-Box.
+
+    The server listens on the loopback interface so that any HTTP client,
+    including those of other processes and languages, can reach the
+    services of a StackInABox instance without patching anything:
+
+        StackInABox.register_service(HelloService())
+        with StackInABoxServer() as server:
+            requests.get(server.url + '/hello/')
+
+    The server runs on an event loop in a thread of its own when used with
+    start() and stop(), or as a context manager. Code that is already
+    running an event loop may use start_serving() and stop_serving()
+    instead.
+
+    Connections are kept alive and pipelined requests are answered in
+    order. Request bodies may be sent with a Content-Length or chunked
+    encoding; response bodies that are iterators or file-like objects are
+    sent with chunked encoding, and FileResponse bodies straight from the
+    file with `os.sendfile` where the platform has it. Connections beyond
+    `max_connections` wait until another connection is closed.
+
+    Requests are dispatched asynchronously so `async def` handlers can
+    answer many requests concurrently. Services see a ServerRequest.
+    """
+
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, host='127.0.0.1', port=0, max_connections=100,
+                 keep_alive_timeout=5.0, max_header_size=2 ** 16,
+                 max_body_size=None, instance=None, sock=None,
+                 reuse_port=False):
+        """Initialize the server.
+
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port
+        :param max_connections: maximum number of connections served at
+                                the same time
+        :param keep_alive_timeout: seconds an idle connection is kept open,
+                                   None keeps it open until the client
+                                   closes it
+        :param max_header_size: maximum size of the request line and
+                                headers in bytes
+        :param max_body_size: maximum size of a request body in bytes, None
+                              for no limit
+        :param instance: StackInABox instance handling the requests,
+                         defaults to the instance of the calling thread
+        :param sock: already bound socket to listen on instead of host and
+                     port
+        :param reuse_port: allow other sockets to bind the same port
+        """
+        if max_connections < 1:
+            raise ValueError(
+                'max_connections must be at least 1, not {0}'
+                .format(max_connections)
+            )
+
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.instance = (
+            instance if instance is not None
+            else StackInABox.get_thread_instance()
+        )
+        self.sock = sock
+        self.reuse_port = reuse_port
+
+        self.server = None
+        self.connection_slots = None
+        self.connections = {}
+        self.closing = False
+        self.loop = None
+        self.thread = None
+
+    @property
+    def address(self):
+        """tuple - (host, port) the server is listening on."""
+        if self.server is None:
+            raise RuntimeError('StackInABoxServer is not serving')
+        return self.server.sockets[0].getsockname()[:2]
+
+    @property
+    def url(self):
+        """Base URL of the server, f.e `http://127.0.0.1:8080`."""
+        host, port = self.address
+        if ':' in host:
+            host = '[{0}]'.format(host)
+        return 'http://{0}:{1}'.format(host, port)
+
+    async def start_serving(self):
+        """Start listening on the event loop of the caller.
+
+        :returns: n/a
+        """
+        if self.server is not None:
+            raise RuntimeError('StackInABoxServer is already serving')
+
+        self.closing = False
+        self.connection_slots = asyncio.Semaphore(self.max_connections)
+        server_kwargs = {'limit': self.max_header_size}
+        if self.sock is not None:
+            server_kwargs['sock'] = self.sock
+        else:
+            server_kwargs['host'] = self.host
+            server_kwargs['port'] = self.port
+            server_kwargs['reuse_port'] = self.reuse_port or None
+
+        self.server = await asyncio.start_server(self.handle_connection,
+                                                 **server_kwargs)
+        logger.debug('StackInABoxServer: listening on {0}'.format(self.url))
+
+    async def stop_serving(self, timeout=5.0):
+        """Stop listening and close all connections.
+
+        Requests that are being handled are answered before their
+        connection is closed, idle connections are closed right away.
+
+        :param timeout: seconds to wait for requests that are being handled,
+                        None waits until they are answered
+
+        :returns: n/a
+        """
+        if self.server is None:
+            return
+
+        logger.debug('StackInABoxServer: stopping {0}'.format(self.url))
+        self.closing = True
+        self.server.close()
+
+        for task, idle in list(self.connections.items()):
+            if idle:
+                task.cancel()
+
+        pending = list(self.connections)
+        if pending:
+            done, pending = await asyncio.wait(pending, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+        await self.server.wait_closed()
+        self.server = None
+
+    def start(self):
+        """Start serving on an event loop in a thread of its own.
+
+        :returns: the server
+        """
+        if self.thread is not None:
+            raise RuntimeError('StackInABoxServer is already serving')
+
+        started = threading.Event()
+        errors = []
+        loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.start_serving())
+            except Exception as ex:
+                errors.append(ex)
+                loop.close()
+                return
+            finally:
+                started.set()
+
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        self.loop = loop
+        self.thread = threading.Thread(target=run,
+                                       name='stackinabox-server',
+                                       daemon=True)
+        self.thread.start()
+        started.wait()
+
+        if errors:
+            self.thread.join()
+            self.loop = None
+            self.thread = None
+            raise errors[0]
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop serving from the thread started by start().
+
+        :param timeout: seconds to wait for requests that are being handled
+
+        :returns: n/a
+        """
+        if self.thread is None:
+            return
+
+        asyncio.run_coroutine_threadsafe(
+            self.stop_serving(timeout), self.loop
+        ).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
+        self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of a connection until it is closed.
+
+        :param reader: asyncio.StreamReader of the connection
+        :param writer: asyncio.StreamWriter of the connection
+
+        :returns: n/a
+        """
+        task = asyncio.current_task()
+        self.connections[task] = True
+        try:
+            # the handlers of the services use the instance of the server,
+            # even when it serves on the loop of the caller
+            with StackInABox.use_instance(self.instance):
+                async with self.connection_slots:
+                    await self.serve_connection(reader, writer, task)
+        except asyncio.CancelledError:
+            pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.debug('StackInABoxServer: connection lost')
+        except Exception:
+            logger.exception('StackInABoxServer: failed to serve connection')
+        finally:
+            del self.connections[task]
+            writer.close()
+
+    async def serve_connection(self, reader, writer, task):
+        """Serve the requests of a connection one after another.
+
+        :param reader: asyncio.StreamReader of the connection
+        :param writer: asyncio.StreamWriter of the connection
+        :param task: asyncio.Task serving the connection
+
+        :returns: n/a
+        """
+        client_address = writer.get_extra_info('peername')
+        keep_alive = True
+        while keep_alive and not self.closing:
+            self.connections[task] = True
+            try:
+                if self.keep_alive_timeout is None:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                else:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b'\r\n\r\n'),
+                        self.keep_alive_timeout
+                    )
+            except asyncio.IncompleteReadError:
+                # the client closed the connection
+                return
+            except asyncio.TimeoutError:
+                logger.debug('StackInABoxServer: closing idle connection')
+                return
+            except asyncio.LimitOverrunError:
+                await self.send_error(
+                    writer,
+                    RequestError(431, 'Request Header Fields Too Large')
+                )
+                return
+            self.connections[task] = False
+
+            try:
+                request = await self.read_request(reader,
+                                                  writer,
+                                                  head,
+                                                  client_address)
+            except RequestError as ex:
+                await self.send_error(writer, ex)
+                return
+
+            keep_alive = self.is_keep_alive(request)
+            keep_alive = await self.send_response(
+                writer,
+                request,
+                await self.dispatch(request),
+                keep_alive and not self.closing
+            )
+
+    @staticmethod
+    def parse_head(head):
+        """Parse the request line and headers of a request.
+
+        :param head: bytes of the request line and headers
+
+        :returns: tuple - (string, string, string, CaseInsensitiveDict) of
+                  the method, the request target, the HTTP version, and the
+                  headers
+        :raises: RequestError if the request is malformed
+        """
+        lines = head[:-4].decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise RequestError(400, 'Malformed request line')
+
+        if version not in ('HTTP/1.1', 'HTTP/1.0'):
+            raise RequestError(505, 'HTTP Version Not Supported')
+
+        headers = CaseInsensitiveDict()
+        for line in lines[1:]:
+            name, separator, value = line.partition(':')
+            name = name.strip()
+            if not separator or not name:
+                raise RequestError(400, 'Malformed header')
+
+            value = value.strip()
+            if name in headers:
+                headers[name] = '{0}, {1}'.format(headers[name], value)
+            else:
+                headers[name] = value
+
+        return (method, target, version, headers)
+
+    async def read_request(self, reader, writer, head, client_address):
+        """Read a request from a connection.
+
+        :param reader: asyncio.StreamReader of the connection
+        :param writer: asyncio.StreamWriter of the connection
+        :param head: bytes of the request line and headers
+        :param client_address: tuple - (host, port) of the client
+
+        :returns: ServerRequest object
+        :raises: RequestError if the request is malformed
+        """
+        method, target, version, headers = self.parse_head(head)
+
+        if headers.get('expect', '').lower() == '100-continue':
+            if version == 'HTTP/1.1':
+                writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        if 'transfer-encoding' in headers:
+            codings = headers['transfer-encoding'].lower().split(',')
+            if codings[-1].strip() != 'chunked':
+                raise RequestError(400, 'Unsupported Transfer-Encoding')
+            body = await self.read_chunked_body(reader)
+
+        elif 'content-length' in headers:
+            try:
+                length = int(headers['content-length'])
+            except ValueError:
+                raise RequestError(400, 'Malformed Content-Length')
+            if length < 0:
+                raise RequestError(400, 'Malformed Content-Length')
+            self.check_body_size(length)
+            body = await reader.readexactly(length)
+
+        else:
+            body = b''
+
+        # proxies send the absolute URL of the request
+        if not target.startswith('/') and '://' in target:
+            parts = urllib.parse.urlsplit(target)
+            target = urllib.parse.urlunsplit(
+                ('', '', parts.path or '/', parts.query, '')
+            )
+
+        url = 'http://{0}{1}'.format(self.instance.base_url, target)
+        return ServerRequest(method,
+                             url,
+                             target,
+                             version,
+                             headers,
+                             body,
+                             client_address=client_address)
+
+    def check_body_size(self, size):
+        """Check the size of a request body against the limit.
+
+        :param size: size of the request body in bytes
+
+        :returns: n/a
+        :raises: RequestError if the body is too large
+        """
+        if self.max_body_size is not None and size > self.max_body_size:
+            raise RequestError(413, 'Request body is too large')
+
+    async def read_chunked_body(self, reader):
+        """Read a request body sent with chunked encoding.
+
+        :param reader: asyncio.StreamReader of the connection
+
+        :returns: bytes of the request body
+        :raises: RequestError if the body is malformed
+        """
+        chunks = []
+        size = 0
+        while True:
+            try:
+                line = await reader.readuntil(b'\r\n')
+                chunk_size = int(line.split(b';', 1)[0].strip(), 16)
+            except (ValueError, asyncio.LimitOverrunError):
+                raise RequestError(400, 'Malformed chunk size')
+
+            if chunk_size == 0:
+                break
+
+            size += chunk_size
+            self.check_body_size(size)
+            chunks.append(await reader.readexactly(chunk_size))
+            if await reader.readexactly(2) != b'\r\n':
+                raise RequestError(400, 'Malformed chunk')
+
+        # trailers are not passed on to the services
+        try:
+            while await reader.readuntil(b'\r\n') != b'\r\n':
+                pass
+        except asyncio.LimitOverrunError:
+            raise RequestError(431, 'Request Header Fields Too Large')
+
+        return b''.join(chunks)
+
+    @staticmethod
+    def is_keep_alive(request):
+        """May the connection be used for another request?
+
+        :param request: ServerRequest object
+
+        :returns: boolean
+        """
+        connection = request.headers.get('connection', '').lower()
+        if request.version == 'HTTP/1.1':
+            return 'close' not in connection
+        return 'keep-alive' in connection
+
+    async def dispatch(self, request):
+        """Hand a request to Stack-In-A-Box.
+
+        :param request: ServerRequest object
+
+        :returns: tuple - (int, dict, body) returned by Stack-In-A-Box
+        """
+        if trace.ENABLED:
+            trace.debug(logger, 'StackInABoxServer: %s - %s',
+                        request.method, request.url)
+        return await self.instance.call_async(request.method,
+                                              request,
+                                              request.url,
+                                              CaseInsensitiveDict())
+
+    async def send_response(self, writer, request, stackinabox_result,
+                            keep_alive):
+        """Send the result of Stack-In-A-Box as the response to a request.
+
+        :param writer: asyncio.StreamWriter of the connection
+        :param request: ServerRequest object
+        :param stackinabox_result: tuple - (int, dict, body) returned by
+                                   Stack-In-A-Box
+        :param keep_alive: may the connection be kept open
+
+        :returns: boolean - may the connection be used for another request
+        """
+        status_code, output_headers, body = stackinabox_result
+
+        headers = [
+            (str(key), str(value)) for key, value in output_headers.items()
+        ]
+        header_names = set(key.lower() for key, _ in headers)
+
+        send_body = (
+            request.method != 'HEAD' and
+            status_code >= 200 and
+            status_code not in BODILESS_STATUS_CODES
+        )
+        content = get_body_bytes(body)
+        length = get_body_length(body)
+        chunked = False
+        if length is not None:
+            if (
+                'content-length' not in header_names and
+                status_code not in BODILESS_STATUS_CODES
+            ):
+                headers.append(('Content-Length', str(length)))
+
+        elif 'content-length' not in header_names and send_body:
+            if request.version == 'HTTP/1.1':
+                chunked = True
+                headers.append(('Transfer-Encoding', 'chunked'))
+            else:
+                # the end of the body is marked by closing the connection
+                keep_alive = False
+
+        if not keep_alive:
+            headers.append(('Connection', 'close'))
+        elif request.version == 'HTTP/1.0':
+            headers.append(('Connection', 'keep-alive'))
+
+        response_head = ''.join(
+            ['HTTP/1.1 {0} {1}\r\n'.format(
+                status_code, get_reason_for_status(status_code)
+            )] +
+            ['{0}: {1}\r\n'.format(key, value) for key, value in headers] +
+            ['\r\n']
+        ).encode('latin-1')
+
+        if content is not None:
+            if send_body and content:
+                writer.write(response_head + content)
+            else:
+                writer.write(response_head)
+            await writer.drain()
+            return keep_alive
+
+        writer.write(response_head)
+        if not send_body:
+            # the body is not sent, but its file or generator is released
+            try:
+                await writer.drain()
+            finally:
+                await close_body_async(body)
+            return keep_alive
+
+        if isinstance(body, FileResponse):
+            try:
+                if length:
+                    # waits for the response head to be sent first
+                    await asyncio.get_running_loop().sendfile(
+                        writer.transport, body.file, body.offset, length
+                    )
+                else:
+                    await writer.drain()
+            finally:
+                body.close()
+            return keep_alive
+
+        async for chunk in iterate_body_async(body, self.CHUNK_SIZE):
+            if not chunk:
+                continue
+            if chunked:
+                writer.write(
+                    '{0:x}\r\n'.format(len(chunk)).encode('latin-1')
+                )
+                writer.write(chunk)
+                writer.write(b'\r\n')
+            else:
+                writer.write(chunk)
+            await writer.drain()
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        return keep_alive
+
+    async def send_error(self, writer, error):
+        """Answer a request the server cannot handle and close the connection.
+
+        :param writer: asyncio.StreamWriter of the connection
+        :param error: RequestError describing the problem
+
+        :returns: n/a
+        """
+        logger.debug('StackInABoxServer: {0} - {1}'
+                     .format(error.status_code, error))
+        body = str(error).encode('utf-8')
+        writer.write(
+            'HTTP/1.1 {0} {1}\r\n'
+            'Content-Type: text/plain; charset=utf-8\r\n'
+            'Content-Length: {2}\r\n'
+            'Connection: close\r\n'
+            '\r\n'
+            .format(error.status_code,
+                    get_reason_for_status(error.status_code),
+                    len(body)).encode('latin-1') + body
+        )
+        await writer.drain()
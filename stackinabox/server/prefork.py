@@ -0,0 +1,366 @@
+"""
+Stack-In-A-Box: Pre-fork Multi-Process Server
+"""
+import asyncio
+import logging
+import multiprocessing
+from multiprocessing import connection
+import os
+import signal
+import socket
+import threading
+
+from stackinabox.server.core import StackInABoxServer
+from stackinabox.stack import StackInABox
+
+
+logger = logging.getLogger(__name__)
+
+
+# Linux distributes the connections between all sockets listening on the
+# same port with SO_REUSEPORT; elsewhere the workers share a single socket
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+
+def create_socket(host, port, reuse_port):
+    """Create a socket bound to an address.
+
+    :param host: address to bind to
+    :param port: port to bind to, 0 picks a free port
+    :param reuse_port: allow other sockets to bind the same port
+
+    :returns: socket.socket object
+    """
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((host, port))
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def serve_worker(instance, host, port, sock, ready, stop_timeout,
+                 initializer, initargs, server_kwargs):
+    """Serve requests in a worker process until it is terminated.
+
+    :param instance: StackInABox instance of the worker, a copy of the
+                     instance of the parent process
+    :param host: address to listen on
+    :param port: port to listen on
+    :param sock: socket shared by all workers, None if each worker listens
+                 on a socket of its own
+    :param ready: multiprocessing.Event set once the worker is listening
+    :param stop_timeout: seconds to wait for requests that are being handled
+                         when the worker is terminated
+    :param initializer: callable run in the worker before it starts serving
+    :param initargs: arguments for the initializer
+    :param server_kwargs: further arguments for the StackInABoxServer
+
+    :returns: n/a
+    """
+    # interrupts are handled by the parent process which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    StackInABox.bind_thread_instance(instance)
+    if initializer is not None:
+        initializer(*initargs)
+
+    if sock is None:
+        sock = create_socket(host, port, True)
+    server = StackInABoxServer(instance=instance, sock=sock, **server_kwargs)
+
+    async def run():
+        stopping = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                      stopping.set)
+        await server.start_serving()
+        ready.set()
+        await stopping.wait()
+        await server.stop_serving(stop_timeout)
+
+    asyncio.run(run())
+
+
+class PreforkServer(object):
+    """HTTP/1.1 server handing requests to Stack-In-A-Box in many processes.
+
+    A single StackInABoxServer is limited to a single core. The pre-fork
+    server starts a number of worker processes that each run a
+    StackInABoxServer on the same port, each with its own copy of the
+    StackInABox instance and its services as they were when the worker was
+    started:
+
+        StackInABox.register_service(HelloService())
+        with PreforkServer(workers=4) as server:
+            run_load_test(server.url + '/hello/')
+
+    With SO_REUSEPORT each worker listens on a socket of its own and the
+    kernel distributes the connections between them; otherwise the workers
+    share a single listening socket.
+
+    Workers that exit unexpectedly are replaced. Workers may be restarted,
+    f.e to pick up changed services, with restart_worker() or restart();
+    the replacement is listening before the old worker is stopped.
+
+    The workers are forked from the process, so the pre-fork server is only
+    available where os.fork() is.
+    """
+
+    def __init__(self, workers=None, host='127.0.0.1', port=0,
+                 instance=None, initializer=None, initargs=(),
+                 respawn=True, start_timeout=10.0, stop_timeout=5.0,
+                 **server_kwargs):
+        """Initialize the server.
+
+        :param workers: number of worker processes, defaults to the number
+                        of CPUs
+        :param host: address to listen on
+        :param port: port to listen on, 0 picks a free port
+        :param instance: StackInABox instance copied to the workers,
+                         defaults to the instance of the calling thread
+        :param initializer: callable run in each worker before it starts
+                            serving, f.e to register services that cannot
+                            be copied
+        :param initargs: arguments for the initializer
+        :param respawn: replace workers that exit unexpectedly
+        :param start_timeout: seconds to wait for a worker to listen
+        :param stop_timeout: seconds a stopping worker waits for requests
+                             that are being handled
+        :param server_kwargs: further arguments for the StackInABoxServer of
+                              each worker, f.e max_connections
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(
+                'workers must be at least 1, not {0}'.format(workers)
+            )
+
+        self.worker_count = workers
+        self.host = host
+        self.port = port
+        self.instance = (
+            instance if instance is not None
+            else StackInABox.get_thread_instance()
+        )
+        self.initializer = initializer
+        self.initargs = initargs
+        self.respawn = respawn
+        self.start_timeout = start_timeout
+        self.stop_timeout = stop_timeout
+        self.server_kwargs = server_kwargs
+
+        self.context = multiprocessing.get_context('fork')
+        self.sock = None
+        self.workers = []
+        self.lock = threading.RLock()
+        self.stopping = threading.Event()
+        self.monitor = None
+
+    @property
+    def address(self):
+        """tuple - (host, port) the server is listening on."""
+        if self.sock is None:
+            raise RuntimeError('PreforkServer is not serving')
+        return self.sock.getsockname()[:2]
+
+    @property
+    def url(self):
+        """Base URL of the server, f.e `http://127.0.0.1:8080`."""
+        host, port = self.address
+        if ':' in host:
+            host = '[{0}]'.format(host)
+        return 'http://{0}:{1}'.format(host, port)
+
+    @property
+    def worker_pids(self):
+        """list - process ids of the workers."""
+        with self.lock:
+            return [worker.pid for worker in self.workers]
+
+    def spawn_worker(self):
+        """Start a worker process and wait until it is listening.
+
+        :returns: multiprocessing.Process of the worker
+        :raises: RuntimeError if the worker does not start listening
+        """
+        host, port = self.address
+        ready = self.context.Event()
+        worker = self.context.Process(
+            target=serve_worker,
+            args=(self.instance,
+                  host,
+                  port,
+                  None if REUSE_PORT else self.sock,
+                  ready,
+                  self.stop_timeout,
+                  self.initializer,
+                  self.initargs,
+                  self.server_kwargs),
+            name='stackinabox-worker',
+            daemon=True
+        )
+        worker.start()
+
+        if not ready.wait(self.start_timeout):
+            self.terminate_worker(worker, 0)
+            raise RuntimeError(
+                'PreforkServer worker {0} failed to start'.format(worker.pid)
+            )
+        logger.debug('PreforkServer: worker {0} listening on {1}'
+                     .format(worker.pid, self.url))
+        return worker
+
+    @staticmethod
+    def terminate_worker(worker, timeout):
+        """Stop a worker process, killing it if it does not stop in time.
+
+        :param worker: multiprocessing.Process of the worker
+        :param timeout: seconds to wait for the worker to stop
+
+        :returns: n/a
+        """
+        if worker.is_alive():
+            worker.terminate()
+        worker.join(timeout)
+        if worker.is_alive():
+            logger.warning('PreforkServer: killing worker {0}'
+                           .format(worker.pid))
+            worker.kill()
+            worker.join()
+
+    def start(self):
+        """Start the worker processes.
+
+        :returns: the server
+        """
+        with self.lock:
+            if self.sock is not None:
+                raise RuntimeError('PreforkServer is already serving')
+
+            # the socket of the parent process reserves the port; with
+            # SO_REUSEPORT it does not listen so only the workers receive
+            # connections
+            self.sock = create_socket(self.host, self.port, REUSE_PORT)
+            if not REUSE_PORT:
+                self.sock.listen(socket.SOMAXCONN)
+
+            self.stopping.clear()
+            try:
+                for _ in range(self.worker_count):
+                    self.workers.append(self.spawn_worker())
+            except Exception:
+                self.stop()
+                raise
+
+        if self.respawn:
+            self.monitor = threading.Thread(target=self.monitor_workers,
+                                            name='stackinabox-prefork',
+                                            daemon=True)
+            self.monitor.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop all worker processes.
+
+        Requests that are being handled are answered before the workers
+        exit.
+
+        :param timeout: seconds to wait for each worker before killing it,
+                        defaults to stop_timeout plus a second
+
+        :returns: n/a
+        """
+        if timeout is None:
+            timeout = self.stop_timeout + 1
+
+        self.stopping.set()
+        if self.monitor is not None:
+            self.monitor.join()
+            self.monitor = None
+
+        with self.lock:
+            workers, self.workers = self.workers, []
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+            for worker in workers:
+                self.terminate_worker(worker, timeout)
+
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+
+    def restart_worker(self, index, timeout=None):
+        """Replace a worker process with a new one.
+
+        The new worker is listening before the old one is stopped.
+
+        :param index: index of the worker, 0 <= index < workers
+        :param timeout: seconds to wait for the old worker before killing
+                        it, defaults to stop_timeout plus a second
+
+        :returns: process id of the new worker
+        """
+        if timeout is None:
+            timeout = self.stop_timeout + 1
+
+        with self.lock:
+            old_worker = self.workers[index]
+            self.workers[index] = self.spawn_worker()
+            logger.debug('PreforkServer: replaced worker {0} with {1}'
+                         .format(old_worker.pid, self.workers[index].pid))
+            self.terminate_worker(old_worker, timeout)
+            return self.workers[index].pid
+
+    def restart(self, timeout=None):
+        """Replace all worker processes one after another.
+
+        :param timeout: seconds to wait for each old worker before killing
+                        it, defaults to stop_timeout plus a second
+
+        :returns: n/a
+        """
+        for index in range(self.worker_count):
+            self.restart_worker(index, timeout)
+
+    def monitor_workers(self):
+        """Replace workers that exit while the server is running.
+
+        :returns: n/a
+        """
+        while not self.stopping.is_set():
+            with self.lock:
+                sentinels = {
+                    worker.sentinel: worker for worker in self.workers
+                }
+            exited = connection.wait(list(sentinels), timeout=0.1)
+            if not exited:
+                continue
+
+            with self.lock:
+                if self.stopping.is_set():
+                    return
+                for sentinel in exited:
+                    worker = sentinels[sentinel]
+                    if worker not in self.workers:
+                        # replaced by restart_worker()
+                        continue
+                    worker.join()
+                    logger.warning(
+                        'PreforkServer: worker {0} exited with {1}, '
+                        'replacing it'.format(worker.pid, worker.exitcode)
+                    )
+                    self.workers[self.workers.index(worker)] = (
+                        self.spawn_worker()
+                    )
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
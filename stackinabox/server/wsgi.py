@@ -0,0 +1,288 @@
+"""
+Stack-In-A-Box: WSGI Application
+"""
+import logging
+import urllib.parse
+from wsgiref.util import is_hop_by_hop
+
+from stackinabox.server.core import (
+    BODILESS_STATUS_CODES,
+    get_reason_for_status
+)
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    get_body_bytes,
+    get_body_length,
+    iterate_body
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# characters left as they are when quoting the path of a request
+PATH_SAFE_CHARACTERS = "/;=,:@!$&'()*+~"
+
+
+class WSGIRequest(object):
+    """Request received through WSGI.
+
+    Provides the request to the StackInABoxService handlers. The body is
+    only read from the input of the server as the service reads it, either
+    in chunks through the BodyReader `body_reader` or all at once through
+    `body`.
+    """
+
+    def __init__(self, method, url, path, headers, body, environ):
+        """Initialize the request.
+
+        :param method: HTTP verb
+        :param url: full URL of the request including the query string
+        :param path: path and query string of the URL
+        :param headers: case-insensitive request headers
+        :param body: bytes of the request body, or a BodyReader reading it
+                     from the input of the server
+        :param environ: WSGI environment of the request
+        """
+        self.method = method
+        self.url = url
+        self.path = path
+        self.headers = headers
+        self.environ = environ
+        if isinstance(body, BodyReader):
+            self.__body = None
+            self.body_reader = body
+        else:
+            self.__body = body
+            self.body_reader = BodyReader(body)
+
+    @property
+    def body(self):
+        """bytes of the request body, whatever is left of it once
+        `body_reader` has been read from
+        """
+        if self.__body is None:
+            self.__body = self.body_reader.read()
+        return self.__body
+
+    @body.setter
+    def body(self, value):
+        self.__body = value
+
+
+def get_path(environ):
+    """Get the path and query string of a request.
+
+    :param environ: WSGI environment of the request
+
+    :returns: string - the quoted path and the query string, if any
+    """
+    path = urllib.parse.quote(
+        (environ.get('SCRIPT_NAME', '') +
+         environ.get('PATH_INFO', '')).encode('latin-1'),
+        safe=PATH_SAFE_CHARACTERS
+    ) or '/'
+    query = environ.get('QUERY_STRING')
+    if query:
+        path = '{0}?{1}'.format(path, query)
+    return path
+
+
+def get_headers(environ):
+    """Get the headers of a request.
+
+    :param environ: WSGI environment of the request
+
+    :returns: CaseInsensitiveDict of the request headers
+    """
+    headers = CaseInsensitiveDict()
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            headers[key[5:].replace('_', '-').title()] = value
+        elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+            headers[key.replace('_', '-').title()] = value
+    return headers
+
+
+def get_body_reader(environ):
+    """Get a reader of the body of a request.
+
+    :param environ: WSGI environment of the request
+
+    :returns: BodyReader of the request body, reading no further than the
+              Content-Length from the input of the server
+    """
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+
+    if length > 0:
+        return BodyReader(environ['wsgi.input'], length)
+
+    # servers that decode chunked bodies mark the end of the input
+    if environ.get('wsgi.input_terminated'):
+        return BodyReader(environ['wsgi.input'])
+
+    return BodyReader(b'')
+
+
+def get_body(environ):
+    """Read the body of a request.
+
+    :param environ: WSGI environment of the request
+
+    :returns: bytes of the request body
+    """
+    return get_body_reader(environ).read()
+
+
+def iterate_body_bytes(body, chunk_size):
+    """Iterate over the chunks of a streamed response body as bytes.
+
+    WSGI servers only accept bytes, other bytes-like chunks are copied. The
+    body is closed once it has been iterated over, or when the WSGI server
+    closes the iterator.
+
+    :param body: file-like object or iterable of bytes or strings
+    :param chunk_size: size of the chunks read from file-like objects
+
+    :returns: iterator of bytes
+    """
+    chunks = iterate_body(body, chunk_size)
+    try:
+        for chunk in chunks:
+            yield bytes(chunk)
+    finally:
+        chunks.close()
+
+
+class WSGIApplication(object):
+    """WSGI application handing all of its requests to Stack-In-A-Box.
+
+    The application may be hosted by any WSGI server, or called directly
+    by WSGI test clients without any network:
+
+        StackInABox.register_service(HelloService())
+        app = WSGIApplication()
+        server = wsgiref.simple_server.make_server('127.0.0.1', 0, app)
+
+    Requests are handed to the StackInABox instance of the thread that
+    created the application, whichever thread of the server calls it.
+    Services see a WSGIRequest.
+
+    Response bodies that are iterators or file-like objects are passed on
+    to the server chunk by chunk instead of being joined in memory; file
+    bodies use the `wsgi.file_wrapper` of the server if it provides one.
+    """
+
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, instance=None):
+        """Initialize the application.
+
+        :param instance: StackInABox instance handling the requests,
+                         defaults to the instance of the calling thread
+        """
+        self.instance = (
+            instance if instance is not None
+            else StackInABox.get_thread_instance()
+        )
+
+    def get_request(self, environ):
+        """Translate a WSGI environment into a request.
+
+        :param environ: WSGI environment of the request
+
+        :returns: WSGIRequest object
+        """
+        path = get_path(environ)
+        return WSGIRequest(
+            environ['REQUEST_METHOD'],
+            'http://{0}{1}'.format(self.instance.base_url, path),
+            path,
+            get_headers(environ),
+            get_body_reader(environ),
+            environ
+        )
+
+    def get_response_body(self, environ, method, status_code, body,
+                          headers):
+        """Get the iterable of a response body as WSGI expects it.
+
+        :param environ: WSGI environment of the request
+        :param method: HTTP verb of the request
+        :param status_code: HTTP status code of the response
+        :param body: response body returned by a service
+        :param headers: list of the response headers, a Content-Length is
+                        added for bodies whose length is known unless the
+                        status never has a body
+
+        :returns: iterable of bytes
+        """
+        bodiless = status_code in BODILESS_STATUS_CODES
+        length = get_body_length(body)
+        if length is not None and not bodiless and not any(
+            key.lower() == 'content-length' for key, _ in headers
+        ):
+            headers.append(('Content-Length', str(length)))
+
+        content = get_body_bytes(body)
+        if content is not None:
+            if method == 'HEAD' or bodiless or not content:
+                return []
+            return [bytes(content)]
+
+        if method == 'HEAD' or bodiless:
+            close = getattr(body, 'close', None)
+            if close is not None:
+                close()
+            return []
+
+        if hasattr(body, 'read') and 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](body, self.CHUNK_SIZE)
+
+        return iterate_body_bytes(body, self.CHUNK_SIZE)
+
+    def __call__(self, environ, start_response):
+        """Handle a request.
+
+        :param environ: WSGI environment of the request
+        :param start_response: WSGI start_response callable
+
+        :returns: iterable of the response body
+        """
+        request = self.get_request(environ)
+        if trace.ENABLED:
+            trace.debug(logger, 'WSGI: %s - %s', request.method, request.url)
+
+        # the handlers of the services use the instance of the application,
+        # without rebinding the thread of a server calling in-process
+        with StackInABox.use_instance(self.instance):
+            status_code, output_headers, body = self.instance.call(
+                request.method,
+                request,
+                request.url,
+                CaseInsensitiveDict()
+            )
+
+        # WSGI leaves the connection management to the server
+        headers = [
+            (str(key), str(value))
+            for key, value in output_headers.items()
+            if not is_hop_by_hop(key)
+        ]
+        response_body = self.get_response_body(environ,
+                                               request.method,
+                                               status_code,
+                                               body,
+                                               headers)
+        start_response(
+            '{0} {1}'.format(status_code,
+                             get_reason_for_status(status_code)),
+            headers
+        )
+        return response_body
@@ -21,3 +21,7 @@ class RouteAlreadyRegisteredError(StackInABoxServiceErrors):
 
 class InvalidRouteRegexError(StackInABoxServiceErrors):
     """Exception: Regex for URI is invalid."""
+
+
+class InvalidRouteTemplateError(StackInABoxServiceErrors):
+    """Exception: URI Template for the route is invalid."""
@@ -1,11 +1,490 @@
 import logging
+import re
 
 from stackinabox.services import exceptions
+from stackinabox.util import awaitables
+from stackinabox.util import trace
 
 
 logger = logging.getLogger(__name__)
 
 
+class StackInABoxRouteConverter(object):
+    """Stack-In-A-Box Route Converter object.
+
+    Converts the value of a URI Template parameter, f.e `{id:int}`, from
+    its text in the URI.
+    """
+
+    def __init__(self, regex, to_python=str):
+        """Initialize the converter.
+
+        :param regex: regex the text of the parameter must fully match
+        :param to_python: callable converting the text to the value passed
+                          to the handler
+        """
+        self.regex = re.compile(regex)
+        self.to_python = to_python
+
+    def __call__(self, text):
+        """Convert the text of a parameter.
+
+        :param text: text of the parameter from the URI
+
+        :returns: the converted value
+        :raises: ValueError if the text is not valid for the converter
+        """
+        if self.regex.fullmatch(text) is None:
+            raise ValueError(
+                'Invalid value {0} for {1}'.format(text, self.regex.pattern)
+            )
+
+        return self.to_python(text)
+
+
+class StackInABoxRouteTreeNode(object):
+    """Stack-In-A-Box Route Tree Node object.
+
+    A node for a single URI path segment of the route tree.
+    """
+
+    def __init__(self):
+        """Initialize the node."""
+        # route handling the URI path ending at this node
+        self.handlers = None
+        # children for static text segments
+        self.static = {}
+        # children for parameter segments in registration order,
+        # list of (name, converter name, node)
+        self.parameters = []
+        # route handling the remainder of the URI path,
+        # tuple of (name, handlers)
+        self.path = None
+
+    def get_parameter(self, name, converter_name):
+        """Get the child node for a parameter segment, creating as needed.
+
+        :param name: name of the parameter
+        :param converter_name: name of the parameter's converter
+
+        :returns: StackInABoxRouteTreeNode instance
+        """
+        for parameter_name, parameter_converter, node in self.parameters:
+            if (parameter_name, parameter_converter) == (
+                name, converter_name
+            ):
+                return node
+
+        node = StackInABoxRouteTreeNode()
+        self.parameters.append((name, converter_name, node))
+        return node
+
+
+class StackInABoxRouteTree(object):
+    """Stack-In-A-Box Route Tree object.
+
+    Prefix tree of URI Templates keyed by the URI path segments, such as:
+
+        /containers/{container}/objects/{obj:path}
+        /users/{id:int}
+
+    Each parameter spans a full path segment and may specify a converter.
+    `str` (the default) matches a single non-empty segment, `int` matches
+    a segment of digits and converts it to an integer, and `path` matches
+    the non-empty remainder of the URI path including any `/` and must be
+    the last segment of the template.
+
+    Parameters may not be named `self`, `method`, `request`, `uri`, or
+    `headers`, as they are passed to the handler as keyword arguments
+    alongside those.
+
+    Matching a URI path walks the tree segment by segment, preferring
+    static segments over parameters over `path` parameters, and returns the
+    converted parameters for the handler.
+    """
+
+    TEMPLATE_PARAMETER = re.compile(
+        r'\{(?P<name>[A-Za-z_]\w*)(?::(?P<converter>\w+))?\}'
+    )
+
+    PATH_CONVERTER = 'path'
+
+    # names of the arguments the router and the method handlers already
+    # take, which the keyword arguments of the parameters would collide with
+    RESERVED_PARAMETERS = frozenset(
+        ['self', 'method', 'request', 'uri', 'headers']
+    )
+
+    CONVERTERS = {
+        'str': StackInABoxRouteConverter(r'[^/]+'),
+        'int': StackInABoxRouteConverter(r'\d+', int),
+        PATH_CONVERTER: StackInABoxRouteConverter(r'.+'),
+    }
+
+    def __init__(self):
+        """Initialize an empty route tree."""
+        self.root = StackInABoxRouteTreeNode()
+
+    @classmethod
+    def is_template(cls, uri):
+        """Is the URI a URI Template?
+
+        :param uri: URI of the route
+
+        :returns: boolean
+        """
+        return (
+            isinstance(uri, str) and
+            cls.TEMPLATE_PARAMETER.search(uri) is not None
+        )
+
+    @classmethod
+    def parse_template(cls, template):
+        """Split a URI Template into its path segments.
+
+        :param template: URI Template string
+
+        :returns: list of path segments, each either a string of static
+                  text or a tuple of (parameter name, converter name)
+        :raises: InvalidRouteTemplateError if the template is not valid
+        """
+        segments = []
+        names = set()
+        for segment in template.split('/'):
+            parameter = cls.TEMPLATE_PARAMETER.fullmatch(segment)
+            if parameter is None:
+                if cls.TEMPLATE_PARAMETER.search(segment) is not None:
+                    raise exceptions.InvalidRouteTemplateError(
+                        'Parameter must span the full segment: {0}'
+                        .format(segment)
+                    )
+                segments.append(segment)
+                continue
+
+            name = parameter.group('name')
+            converter_name = parameter.group('converter') or 'str'
+            if converter_name not in cls.CONVERTERS:
+                raise exceptions.InvalidRouteTemplateError(
+                    'Unknown converter {0} for parameter {1}'
+                    .format(converter_name, name)
+                )
+            if name in cls.RESERVED_PARAMETERS:
+                raise exceptions.InvalidRouteTemplateError(
+                    'Parameter name {0} is reserved for the arguments of '
+                    'the handler, use another name'.format(name)
+                )
+            if name in names:
+                raise exceptions.InvalidRouteTemplateError(
+                    'Duplicate parameter {0}'.format(name)
+                )
+            names.add(name)
+            segments.append((name, converter_name))
+
+        for segment in segments[:-1]:
+            if (
+                isinstance(segment, tuple) and
+                segment[1] == cls.PATH_CONVERTER
+            ):
+                raise exceptions.InvalidRouteTemplateError(
+                    'Path parameter {0} must be the last segment'
+                    .format(segment[0])
+                )
+
+        return segments
+
+    @classmethod
+    def get_template_regex(cls, template):
+        """Get the regex equivalent to the URI Template.
+
+        :param template: URI Template string
+
+        :returns: string containing the regex pattern
+        """
+        parts = []
+        for segment in cls.parse_template(template):
+            if isinstance(segment, tuple):
+                name, converter_name = segment
+                parts.append('(?P<{0}>{1})'.format(
+                    name, cls.CONVERTERS[converter_name].regex.pattern
+                ))
+            else:
+                parts.append(re.escape(segment))
+        return '^{0}$'.format('/'.join(parts))
+
+    def add(self, template, handlers):
+        """Add a route for the URI Template.
+
+        :param template: URI Template string
+        :param handlers: router object for the route
+        :returns: n/a
+
+        .. note:: If the template is already in the tree then the first
+                  added router is kept.
+        """
+        segments = self.parse_template(template)
+        node = self.root
+        for segment in segments[:-1]:
+            if isinstance(segment, tuple):
+                node = node.get_parameter(*segment)
+            else:
+                node = node.static.setdefault(
+                    segment, StackInABoxRouteTreeNode()
+                )
+
+        last_segment = segments[-1]
+        if isinstance(last_segment, tuple):
+            name, converter_name = last_segment
+            if converter_name == self.PATH_CONVERTER:
+                if node.path is None:
+                    node.path = (name, handlers)
+                return
+            node = node.get_parameter(name, converter_name)
+        else:
+            node = node.static.setdefault(
+                last_segment, StackInABoxRouteTreeNode()
+            )
+
+        if node.handlers is None:
+            node.handlers = handlers
+
+    def match(self, uri_path):
+        """Find the router and parameters for the URI path.
+
+        :param uri_path: URI path, without any query string, to match
+
+        :returns: tuple of (router, dict of converted parameters) if a route
+                  matches, otherwise None
+        """
+        return self.match_node(self.root, uri_path.split('/'), 0, {})
+
+    def match_node(self, node, segments, index, parameters):
+        """Match the remaining URI path segments against a node.
+
+        :param node: StackInABoxRouteTreeNode to match from
+        :param segments: list of the URI path segments
+        :param index: index of the first unmatched segment
+        :param parameters: dict of parameters matched so far
+
+        :returns: tuple of (router, dict of converted parameters) if a route
+                  matches, otherwise None
+        """
+        if index == len(segments):
+            if node.handlers is not None:
+                return (node.handlers, parameters)
+            return None
+
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            result = self.match_node(child, segments, index + 1, parameters)
+            if result is not None:
+                return result
+
+        for name, converter_name, child in node.parameters:
+            try:
+                value = self.CONVERTERS[converter_name](segment)
+            except ValueError:
+                continue
+
+            result = self.match_node(
+                child,
+                segments,
+                index + 1,
+                dict(parameters, **{name: value})
+            )
+            if result is not None:
+                return result
+
+        if node.path is not None:
+            name, handlers = node.path
+            remainder = '/'.join(segments[index:])
+            try:
+                value = self.CONVERTERS[self.PATH_CONVERTER](remainder)
+            except ValueError:
+                return None
+            return (handlers, dict(parameters, **{name: value}))
+
+        return None
+
+
+class StackInABoxRouteMatcher(object):
+    """Stack-In-A-Box Route Matcher object.
+
+    Combines the regexes of a StackInABoxService route table into as few
+    compiled regexes as possible. Each route's regex is wrapped in a named
+    group of an alternation so that a single match operation covers many
+    routes and the name of the matching group maps back to the route's
+    StackInABoxServiceRouter.
+
+    Routes registered as plain strings without any regex syntax, f.e
+    `/v1/tokens`, only ever match that exact URI path. They are kept in a
+    dictionary that is checked before anything else.
+
+    Routes registered as URI Templates, f.e `/users/{id:int}`, are kept in
+    a StackInABoxRouteTree that is checked next.
+
+    Otherwise routes are tried in the order of the route table so the first
+    registered route that matches wins.
+    """
+
+    GROUP_PREFIX = 'stackinabox_route_'
+
+    # characters that give a string route regex semantics
+    REGEX_CHARACTERS = frozenset('.^$*+?{}[]\\|()')
+
+    # regexes using backreferences, conditional groups, or global inline
+    # flags cannot safely be embedded in a larger regex
+    UNSAFE_PATTERN = re.compile(r'\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)')
+
+    DEFAULT_FLAGS = re.compile('').flags
+
+    def __init__(self, routes):
+        """Initialize the matcher.
+
+        :param routes: StackInABoxService route table to match against
+        """
+        self.routes = routes
+        self.literals = {}
+        self.tree = None
+        self.matchers = []
+
+        pending = []
+        for route in routes.values():
+            if self.is_literal(route):
+                self.literals.setdefault(route['uri'], route['handlers'])
+            elif self.is_template(route):
+                if self.tree is None:
+                    self.tree = StackInABoxRouteTree()
+                self.tree.add(route['uri'], route['handlers'])
+            elif self.is_combinable(route['regex']):
+                pending.append(route)
+            else:
+                self.add_combined(pending)
+                pending = []
+                self.matchers.append((route['regex'], route['handlers'], None))
+        self.add_combined(pending)
+
+    @classmethod
+    def is_literal(cls, route):
+        """Does the route only ever match its URI exactly?
+
+        :param route: route table entry
+
+        :returns: boolean
+        """
+        uri = route['uri']
+        if not isinstance(uri, str):
+            return False
+
+        if cls.REGEX_CHARACTERS.intersection(uri):
+            return False
+
+        # the regex must be the one generated for the URI
+        return route['regex'].pattern == '^{0}$'.format(uri)
+
+    @classmethod
+    def is_template(cls, route):
+        """Is the route for a URI Template?
+
+        :param route: route table entry
+
+        :returns: boolean
+        """
+        uri = route['uri']
+        if not StackInABoxRouteTree.is_template(uri):
+            return False
+
+        try:
+            regex = StackInABoxRouteTree.get_template_regex(uri)
+        except exceptions.InvalidRouteTemplateError:
+            return False
+
+        # the regex must be the one generated for the URI Template
+        return route['regex'].pattern == regex
+
+    @classmethod
+    def is_combinable(cls, regex):
+        """Can the regex be embedded into a combined regex?
+
+        :param regex: compiled Python regex object
+
+        :returns: boolean
+        """
+        if not isinstance(regex.pattern, str):
+            return False
+
+        if regex.flags != cls.DEFAULT_FLAGS:
+            return False
+
+        for group_name in regex.groupindex:
+            if group_name.startswith(cls.GROUP_PREFIX):
+                return False
+
+        return cls.UNSAFE_PATTERN.search(regex.pattern) is None
+
+    def add_combined(self, routes):
+        """Combine the routes into a single regex and add it to the matchers.
+
+        :param routes: list of route table entries to combine
+        :returns: n/a
+        """
+        if not routes:
+            return
+
+        group_routers = {}
+        patterns = []
+        for route in routes:
+            group_name = '{0}{1}'.format(self.GROUP_PREFIX, len(group_routers))
+            group_routers[group_name] = route['handlers']
+            patterns.append(
+                '(?P<{0}>{1})'.format(group_name, route['regex'].pattern)
+            )
+
+        try:
+            regex = re.compile('|'.join(patterns))
+
+        except re.error:
+            # f.e duplicate group names between routes; fallback to
+            # matching each of the routes by itself
+            logger.debug(
+                'Route Matcher ({0}): Unable to combine {1} routes'
+                .format(id(self), len(routes))
+            )
+            for route in routes:
+                self.matchers.append(
+                    (route['regex'], route['handlers'], None)
+                )
+
+        else:
+            self.matchers.append((regex, None, group_routers))
+
+    def match(self, uri_path):
+        """Find the router for the URI path.
+
+        :param uri_path: URI path, without any query string, to match
+
+        :returns: tuple of (router, dict of URI Template parameters) if a
+                  route matches, otherwise None
+        """
+        handlers = self.literals.get(uri_path)
+        if handlers is not None:
+            return (handlers, {})
+
+        if self.tree is not None:
+            result = self.tree.match(uri_path)
+            if result is not None:
+                return result
+
+        for regex, handlers, group_routers in self.matchers:
+            result = regex.match(uri_path)
+            if result is not None:
+                if group_routers is None:
+                    return (handlers, {})
+                return (group_routers[result.lastgroup], {})
+
+        return None
+
+
 class StackInABoxServiceRouter(object):
     """Stack-In-A-Box Service Router object.
 
@@ -109,7 +588,11 @@ class StackInABoxServiceRouter(object):
                     )
                 )
             )
-            self.methods[method] = fn
+            # replace rather than modify the methods so requests being
+            # handled at the same time see either the old or new methods
+            methods = dict(self.methods)
+            methods[method] = fn
+            self.methods = methods
 
         else:
             raise exceptions.RouteAlreadyRegisteredError(
@@ -123,50 +606,62 @@ class StackInABoxServiceRouter(object):
                 )
             )
 
-    def __call__(self, method, request, uri, headers):
+    def __call__(self, method, request, uri, headers, **parameters):
         """Python callable interface.
 
         :param method: HTTP verb
         :param request: Request object
         :param uri: URI of the request
         :param headers: response headers for the request
+        :param parameters: converted URI Template parameters passed as
+                           keyword arguments to the method handler
 
         :returns: tuple - (int, dict, string) containing:
                           int - the http response status code
                           dict - the headers for the http response
                           string - http string response
+
+        .. note:: Method handlers returning an awaitable are run to
+                  completion on an event loop, see call_async() for
+                  awaiting them instead.
         """
 
         # Check the registered methods, preferring a function to sub-service
         if method in self.methods:
-            logger.debug(
-                'Service Router ({0} - {1}): Located Method {2} on Route '
-                '{3}. Calling...'.format(
+            if trace.ENABLED:
+                trace.debug(
+                    logger,
+                    'Service Router (%s - %s): Located Method %s on Route '
+                    '%s. Calling...',
                     id(self),
                     self.service_name,
                     method,
                     self.uri
                 )
-            )
 
-            return self.methods[method](
+            result = self.methods[method](
                 self.parent_obj,
                 request,
                 uri,
-                headers
+                headers,
+                **parameters
             )
+            if type(result) is tuple:
+                return result
+            return awaitables.resolve(result)
 
         # If no method, is there a sub-service that handles it?
         elif self.obj is not None:
-            logger.debug(
-                'Service Router ({0} - {1}): Located Subservice {2} on Route '
-                '{3}. Calling...'.format(
+            if trace.ENABLED:
+                trace.debug(
+                    logger,
+                    'Service Router (%s - %s): Located Subservice %s on Route '
+                    '%s. Calling...',
                     id(self),
                     self.service_name,
                     self.obj.name,
                     self.uri
                 )
-            )
 
             return self.obj.sub_request(
                 method,
@@ -177,18 +672,94 @@ class StackInABoxServiceRouter(object):
 
         # otherwise, return an HTTP 405 error
         else:
-            logger.debug(
-                'Service Router ({0} - {1}): No Method handler for service'
-                .format(
+            return self.method_not_allowed(method, headers)
+
+    async def call_async(self, method, request, uri, headers, **parameters):
+        """Asynchronous counterpart of the Python callable interface.
+
+        Method handlers may be `async def` functions, or otherwise return
+        an awaitable, which is awaited.
+
+        :param method: HTTP verb
+        :param request: Request object
+        :param uri: URI of the request
+        :param headers: response headers for the request
+        :param parameters: converted URI Template parameters passed as
+                           keyword arguments to the method handler
+
+        :returns: tuple - (int, dict, string) containing:
+                          int - the http response status code
+                          dict - the headers for the http response
+                          string - http string response
+        """
+
+        # Check the registered methods, preferring a function to sub-service
+        if method in self.methods:
+            if trace.ENABLED:
+                trace.debug(
+                    logger,
+                    'Service Router (%s - %s): Located Method %s on Route '
+                    '%s. Awaiting...',
                     id(self),
-                    self.service_name
+                    self.service_name,
+                    method,
+                    self.uri
+                )
+
+            return await awaitables.resolve_async(
+                self.methods[method](
+                    self.parent_obj,
+                    request,
+                    uri,
+                    headers,
+                    **parameters
                 )
             )
 
-            return (
-                405,
-                headers,
-                '{0} not supported. Supported Methods are {1}'.format(
-                    method, self.methods
+        # If no method, is there a sub-service that handles it?
+        elif self.obj is not None:
+            if trace.ENABLED:
+                trace.debug(
+                    logger,
+                    'Service Router (%s - %s): Located Subservice %s on Route '
+                    '%s. Awaiting...',
+                    id(self),
+                    self.service_name,
+                    self.obj.name,
+                    self.uri
                 )
+
+            return await self.obj.sub_request_async(
+                method,
+                request,
+                uri,
+                headers
+            )
+
+        # otherwise, return an HTTP 405 error
+        else:
+            return self.method_not_allowed(method, headers)
+
+    def method_not_allowed(self, method, headers):
+        """Build the response for a method without a handler.
+
+        :param method: HTTP verb
+        :param headers: response headers for the request
+
+        :returns: tuple - (int, dict, string) for an HTTP 405 response
+        """
+        if trace.ENABLED:
+            trace.debug(
+                logger,
+                'Service Router (%s - %s): No Method handler for service',
+                id(self),
+                self.service_name
+            )
+
+        return (
+            405,
+            headers,
+            '{0} not supported. Supported Methods are {1}'.format(
+                method, self.methods
             )
+        )
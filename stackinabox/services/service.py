@@ -3,12 +3,20 @@ Stack-In-A-Box: Service Interface
 """
 import logging
 import re
+import threading
 import uuid
 
 import six
 
 from stackinabox.services import exceptions
 from stackinabox.services import router
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    Compression,
+    ConditionalRequests,
+    LRUCache,
+    get_range_response
+)
 
 
 logger = logging.getLogger(__name__)
@@ -47,7 +55,12 @@ class StackInABoxService(object):
         """
         self.__base_url = '/{0}'.format(name)
         self.__id = uuid.uuid4()
+        self.__lock = threading.RLock()
         self.name = name
+        self.route_cache = None
+        self.range_requests = False
+        self.conditional_requests = None
+        self.compression = None
         self.routes = {
         }
         logger.debug('StackInABoxService ({0}): Hosting Service {1}'
@@ -114,12 +127,201 @@ class StackInABoxService(object):
             StackInABoxService.validate_regex(service_url, sub_service)
 
             return service_url
+
+        elif router.StackInABoxRouteTree.is_template(service_url):
+            regex = router.StackInABoxRouteTree.get_template_regex(
+                service_url
+            )
+            logger.debug('StackInABoxService: {0} + {1} -> {2}'
+                         .format(base_url, service_url, regex))
+            return re.compile(regex)
+
         else:
             regex = '^{0}{1}$'.format('', service_url)
             logger.debug('StackInABoxService: {0} + {1} -> {2}'
                          .format(base_url, service_url, regex))
             return re.compile(regex)
 
+    @property
+    def routes(self):
+        """Route table of the service."""
+        return self.__routes
+
+    @routes.setter
+    def routes(self, value):
+        """Replace the route table of the service.
+
+        The route table is never modified in place. Changes build a new
+        route table which then replaces the old one so that requests being
+        handled at the same time always see a complete route table.
+
+        :param value: the new route table
+        """
+        self.__routes = value
+        self.invalidate_routes()
+
+    @property
+    def route_matcher(self):
+        """Combined route matcher for the route table.
+
+        The matcher is rebuilt the first time it is needed after the route
+        table changed.
+        """
+        routes = self.__routes
+        matcher = self.__route_matcher
+        if matcher is None or matcher.routes is not routes:
+            logger.debug('StackInABoxService ({0}:{1}): Building route '
+                         'matcher for {2} routes'
+                         .format(self.__id, self.name, len(routes)))
+            matcher = router.StackInABoxRouteMatcher(routes)
+            self.__route_matcher = matcher
+        return matcher
+
+    def invalidate_routes(self):
+        """Discard the route matcher and any cached route lookups.
+
+        This is done automatically when routes, sub-services, or the Base
+        URL change, and also drops the validators of conditional requests.
+        Registering further methods or a sub-service on an
+        existing route does not change the route's router, so the route
+        matcher and cache stay valid.
+        """
+        self.__route_matcher = None
+        if self.route_cache is not None:
+            self.route_cache.clear()
+        if self.conditional_requests is not None:
+            self.conditional_requests.clear()
+
+    def enable_route_cache(self, maxsize=128):
+        """Cache the routes found for URI paths.
+
+        Services polled on the same URI paths over and over again can use
+        the cache to skip matching the routes for each request.
+
+        :param maxsize: maximum number of URI paths to cache, the least
+                        recently used URI path is evicted first
+
+        :returns: LRUCache instance keeping the hit and miss counts
+        """
+        self.route_cache = LRUCache(maxsize)
+        return self.route_cache
+
+    def disable_route_cache(self):
+        """Stop caching the routes found for URI paths."""
+        self.route_cache = None
+
+    def enable_range_requests(self):
+        """Answer Range requests with the requested byte ranges.
+
+        Successful GET responses whose length is known before they are
+        sent, such as bytes, strings, memoryviews, mmaps, regular files, or
+        a FileResponse, are answered in part with 206 Partial Content or
+        416 Range Not Satisfiable, several ranges as multipart/byteranges.
+        The ranges are slices of the body instead of copies, so the handlers
+        simply return the whole body.
+        """
+        self.range_requests = True
+
+    def disable_range_requests(self):
+        """Stop answering Range requests, always sending the whole body."""
+        self.range_requests = False
+
+    def enable_conditional_requests(self, maxsize=128):
+        """Answer conditional requests with 304 Not Modified.
+
+        Successful GET responses get a strong ETag computed from the body
+        unless the handler set one. GET and HEAD requests whose
+        If-None-Match or If-Modified-Since match the validators of the last
+        response for the URI are answered without calling the handler.
+        Requests with any other method but OPTIONS and TRACE drop the
+        validators as they may change the resources of the service.
+
+        :param maxsize: maximum number of ETags and of URIs to cache
+                        validators for
+
+        :returns: ConditionalRequests instance keeping the caches, call its
+                  clear() if the responses change without a request
+        """
+        self.conditional_requests = ConditionalRequests(maxsize)
+        return self.conditional_requests
+
+    def disable_conditional_requests(self):
+        """Stop answering conditional requests with 304 Not Modified."""
+        self.conditional_requests = None
+
+    def enable_compression(self, maxsize=128, min_size=256, level=6):
+        """Compress responses with the content coding the client accepts.
+
+        Responses held in memory of at least min_size bytes are encoded
+        with brotli (if installed), gzip, or deflate as negotiated with the
+        Accept-Encoding of the request, after the conditional and range
+        request handling. Streamed bodies, partial responses, and content
+        types that are already compressed are sent as they are.
+
+        :param maxsize: maximum number of compressed bodies to cache
+        :param min_size: minimum size in bytes of the bodies to compress
+        :param level: compression level from 1 (fastest) to 9 (smallest)
+
+        :returns: Compression instance keeping the cache of compressed
+                  bodies
+        """
+        self.compression = Compression(maxsize, min_size, level)
+        return self.compression
+
+    def disable_compression(self):
+        """Stop compressing responses."""
+        self.compression = None
+
+    def finish_response(self, method, request, uri, result):
+        """Apply the conditional and range request handling and the
+        compression to a response.
+
+        :param method: string - HTTP Verb
+        :param request: request object describing the HTTP request
+        :param uri: URI of the reuqest
+        :param result: tuple - (int, dict, body) returned by the handler
+
+        :returns: tuple - (int, dict, body) of the response
+        """
+        request_headers = getattr(request, 'headers', None)
+        if self.conditional_requests is not None:
+            result = self.conditional_requests.update(method,
+                                                      request_headers,
+                                                      uri,
+                                                      result,
+                                                      self.compression)
+        if self.range_requests:
+            result = get_range_response(method, request_headers, result)
+        if self.compression is not None:
+            result = self.compression.update(request_headers, result)
+        return result
+
+    def match_route(self, uri_path):
+        """Find the router for a URI path.
+
+        :param uri_path: string - URI path without any query string
+
+        :returns: tuple of (router, dict of URI Template parameters) for the
+                  route matching the URI path, otherwise None
+        """
+        matcher = self.route_matcher
+        route_cache = self.route_cache
+        if route_cache is None:
+            return matcher.match(uri_path)
+
+        # routes are cached under the matcher that found them, so a route
+        # cached by a request still using a matcher that has since been
+        # replaced is never found, and counts as a miss, until evicted
+        key = (matcher, uri_path)
+        cached = route_cache.get(key)
+        if cached is not None:
+            return cached[0]
+
+        # wrapped so that URI paths without a route are cached as well
+        route = matcher.match(uri_path)
+        route_cache.put(key, (route,))
+        return route
+
     @property
     def base_url(self):
         """Base URI utilized for anything managed by this instance."""
@@ -137,12 +339,19 @@ class StackInABoxService(object):
                              self.name,
                              self.__base_url,
                              value))
-        self.__base_url = value
-        for k, v in six.iteritems(self.routes):
-            v['regex'] = StackInABoxService.get_service_regex(
-                value,
-                v['uri'],
-                v['handlers'].is_subservice)
+        with self.__lock:
+            self.__base_url = value
+            self.routes = {
+                k: dict(
+                    v,
+                    regex=StackInABoxService.get_service_regex(
+                        value,
+                        v['uri'],
+                        v['handlers'].is_subservice
+                    )
+                )
+                for k, v in six.iteritems(self.routes)
+            }
 
     def reset(self):
         """Reset the service to its' initial state."""
@@ -152,6 +361,29 @@ class StackInABoxService(object):
         logger.debug('StackInABoxService ({0}): Hosting Service {1}'
                      .format(self.__id, self.name))
 
+    def get_route_path(self, route_uri, uri):
+        """Get the URI path used to match the routes for a request.
+
+        :param route_uri: string - URI of the request
+        :param uri: URI of the reuqest
+
+        :returns: string - the routing URI without any query string
+        """
+        uri_path = route_uri
+        if '?' in uri:
+            if trace.ENABLED:
+                trace.debug(logger,
+                            'StackInABoxService (%s:%s): Found query string '
+                            'removing for match operation.',
+                            self.__id, self.name)
+            uri_path, uri_qs = uri.split('?')
+            if trace.ENABLED:
+                trace.debug(logger,
+                            'StackInABoxService (%s:%s): uri =  "%s", '
+                            'query = "%s"',
+                            self.__id, self.name, uri_path, uri_qs)
+        return uri_path
+
     def try_handle_route(self, route_uri, method, request, uri, headers):
         """Try to handle the supplied request on the specified routing URI.
 
@@ -166,34 +398,51 @@ class StackInABoxService(object):
                           dict - the headers for the http response
                           string - http string response
         """
-        uri_path = route_uri
-        if '?' in uri:
-            logger.debug('StackInABoxService ({0}:{1}): Found query string '
-                         'removing for match operation.'
-                         .format(self.__id, self.name))
-            uri_path, uri_qs = uri.split('?')
-            logger.debug('StackInABoxService ({0}:{1}): uri =  "{2}", '
-                         'query = "{3}"'
-                         .format(self.__id, self.name, uri_path, uri_qs))
-
-        for k, v in six.iteritems(self.routes):
-            logger.debug('StackInABoxService ({0}:{1}): Checking if '
-                         'route {2} handles...'
-                         .format(self.__id, self.name, v['uri']))
-            logger.debug('StackInABoxService ({0}:{1}): ...using regex '
-                         'pattern {2} against {3}'
-                         .format(self.__id,
-                                 self.name,
-                                 v['regex'].pattern,
-                                 uri_path))
-            if v['regex'].match(uri_path):
-                logger.debug('StackInABoxService ({0}:{1}): Checking if '
-                             'route {2} handles method {2}...'
-                             .format(self.__id, self.name, v['uri'], method))
-                return v['handlers'](method,
-                                     request,
-                                     uri,
-                                     headers)
+        uri_path = self.get_route_path(route_uri, uri)
+        route = self.match_route(uri_path)
+        if route is not None:
+            route_handlers, parameters = route
+            if trace.ENABLED:
+                trace.debug(logger,
+                            'StackInABoxService (%s:%s): Checking if '
+                            'route for %s handles method %s...',
+                            self.__id, self.name, uri_path, method)
+            return route_handlers(method,
+                                  request,
+                                  uri,
+                                  headers,
+                                  **parameters)
+        return (595, headers, 'Route ({0}) Not Handled'.format(uri))
+
+    async def try_handle_route_async(self, route_uri, method, request, uri,
+                                     headers):
+        """Asynchronous counterpart of try_handle_route().
+
+        :param route_uri: string - URI of the request
+        :param method: string - HTTP Verb
+        :param request: request object describing the HTTP request
+        :param uri: URI of the reuqest
+        :param headers: case-insensitive headers dict
+
+        :returns: tuple - (int, dict, string) containing:
+                          int - the http response status code
+                          dict - the headers for the http response
+                          string - http string response
+        """
+        uri_path = self.get_route_path(route_uri, uri)
+        route = self.match_route(uri_path)
+        if route is not None:
+            route_handlers, parameters = route
+            if trace.ENABLED:
+                trace.debug(logger,
+                            'StackInABoxService (%s:%s): Checking if '
+                            'route for %s handles method %s...',
+                            self.__id, self.name, uri_path, method)
+            return await route_handlers.call_async(method,
+                                                   request,
+                                                   uri,
+                                                   headers,
+                                                   **parameters)
         return (595, headers, 'Route ({0}) Not Handled'.format(uri))
 
     def request(self, method, request, uri, headers):
@@ -209,9 +458,25 @@ class StackInABoxService(object):
                           dict - the headers for the http response
                           string - http string response
         """
-        logger.debug('StackInABoxService ({0}:{1}): Request Received {2} - {3}'
-                     .format(self.__id, self.name, method, uri))
-        return self.try_handle_route(uri, method, request, uri, headers)
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'StackInABoxService (%s:%s): Request Received %s - %s',
+                        self.__id, self.name, method, uri)
+        conditional_requests = self.conditional_requests
+        if conditional_requests is not None:
+            result = conditional_requests.check(
+                method, getattr(request, 'headers', None), uri, headers,
+                self.compression
+            )
+            if result is not None:
+                return result
+
+        return self.finish_response(
+            method,
+            request,
+            uri,
+            self.try_handle_route(uri, method, request, uri, headers)
+        )
 
     def sub_request(self, method, request, uri, headers):
         """Handle the supplied sub-service request on the specified routing URI
@@ -226,11 +491,71 @@ class StackInABoxService(object):
                           dict - the headers for the http response
                           string - http string response
         """
-        logger.debug('StackInABoxService ({0}:{1}): Sub-Request Received '
-                     '{2} - {3}'
-                     .format(self.__id, self.name, method, uri))
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'StackInABoxService (%s:%s): Sub-Request Received '
+                        '%s - %s',
+                        self.__id, self.name, method, uri)
         return self.request(method, request, uri, headers)
 
+    async def request_async(self, method, request, uri, headers):
+        """Asynchronous counterpart of request().
+
+        Handlers may be `async def` functions, or otherwise return an
+        awaitable, which is awaited.
+
+        :param method: string - HTTP Verb
+        :param request: request object describing the HTTP request
+        :param uri: URI of the reuqest
+        :param headers: case-insensitive headers dict
+
+        :returns: tuple - (int, dict, string) containing:
+                          int - the http response status code
+                          dict - the headers for the http response
+                          string - http string response
+        """
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'StackInABoxService (%s:%s): Async Request Received '
+                        '%s - %s',
+                        self.__id, self.name, method, uri)
+        conditional_requests = self.conditional_requests
+        if conditional_requests is not None:
+            result = conditional_requests.check(
+                method, getattr(request, 'headers', None), uri, headers,
+                self.compression
+            )
+            if result is not None:
+                return result
+
+        return self.finish_response(
+            method,
+            request,
+            uri,
+            await self.try_handle_route_async(uri, method, request, uri,
+                                              headers)
+        )
+
+    async def sub_request_async(self, method, request, uri, headers):
+        """Asynchronous counterpart of sub_request().
+
+        :param method: string - HTTP Verb
+        :param request: request object describing the HTTP request
+        :param uri: URI of the reuqest
+        :param headers: case-insensitive headers dict
+
+        :returns: tuple - (int, dict, string) containing:
+                          int - the http response status code
+                          dict - the headers for the http response
+                          string - http string response
+        """
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'StackInABoxService (%s:%s): Async Sub-Request '
+                        'Received %s - %s',
+                        self.__id, self.name, method, uri)
+        return await self.request_async(method, request, uri, headers)
+
     def create_route(self, uri, sub_service):
         """Create the route for the URI.
 
@@ -239,10 +564,32 @@ class StackInABoxService(object):
 
         :returns: n/a
         """
-        if uri not in self.routes.keys():
+        self.__get_route(uri, sub_service)
+
+    def __get_route(self, uri, sub_service, setup=None):
+        """Get the route for the URI, creating it if needed.
+
+        Note: this is an internal function
+
+        A new route is only added to the route table once the setup function
+        has configured its router so requests never see a route that is only
+        partially set up.
+
+        :param uri: string - URI to be routed
+        :param sub_service: boolean - is the URI for a sub-service
+        :param setup: optional function called with the route's router
+
+        :returns: n/a
+        """
+        with self.__lock:
+            if uri in self.routes.keys():
+                if setup is not None:
+                    setup(self.routes[uri]['handlers'])
+                return
+
             logger.debug('Service ({0}): Creating routes'
                          .format(self.name))
-            self.routes[uri] = {
+            route = {
                 'regex': StackInABoxService.get_service_regex(
                     self.base_url,
                     uri,
@@ -256,6 +603,12 @@ class StackInABoxService(object):
                     self
                 )
             }
+            if setup is not None:
+                setup(route['handlers'])
+
+            routes = dict(self.routes)
+            routes[uri] = route
+            self.routes = routes
 
     def register(self, method, uri, call_back):
         """Register a class instance function to handle a request.
@@ -266,11 +619,14 @@ class StackInABoxService(object):
 
         :returns: n/a
         """
-        found = False
-
-        self.create_route(uri, False)
-        self.routes[uri]['handlers'].register_method(method,
-                                                     call_back)
+        self.__get_route(
+            uri,
+            False,
+            lambda route_handlers: route_handlers.register_method(
+                method,
+                call_back
+            )
+        )
 
     def register_subservice(self, uri, service):
         """Register a class instance to handle a URI.
@@ -281,7 +637,8 @@ class StackInABoxService(object):
 
         :returns: n/a
         """
-        found = False
-
-        self.create_route(uri, True)
-        self.routes[uri]['handlers'].set_subservice(service)
+        self.__get_route(
+            uri,
+            True,
+            lambda route_handlers: route_handlers.set_subservice(service)
+        )
@@ -1,6 +1,8 @@
 """
 Stack-In-A-Box: Stack Management
 """
+import contextlib
+import contextvars
 import logging
 import re
 import threading
@@ -8,6 +10,9 @@ import uuid
 
 import six
 
+from stackinabox.util import trace
+from stackinabox.util.tools import HoldStore
+
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +29,41 @@ class StackInABox(object):
 
     The framework provides a thread-local instance holding the
     StackInABoxService objects that are representing the
-    RESTful APIs.
+    RESTful APIs. All asyncio tasks of a thread use the instance of
+    the thread, unless they isolate themselves:
+
+        async def scenario():
+            StackInABox.isolate()
+            StackInABox.register_service(...)
+
+    or the instance is bound to a block of code:
+
+        with StackInABox.use_instance(instance):
+            ...
+
+    Both are kept in a context variable, so they only apply to the
+    task or context that set them.
 
     The StackInABox object provides a means of accessing it
-    from anywhere in a thread; however, it is not necessarily
-    thread-safe at this time. If one is careful o setup StackInABox
-    and write StackInABoxService's that are thread-safe
-    themselves, then there is no reason it could not be used in a
-    multi-threaded or multi-processed test.
+    from anywhere in a thread. The service tables are never modified
+    in place; registering, resetting, or changing the Base URL builds
+    new tables under a lock and then replaces the old ones. Calls into
+    the instance do not lock and always see a complete set of tables,
+    so a single instance may serve many threads as long as the
+    StackInABoxService's are thread-safe themselves.
+
+    Threads that need to serve the same services, f.e the workers of a
+    ThreadPoolExecutor used by the code under test, can either share a
+    single instance between all threads:
+
+        StackInABox.enable_shared_instance()
+
+    or bind individual threads to an existing instance:
+
+        ThreadPoolExecutor(
+            initializer=StackInABox.bind_thread_instance,
+            initargs=(StackInABox.get_thread_instance(),)
+        )
 
     """
 
@@ -39,32 +71,125 @@ class StackInABox(object):
     def get_thread_instance(cls):
         """
         Interface to the thread storage to ensure the instance properly exists
-        """
-        create = False
 
-        # if the `instance` property doesn't exist
-        if not hasattr(local_store, 'instance'):
-            local_store.instance = None
-            create = True
+        An instance bound to the current context with isolate() or
+        use_instance() is used first. Otherwise, if an instance is shared
+        between all threads then that instance is used instead of the
+        thread's own instance.
+        """
+        instance = context_store.get()
+        if instance is not None and isinstance(instance, cls):
+            return instance
 
-        # if the instance doesn't exist at all
-        elif local_store.instance is None:
-            create = True
+        instance = shared_store.instance
+        if instance is not None and isinstance(instance, cls):
+            return instance
 
-        # if it's something else entirely...
-        elif not isinstance(local_store.instance, cls):
-            local_store.instance = None
-            create = True
+        instance = getattr(local_store, 'instance', None)
 
-        # if the above conditions are met, create it
-        if create:
+        # if the instance doesn't exist at all, or it's something else
+        # entirely, then create it
+        if instance is None or not isinstance(instance, cls):
             logger.debug('Creating new StackInABox instance...')
-            local_store.instance = cls()
+            instance = cls()
+            local_store.instance = instance
             logger.debug(
-                'Created StackInABox({0})'.format(local_store.instance.__id)
+                'Created StackInABox({0})'.format(instance.__id)
             )
 
-        return local_store.instance
+        return instance
+
+    @classmethod
+    def isolate(cls):
+        """Give the current context its own new StackInABox instance.
+
+        Calling this at the start of an asyncio task keeps the services and
+        holds of the task apart from those of any other task, including the
+        task that created it. Tasks created afterwards from within the task
+        inherit the new instance. The instance of the thread is left as it
+        is.
+
+        :returns: the new StackInABox instance
+        """
+        instance = cls()
+        context_store.set(instance)
+        logger.debug('Isolated StackInABox({0})'.format(instance.__id))
+        return instance
+
+    @classmethod
+    @contextlib.contextmanager
+    def use_instance(cls, instance):
+        """Use an existing StackInABox instance within a block of code.
+
+        The instance is bound to the current context only, and the previous
+        binding is restored when the block is left, so the instance of the
+        thread and of other asyncio tasks is left as it is:
+
+            with StackInABox.use_instance(instance):
+                StackInABox.call_into(...)
+
+        :param instance: StackInABox instance to use
+
+        :returns: context manager yielding the instance
+        """
+        token = context_store.set(instance)
+        try:
+            yield instance
+        finally:
+            context_store.reset(token)
+
+    @classmethod
+    def bind_thread_instance(cls, instance):
+        """Make the calling thread use an existing StackInABox instance.
+
+        This is suitable as the initializer of a thread pool so that its
+        worker threads use the instance of the thread creating the pool.
+
+        :param instance: StackInABox instance to use in the calling thread
+
+        :returns: n/a
+        """
+        logger.debug('Binding thread {0} to StackInABox instance'
+                     .format(threading.current_thread().name))
+        local_store.instance = instance
+
+    @classmethod
+    def enable_shared_instance(cls, instance=None):
+        """Share a single StackInABox instance between all threads.
+
+        While enabled every thread uses the shared instance instead of its
+        own thread-local instance, including threads started afterwards.
+        Instances bound with isolate() or use_instance() still take
+        precedence within their context.
+
+        :param instance: StackInABox instance to share, defaults to the
+                         instance of the calling thread so that services
+                         already registered remain available
+
+        :returns: the shared StackInABox instance
+        """
+        if instance is None:
+            instance = cls.get_thread_instance()
+
+        with shared_store.lock:
+            logger.debug('Sharing StackInABox({0}) between all threads'
+                         .format(instance.__id))
+            shared_store.instance = instance
+        return instance
+
+    @classmethod
+    def disable_shared_instance(cls):
+        """Stop sharing a StackInABox instance between all threads.
+
+        Each thread goes back to using its own thread-local instance.
+
+        :returns: the StackInABox instance that was shared, if any
+        """
+        with shared_store.lock:
+            instance = shared_store.instance
+            shared_store.instance = None
+        logger.debug('No longer sharing a StackInABox instance')
+        return instance
 
     @classmethod
     def reset_services(cls):
@@ -96,27 +221,50 @@ class StackInABox(object):
         For return value and errors see StackInABox.call()
 
         """
-        logger.debug('Request: {0} - {1}'.format(method, uri))
+        if trace.ENABLED:
+            trace.debug(logger, 'Request: %s - %s', method, uri)
         return cls.get_thread_instance().call(method,
                                          request,
                                          uri,
                                          headers)
 
     @classmethod
-    def hold_onto(cls, name, obj):
+    async def call_into_async(cls, method, request, uri, headers):
+        """Make an asynchronous call into the thread's StackInABox instance.
+
+        :param method: HTTP Method (e.g GET, POST)
+        :param request: a Request object containing the request data
+        :param uri: the URI of the request submitted with the method
+        :param headers: the return headers in a Case-Insensitive dict
+
+        For return value and errors see StackInABox.call_async()
+
+        """
+        if trace.ENABLED:
+            trace.debug(logger, 'Async Request: %s - %s', method, uri)
+        return await cls.get_thread_instance().call_async(method,
+                                                          request,
+                                                          uri,
+                                                          headers)
+
+    @classmethod
+    def hold_onto(cls, name, obj, pinned=False):
         """Add data into the a storage area provided by the framework.
 
         Note: The data is stored with the thread local instance.
 
         :param name: name of the data to be stored
         :param obj: data to be stored
+        :param pinned: keep the data regardless of the budgets of the
+                       storage, f.e for the registrations of the utilities
 
         For return value and errors see StackInABox.into_hold()
 
         """
-        logger.debug('Holding on {0} of type {1} with id {2}'
-                     .format(name, type(obj), id(obj)))
-        cls.get_thread_instance().into_hold(name, obj)
+        if trace.ENABLED:
+            trace.debug(logger, 'Holding on %s of type %s with id %s',
+                        name, type(obj), id(obj))
+        cls.get_thread_instance().into_hold(name, obj, pinned)
 
     @classmethod
     def hold_out(cls, name):
@@ -131,13 +279,29 @@ class StackInABox(object):
         For errors see StackInABox.from_hold()
 
         """
-        logger.debug('Retreiving {0} from hold'
-                     .format(name))
+        if trace.ENABLED:
+            trace.debug(logger, 'Retreiving %s from hold', name)
         obj = cls.get_thread_instance().from_hold(name)
-        logger.debug('Retrieved {0} of type {1} with id {2} from hold'
-                     .format(name, type(obj), id(obj)))
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'Retrieved %s of type %s with id %s from hold',
+                        name, type(obj), id(obj))
         return obj
 
+    @classmethod
+    def use_hold_store(cls, store):
+        """Replace the storage area provided by the framework.
+
+        Note: The storage is replaced for the thread local instance.
+
+        :param store: MutableMapping to store the data in, f.e a HoldStore
+                      with budgets
+
+        For return value see StackInABox.set_hold_store()
+
+        """
+        return cls.get_thread_instance().set_hold_store(store)
+
     @classmethod
     def update_uri(cls, uri):
         """Set the URI of the StackInABox framework.
@@ -154,15 +318,17 @@ class StackInABox(object):
         Default Base URI is '/'.
 
         There are no services registered, and the storage hold
-        is a basic dictionary object used as a key-value store.
+        is an unbounded HoldStore used as a key-value store.
 
         """
         self.__id = uuid.uuid4()
+        self.__lock = threading.RLock()
         self.__base_url = '/'
         self.services = {
         }
-        self.holds = {
+        self.service_index = {
         }
+        self.holds = HoldStore()
 
     @staticmethod
     def __get_service_url(base_url, service_name):
@@ -176,6 +342,21 @@ class StackInABox(object):
         """
         return '{0}/{1}'.format(base_url, service_name)
 
+    @staticmethod
+    def get_service_index_key(uri):
+        """Get the service index key for a given URI.
+
+        The index key is the first path segment of the URI, f.e `hello`
+        for both `/hello/` and `hello/v1`.
+
+        :param uri: service name or the URI within the StackInABox instance
+
+        :returns: string containing the first path segment
+        """
+        if uri.startswith('/'):
+            uri = uri[1:]
+        return uri.split('/', 1)[0]
+
     @staticmethod
     def get_services_url(url, base_url):
         """Get the URI from a given URL.
@@ -191,8 +372,8 @@ class StackInABox(object):
                 break
 
         result = url[length:]
-        logger.debug('{0} from {1} equals {2}'
-                     .format(base_url, url, result))
+        if trace.ENABLED:
+            trace.debug(logger, '%s from %s equals %s', base_url, url, result)
         return result
 
     @property
@@ -205,26 +386,31 @@ class StackInABox(object):
         """Set the Base URL property, updating all associated services."""
         logger.debug('StackInABox({0}): Updating URL from {1} to {2}'
                      .format(self.__id, self.__base_url, value))
-        self.__base_url = value
-        for k, v in six.iteritems(self.services):
-            matcher, service = v
-            service.base_url = StackInABox.__get_service_url(value,
-                                                             service.name)
-            logger.debug('StackInABox({0}): Service {1} has url {2}'
-                         .format(self.__id, service.name, service.base_url))
+        with self.__lock:
+            self.__base_url = value
+            for k, v in six.iteritems(self.services):
+                matcher, service = v
+                service.base_url = StackInABox.__get_service_url(value,
+                                                                 service.name)
+                logger.debug('StackInABox({0}): Service {1} has url {2}'
+                             .format(self.__id,
+                                     service.name,
+                                     service.base_url))
 
     def reset(self):
         """Reset StackInABox to a like-new state."""
         logger.debug('StackInABox({0}): Resetting...'
                      .format(self.__id))
-        for k, v in six.iteritems(self.services):
-            matcher, service = v
-            logger.debug('StackInABox({0}): Resetting Service {1}'
-                         .format(self.__id, service.name))
-            service.reset()
+        with self.__lock:
+            for k, v in six.iteritems(self.services):
+                matcher, service = v
+                logger.debug('StackInABox({0}): Resetting Service {1}'
+                             .format(self.__id, service.name))
+                service.reset()
 
-        self.services = {}
-        self.holds = {}
+            self.service_index = {}
+            self.services = {}
+            self.holds.clear()
 
         logger.debug('StackInABox({0}): Reset Complete'
                      .format(self.__id))
@@ -238,21 +424,36 @@ class StackInABox(object):
         :raises: ServiceAlreadyRegisteredError if the service already exists
 
         """
-        if service.name not in self.services.keys():
+        with self.__lock:
+            if service.name in self.services.keys():
+                raise ServiceAlreadyRegisteredError(
+                    'Service {0} is already registered'.format(service.name))
+
             logger.debug('StackInABox({0}): Registering Service {1}'
                          .format(self.__id, service.name))
-            regex = '^/{0}/'.format(service.name)
-            self.services[service.name] = [
-                re.compile(regex),
-                service
-            ]
             service.base_url = StackInABox.__get_service_url(self.base_url,
                                                              service.name)
             logger.debug('StackInABox({0}): Service {1} has url {2}'
                          .format(self.__id, service.name, service.base_url))
-        else:
-            raise ServiceAlreadyRegisteredError(
-                'Service {0} is already registered'.format(service.name))
+
+            regex = '^/{0}/'.format(service.name)
+            services = dict(self.services)
+            services[service.name] = [
+                re.compile(regex),
+                service
+            ]
+
+            # Services are looked up by the first segment of their URI;
+            # names sharing the first segment (f.e `hello` and `hello/v1`)
+            # are kept in registration order so the first registered wins
+            index_key = StackInABox.get_service_index_key(service.name)
+            service_index = dict(self.service_index)
+            service_index[index_key] = service_index.get(index_key, ()) + (
+                ('/{0}/'.format(service.name), service),
+            )
+
+            self.services = services
+            self.service_index = service_index
 
     def call(self, method, request, uri, headers):
         """Make a call into the thread's StackInABox instance.
@@ -268,52 +469,150 @@ class StackInABox(object):
         This function should not emit any Exceptions
 
         """
-        logger.debug('StackInABox({0}): Received call to {1} - {2}'
-                     .format(self.__id, method, uri))
+        if trace.ENABLED:
+            trace.debug(logger, 'StackInABox(%s): Received call to %s - %s',
+                        self.__id, method, uri)
         service_uri = StackInABox.get_services_url(uri, self.base_url)
 
-        for k, v in six.iteritems(self.services):
-            matcher, service = v
-            logger.debug('StackInABox({0}): Checking if Service {1} handles...'
-                         .format(self.__id, service.name))
-            logger.debug('StackInABox({0}): ...using regex pattern {1} '
-                         'against {2}'
-                         .format(self.__id, matcher.pattern, service_uri))
-            if matcher.match(service_uri):
-                logger.debug('StackInABox({0}): Trying Service {1} handler...'
-                             .format(self.__id, service.name))
+        service = self.find_service(service_uri)
+        if service is None:
+            return (597, headers, 'Unknown service - {0}'.format(service_uri))
+
+        try:
+            service_caller_uri = service_uri[(len(service.name) + 1):]
+            return service.request(method,
+                                   request,
+                                   service_caller_uri,
+                                   headers)
+        except Exception as ex:
+            logger.exception('StackInABox(%s): Service %s - '
+                             'Internal Failure',
+                             self.__id, service.name)
+            return (596,
+                    headers,
+                    'Service Handler had an error: {0}'.format(ex))
+
+    async def call_async(self, method, request, uri, headers):
+        """Make an asynchronous call into the thread's StackInABox instance.
+
+        Handlers may be `async def` functions, or otherwise return an
+        awaitable, which is awaited so that many requests may be handled
+        concurrently on a single event loop.
+
+        :param method: HTTP Method (e.g GET, POST)
+        :param request: a Request object containing the request data
+        :param uri: the URI of the request submitted with the method
+        :param headers: the return headers in a Case-Insensitive dict
+
+        :returns: A tuple containing - (i) the Status Code, (ii) the response
+                  headers, and (iii) the response body data
+
+        This function should not emit any Exceptions
 
-                try:
-                    service_caller_uri = service_uri[(len(service.name) + 1):]
-                    return service.request(method,
-                                           request,
-                                           service_caller_uri,
-                                           headers)
-                except Exception as ex:
-                    logger.exception('StackInABox({0}): Service {1} - '
-                                     'Internal Failure'
-                                     .format(self.__id, service.name))
-                    return (596,
-                            headers,
-                            'Service Handler had an error: {0}'.format(ex))
-        return (597, headers, 'Unknown service - {0}'.format(service_uri))
-
-    def into_hold(self, name, obj):
+        """
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'StackInABox(%s): Received async call to %s - %s',
+                        self.__id, method, uri)
+        service_uri = StackInABox.get_services_url(uri, self.base_url)
+
+        service = self.find_service(service_uri)
+        if service is None:
+            return (597, headers, 'Unknown service - {0}'.format(service_uri))
+
+        try:
+            service_caller_uri = service_uri[(len(service.name) + 1):]
+            return await service.request_async(method,
+                                               request,
+                                               service_caller_uri,
+                                               headers)
+        except Exception as ex:
+            logger.exception('StackInABox(%s): Service %s - '
+                             'Internal Failure',
+                             self.__id, service.name)
+            return (596,
+                    headers,
+                    'Service Handler had an error: {0}'.format(ex))
+
+    def find_service(self, service_uri):
+        """Find the service handling a URI.
+
+        :param service_uri: the URI within the StackInABox instance
+
+        :returns: StackInABoxService instance, or None if no service
+                  handles the URI
+        """
+        index_key = StackInABox.get_service_index_key(service_uri)
+        for prefix, service in self.service_index.get(index_key, ()):
+            if trace.ENABLED:
+                trace.debug(logger,
+                            'StackInABox(%s): Checking if Service %s '
+                            'handles...',
+                            self.__id, service.name)
+            if service_uri.startswith(prefix):
+                if trace.ENABLED:
+                    trace.debug(logger,
+                                'StackInABox(%s): Trying Service %s '
+                                'handler...',
+                                self.__id, service.name)
+                return service
+        return None
+
+    def into_hold(self, name, obj, pinned=False):
         """Add data into the a storage area provided by the framework.
 
         Note: The data is stored with the thread local instance.
 
         :param name: name of the data to be stored
         :param obj: data to be stored
+        :param pinned: keep the data regardless of the budgets of the
+                       storage, if the storage supports pinning its entries
+                       like a HoldStore does
 
         :returns: N/A
         :raises: N/A
 
         """
-        logger.debug('StackInABox({0}): Holding onto {1} of type {2} '
-                     'with id {3}'
-                     .format(self.__id, name, type(obj), id(obj)))
-        self.holds[name] = obj
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'StackInABox(%s): Holding onto %s of type %s '
+                        'with id %s',
+                        self.__id, name, type(obj), id(obj))
+        with self.__lock:
+            self.__store(self.holds, name, obj, pinned)
+
+    @staticmethod
+    def __store(holds, name, obj, pinned):
+        """Store data in a storage, pinning it if requested and supported.
+
+        Note: this is an internal function
+        """
+        pin = getattr(holds, 'pin', None) if pinned else None
+        if pin is not None:
+            pin(name, obj)
+        else:
+            holds[name] = obj
+
+    def set_hold_store(self, store):
+        """Replace the storage area provided by the framework.
+
+        The data already stored is moved into the new storage, pinned
+        entries staying pinned, so the utilities keep finding what they
+        registered.
+
+        :param store: MutableMapping to store the data in, f.e a HoldStore
+                      with budgets
+
+        :returns: the new storage
+        """
+        logger.debug('StackInABox({0}): Replacing the hold with {1}'
+                     .format(self.__id, type(store).__name__))
+        with self.__lock:
+            pinned = getattr(self.holds, 'pinned', ())
+            for name, obj in list(self.holds.items()):
+                self.__store(store, name, obj, name in pinned)
+            self.holds = store
+        return store
 
     def from_hold(self, name):
         """Get data from the storage area provided by the framework.
@@ -327,14 +626,82 @@ class StackInABox(object):
                  a value in the storage
 
         """
-        logger.debug('StackInABox({0}): Retreiving {1} from the hold'
-                     .format(self.__id, name))
+        if trace.ENABLED:
+            trace.debug(logger, 'StackInABox(%s): Retreiving %s from the hold',
+                        self.__id, name)
         obj = self.holds[name]
-        logger.debug('StackInABox({0}): Retrieved {1} of type {2} with id {3}'
-                     .format(self.__id, name, type(obj), id(obj)))
+        if trace.ENABLED:
+            trace.debug(logger,
+                        'StackInABox(%s): Retrieved %s of type %s with id %s',
+                        self.__id, name, type(obj), id(obj))
 
         return obj
 
 
+class ContextStore(object):
+    """Storage for the StackInABox instance bound to the current context.
+
+    Each asyncio task works on a copy of the context it was created in, so
+    binding an instance in a task does not affect other tasks, nor the
+    instance of the thread kept in `local_store`.
+    """
+
+    def __init__(self):
+        self.__instance = contextvars.ContextVar('stackinabox_instance')
+
+    @property
+    def instance(self):
+        """StackInABox instance of the current context."""
+        try:
+            return self.__instance.get()
+        except LookupError:
+            raise AttributeError('instance')
+
+    @instance.setter
+    def instance(self, value):
+        self.__instance.set(value)
+
+    def set(self, instance):
+        """Bind an instance to the current context.
+
+        :param instance: StackInABox instance, None to unbind it
+
+        :returns: token for restoring the previous binding with reset()
+        """
+        return self.__instance.set(instance)
+
+    def reset(self, token):
+        """Restore the binding replaced by set().
+
+        :param token: token returned by set()
+
+        :returns: n/a
+        """
+        self.__instance.reset(token)
+
+    def get(self, default=None):
+        """Get the instance of the current context.
+
+        :param default: value returned if the context has no instance
+
+        :returns: the StackInABox instance, or default
+        """
+        return self.__instance.get(default)
+
+
+class SharedStore(object):
+    """Storage for the StackInABox instance shared by all threads."""
+
+    def __init__(self):
+        self.instance = None
+        self.lock = threading.Lock()
+
+
 # Thread local instance of StackInABox
 local_store = threading.local()
+
+# StackInABox instance bound to the current context, if any
+context_store = ContextStore()
+
+# StackInABox instance shared by all threads, if any
+shared_store = SharedStore()
@@ -0,0 +1,490 @@
+"""
+Stack-In-A-Box: aiohttp Client Support
+"""
+from __future__ import absolute_import
+
+import asyncio
+import collections.abc as collections
+import inspect
+import json as jsonlib
+import logging
+import re
+import urllib.parse
+
+import aiohttp
+from aiohttp.base_protocol import BaseProtocol
+from aiohttp.client_reqrep import ClientResponse, RequestInfo
+from aiohttp.helpers import TimerNoop
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from stackinabox.server.core import get_reason_for_status
+from stackinabox.stack import StackInABox
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    get_body_bytes,
+    get_body_length,
+    iterate_body_async
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# newer aiohttp releases require the writer of the request when building a
+# response
+RESPONSE_REQUIRES_STREAM_WRITER = (
+    'stream_writer' in inspect.signature(ClientResponse.__init__).parameters
+)
+
+
+class AioHTTPRequest(object):
+    """Request made by an aiohttp ClientSession.
+
+    Provides the request to the StackInABoxService handlers. File-like
+    bodies are only read as the service reads them, either in chunks
+    through the BodyReader `body_reader` or all at once through `body`.
+    """
+
+    def __init__(self, method, url, headers, body):
+        """Initialize the request.
+
+        :param method: HTTP verb
+        :param url: full URL of the request including the query string
+        :param headers: case-insensitive request headers
+        :param body: bytes of the request body, or the file-like object to
+                     read it from
+        """
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.__body = body if get_body_bytes(body) is not None else None
+        self.body_reader = BodyReader(body)
+
+    @property
+    def body(self):
+        """bytes of the request body, whatever is left of it once
+        `body_reader` has been read from
+        """
+        if self.__body is None:
+            self.__body = self.body_reader.read()
+        return self.__body
+
+    @body.setter
+    def body(self, value):
+        self.__body = value
+
+
+class BufferedBodyProtocol(BaseProtocol):
+    """Protocol of a response body that is already held in memory.
+
+    There is no connection to pause reading from, so flow control does not
+    apply.
+    """
+
+    def pause_reading(self, *args, **kwargs):
+        pass
+
+    def resume_reading(self, *args, **kwargs):
+        pass
+
+
+class StreamedBodyProtocol(BaseProtocol):
+    """Protocol of a response body that is streamed from a service.
+
+    The StreamReader of the response pauses reading once it holds more
+    than its limit, which stops the body from being produced until the
+    response has been read.
+    """
+
+    def __init__(self, loop):
+        super(StreamedBodyProtocol, self).__init__(loop)
+        self.readable = asyncio.Event()
+        self.readable.set()
+
+    @property
+    def connected(self):
+        return True
+
+    def pause_reading(self, *args, **kwargs):
+        self._reading_paused = True
+        self.readable.clear()
+
+    def resume_reading(self, *args, **kwargs):
+        self._reading_paused = False
+        self.readable.set()
+
+
+class StreamedBodyConnection(object):
+    """Connection of a response body that is streamed from a service.
+
+    Releasing or closing the response stops producing the body.
+    """
+
+    protocol = None
+
+    def __init__(self, task):
+        """Initialize the connection.
+
+        :param task: asyncio.Task feeding the body to the response
+        """
+        self.task = task
+
+    def release(self):
+        if not self.task.done():
+            self.task.cancel()
+
+    def close(self):
+        self.release()
+
+
+async def feed_body(content, protocol, body, chunk_size):
+    """Feed a streamed body to the StreamReader of a response.
+
+    :param content: aiohttp.StreamReader of the response
+    :param protocol: StreamedBodyProtocol of the StreamReader
+    :param body: file-like object, iterable, or asynchronous iterable of
+                 bytes or strings
+    :param chunk_size: size of the chunks read from file-like objects
+
+    :returns: n/a
+    """
+    chunks = iterate_body_async(body, chunk_size)
+    try:
+        async for chunk in chunks:
+            await protocol.readable.wait()
+            if chunk:
+                content.feed_data(bytes(chunk))
+    except Exception as ex:
+        # the error is raised to the reader of the response
+        logger.debug('Failed to stream the response body: {0}'.format(ex))
+        content.set_exception(ex)
+        return
+    finally:
+        await chunks.aclose()
+    content.feed_eof()
+
+
+class SentRequestWriter(object):
+    """Writer of a request that has already been sent.
+
+    aiohttp takes the size of the request from the writer when a response
+    is built; the request of Stack-In-A-Box never reaches a socket.
+    """
+
+    def __init__(self, output_size):
+        self.output_size = output_size
+
+
+async def get_request_body(headers, data=None, json=None):
+    """Get the request body.
+
+    File-like objects are left for the service to read. The BodyReader
+    handed to the services cannot await, so the bodies of asynchronous
+    files and iterables are received in full.
+
+    :param headers: CIMultiDict of the request headers, the Content-Type
+                    is added if implied by the body
+    :param data: data parameter of the request
+    :param json: json parameter of the request
+
+    :returns: bytes of the request body, or the file-like object to read
+              it from
+    :raises: TypeError if the data is not supported
+    """
+    if json is not None:
+        headers.setdefault('Content-Type', 'application/json')
+        return jsonlib.dumps(json).encode('utf-8')
+
+    if data is None:
+        return b''
+
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data)
+
+    if isinstance(data, str):
+        return data.encode('utf-8')
+
+    if isinstance(data, (collections.Mapping, list, tuple)):
+        headers.setdefault('Content-Type',
+                           'application/x-www-form-urlencoded')
+        return urllib.parse.urlencode(data, doseq=True).encode('utf-8')
+
+    if hasattr(data, 'read'):
+        if not inspect.iscoroutinefunction(data.read):
+            return data
+        body = await data.read()
+        return body.encode('utf-8') if isinstance(body, str) else body
+
+    if isinstance(data, collections.AsyncIterable):
+        return b''.join([chunk async for chunk in data])
+
+    raise TypeError(
+        'Request data of type {0} is not supported by Stack-In-A-Box'
+        .format(type(data))
+    )
+
+
+class ClientSessionPatch(object):
+    """Patch of aiohttp.ClientSession._request.
+
+    While enabled, requests of any aiohttp.ClientSession are handed to
+    Stack-In-A-Box if they are for the URI registered with the StackInABox
+    instance of the caller. All other requests are sent as usual.
+
+    The responses provide their body through a StreamReader so they can be
+    read all at once, line by line, or in chunks as with a real server.
+    Bodies returned as file-like objects, iterators or generators are only
+    produced as the StreamReader is read.
+    """
+
+    HOLD_NAME = 'aiohttp_regex'
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self):
+        self.original_request = None
+
+    @property
+    def enabled(self):
+        """Is the patch applied?"""
+        return self.original_request is not None
+
+    @staticmethod
+    def matches(url):
+        """Is the URL registered with Stack-In-A-Box?
+
+        :param url: yarl.URL of the request
+
+        :returns: boolean
+        """
+        regex = StackInABox.get_thread_instance().holds.get(
+            ClientSessionPatch.HOLD_NAME
+        )
+        return regex is not None and regex.match(str(url)) is not None
+
+    @staticmethod
+    def build_response(session, method, url, request_headers, request_body,
+                       stackinabox_result):
+        """Convert the result of Stack-In-A-Box to an aiohttp ClientResponse.
+
+        :param session: aiohttp.ClientSession making the request
+        :param method: HTTP verb
+        :param url: yarl.URL of the request
+        :param request_headers: CIMultiDict of the request headers
+        :param request_body: bytes of the request body, or the file-like
+                             object it was read from
+        :param stackinabox_result: tuple - (int, dict, body) returned by
+                                   Stack-In-A-Box
+
+        :returns: aiohttp ClientResponse
+        """
+        status_code, output_headers, body = stackinabox_result
+        loop = asyncio.get_running_loop()
+
+        response_kwargs = {
+            'writer': None,
+            'continue100': None,
+            'timer': TimerNoop(),
+            'request_info': RequestInfo(
+                url,
+                method,
+                CIMultiDictProxy(request_headers),
+                url
+            ),
+            'traces': [],
+            'loop': loop,
+            'session': session,
+        }
+        if RESPONSE_REQUIRES_STREAM_WRITER:
+            # the size of a file-like body is unknown until read in full
+            response_kwargs['stream_writer'] = SentRequestWriter(
+                get_body_length(request_body) or 0
+            )
+        response = ClientResponse(method, url, **response_kwargs)
+
+        headers = CIMultiDict()
+        for key, value in output_headers.items():
+            headers.add(key, str(value))
+        response._headers = CIMultiDictProxy(headers)
+        response._raw_headers = tuple(
+            (key.encode('utf-8'), value.encode('utf-8'))
+            for key, value in headers.items()
+        )
+        for cookie in headers.getall('Set-Cookie', ()):
+            response.cookies.load(cookie)
+
+        response.status = status_code
+        response.reason = get_reason_for_status(status_code)
+
+        content = get_body_bytes(body)
+        if content is None:
+            # file-like objects, iterators and generators are produced as
+            # the response is read
+            protocol = StreamedBodyProtocol(loop)
+            response.content = aiohttp.StreamReader(
+                protocol,
+                limit=ClientSessionPatch.CHUNK_SIZE,
+                loop=loop
+            )
+            response._connection = StreamedBodyConnection(
+                loop.create_task(feed_body(response.content,
+                                           protocol,
+                                           body,
+                                           ClientSessionPatch.CHUNK_SIZE))
+            )
+            return response
+
+        response_body = bytes(content)
+        response.content = aiohttp.StreamReader(
+            BufferedBodyProtocol(loop),
+            limit=ClientSessionPatch.CHUNK_SIZE,
+            loop=loop
+        )
+        for offset in range(0, len(response_body),
+                            ClientSessionPatch.CHUNK_SIZE):
+            response.content.feed_data(
+                response_body[offset:offset + ClientSessionPatch.CHUNK_SIZE]
+            )
+        response.content.feed_eof()
+        return response
+
+    async def handle_request(self, session, method, str_or_url, params=None,
+                             data=None, json=None, headers=None,
+                             raise_for_status=None, **kwargs):
+        """Handle a request of an aiohttp.ClientSession.
+
+        :param session: aiohttp.ClientSession making the request
+        :param method: HTTP verb
+        :param str_or_url: URL of the request
+        :param params: query string parameters of the request
+        :param data: data of the request body
+        :param json: object sent as JSON in the request body
+        :param headers: request headers
+        :param raise_for_status: raise for HTTP error statuses, defaults to
+                                 the setting of the session
+        :param kwargs: further parameters of the request that do not apply
+                       to Stack-In-A-Box
+
+        :returns: aiohttp ClientResponse
+        """
+        url = session._build_url(str_or_url)
+        if params:
+            url = url.extend_query(params)
+
+        method = method.upper()
+        request_headers = session._prepare_headers(headers)
+        request_body = await get_request_body(request_headers, data, json)
+
+        stackinabox_headers = CaseInsensitiveDict()
+        stackinabox_headers.update(request_headers)
+        request = AioHTTPRequest(method,
+                                 str(url),
+                                 stackinabox_headers,
+                                 request_body)
+
+        stackinabox_result = await StackInABox.call_into_async(
+            method,
+            request,
+            str(url),
+            CaseInsensitiveDict()
+        )
+        response = ClientSessionPatch.build_response(session,
+                                                     method,
+                                                     url,
+                                                     request_headers,
+                                                     request_body,
+                                                     stackinabox_result)
+
+        if raise_for_status is None:
+            raise_for_status = session._raise_for_status
+        if raise_for_status is True:
+            response.raise_for_status()
+        elif callable(raise_for_status):
+            await raise_for_status(response)
+        return response
+
+    def enable(self):
+        """Patch aiohttp.ClientSession._request.
+
+        :returns: n/a
+        """
+        if self.enabled:
+            return
+
+        logger.debug('Patching aiohttp.ClientSession')
+        original_request = aiohttp.ClientSession._request
+        patch = self
+
+        async def _request(session, method, str_or_url, **kwargs):
+            url = session._build_url(str_or_url)
+            if ClientSessionPatch.matches(url):
+                return await patch.handle_request(session,
+                                                  method,
+                                                  str_or_url,
+                                                  **kwargs)
+            return await original_request(session,
+                                          method,
+                                          str_or_url,
+                                          **kwargs)
+
+        self.original_request = original_request
+        aiohttp.ClientSession._request = _request
+
+    def disable(self):
+        """Restore aiohttp.ClientSession._request.
+
+        :returns: n/a
+        """
+        if not self.enabled:
+            return
+
+        logger.debug('Restoring aiohttp.ClientSession')
+        aiohttp.ClientSession._request = self.original_request
+        self.original_request = None
+
+
+session_patch = ClientSessionPatch()
+
+
+def enable():
+    """Hand requests of all aiohttp client sessions to Stack-In-A-Box.
+
+    Only requests for a URI registered with registration() are handled by
+    Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    session_patch.enable()
+
+
+def disable():
+    """Stop handing requests of aiohttp client sessions to Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    session_patch.disable()
+
+
+def registration(uri):
+    """aiohttp handler registration.
+
+    Registers a given URI with the StackInABox instance so that requests of
+    aiohttp client sessions for it are intercepted and handed to
+    Stack-In-A-Box while enable() is in effect.
+
+    :param uri: URI used for the base of the HTTP requests
+
+    :returns: n/a
+    """
+
+    # log the URI that is used to access the Stack-In-A-Box services
+    logger.debug('Registering Stack-In-A-Box at {0} under aiohttp'
+                 .format(uri))
+    # tell Stack-In-A-Box what URI to match with
+    StackInABox.update_uri(uri)
+
+    StackInABox.hold_onto(
+        ClientSessionPatch.HOLD_NAME,
+        re.compile(r'(http)?s?(://)?{0}:?(\d+)?/'.format(uri), re.I),
+        pinned=True
+    )
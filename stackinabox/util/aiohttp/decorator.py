@@ -0,0 +1,30 @@
+"""
+Stack-In-A-Box: aiohttp Client Support via decorator
+"""
+from stackinabox.util.decorator import ActivateDecorator
+from stackinabox.util.aiohttp import core
+
+
+class activate(ActivateDecorator):
+    """
+    Decorator class to make use of aiohttp and Stack-In-A-Box
+    extremely simple to do.
+
+    Both plain and `async def` test functions may be decorated.
+    """
+
+    def __init__(self, uri, *args, **kwargs):
+        """
+        Initialize the decorator instance
+
+        :param uri: URI Stack-In-A-Box will use to recognize the HTTP calls
+            f.e 'localhost'.
+        :param args: services and positional arguments of the function, see
+            ActivateDecorator
+        :param kwargs: keyword arguments of the function, see
+            ActivateDecorator
+        """
+        super(activate, self).__init__(
+            core.enable, core.registration, core.disable,
+            uri, *args, **kwargs
+        )
@@ -0,0 +1,69 @@
+"""
+Stack-In-A-Box: Awaitable Handler Results
+
+Handlers registered with a StackInABoxService may be `async def` functions,
+or otherwise return an awaitable, that produces the usual
+(status, headers, body) tuple once awaited.
+
+The asynchronous dispatch path, f.e `StackInABox.call_into_async()`, simply
+awaits them. The synchronous dispatch path has to run them to completion on
+an event loop of its own. If the calling thread is already running an event
+loop, that loop is blocked for the duration of the call, so code running on
+an event loop should use the asynchronous dispatch path instead. The
+handler then runs in another thread, which still uses the StackInABox
+instance of the calling thread.
+"""
+import asyncio
+from concurrent import futures
+import contextvars
+import inspect
+
+from stackinabox.stack import StackInABox
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def _run(instance, awaitable):
+    with StackInABox.use_instance(instance):
+        return asyncio.run(_await(awaitable))
+
+
+def resolve(result):
+    """Get the result of a handler, running it to completion if awaitable.
+
+    :param result: value returned by a handler
+
+    :returns: the result, or what it produces if it is awaitable
+    """
+    if not inspect.isawaitable(result):
+        return result
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(_await(result))
+
+    # asyncio does not allow nested event loops, so run the awaitable on an
+    # event loop in another thread while the calling thread waits for it;
+    # the instance of the calling thread may only be kept in its
+    # threading.local, so it is bound to the other thread explicitly
+    context = contextvars.copy_context()
+    instance = StackInABox.get_thread_instance()
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(
+            context.run, _run, instance, result
+        ).result()
+
+
+async def resolve_async(result):
+    """Get the result of a handler, awaiting it if awaitable.
+
+    :param result: value returned by a handler
+
+    :returns: the result, or what it produces if it is awaitable
+    """
+    if inspect.isawaitable(result):
+        return await result
+    return result
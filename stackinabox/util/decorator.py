@@ -0,0 +1,150 @@
+"""
+Stack-In-A-Box: Shared activate decorator of the utilities
+"""
+import collections.abc as collections
+import functools
+import inspect
+import logging
+import types
+
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+
+logger = logging.getLogger(__name__)
+
+
+class ActivateDecorator(object):
+    """
+    Decorator class registering services with Stack-In-A-Box for the
+    duration of a test function, and patching a client library while it
+    runs.
+
+    The utilities bind the enable, registration, and disable functions of
+    their core module, f.e:
+
+        class activate(ActivateDecorator):
+
+            def __init__(self, uri, *args, **kwargs):
+                super(activate, self).__init__(
+                    core.enable, core.registration, core.disable,
+                    uri, *args, **kwargs
+                )
+
+    Both plain and `async def` test functions may be decorated.
+    """
+
+    def __init__(self, enable, registration, disable, uri, *args,
+                 **kwargs):
+        """
+        Initialize the decorator instance
+
+        :param enable: callable patching the client library
+        :param registration: callable taking the URI to intercept the HTTP
+            calls to
+        :param disable: callable removing the patch of the client library
+        :param uri: URI Stack-In-A-Box will use to recognize the HTTP calls
+            f.e 'localhost'.
+        :param text_type access_services: name of a keyword parameter in the
+            test function to assign access to the services created in the
+            arguments to the decorator.
+        :param args: A tuple containing all the positional arguments. Any
+            StackInABoxService arguments are removed before being passed to
+            the actual function.
+        :param kwargs: A dictionary of keyword args that are passed to the
+            actual function.
+        """
+        self.enable = enable
+        self.registration = registration
+        self.disable = disable
+        self.uri = uri
+        self.services = {}
+        self.args = []
+        self.kwargs = kwargs
+
+        if "access_services" in self.kwargs:
+            self.enable_service_access = self.kwargs["access_services"]
+            del self.kwargs["access_services"]
+        else:
+            self.enable_service_access = None
+
+        for arg in args:
+            if self.process_service(arg, raise_on_type=False):
+                pass
+            elif (
+                isinstance(arg, types.GeneratorType) or
+                isinstance(arg, collections.Iterable)
+            ):
+                for sub_arg in arg:
+                    self.process_service(sub_arg, raise_on_type=True)
+            else:
+                self.args.append(arg)
+
+    def process_service(self, arg_based_service, raise_on_type=True):
+        if isinstance(arg_based_service, StackInABoxService):
+            logger.debug("Registering {0}".format(arg_based_service.name))
+            self.services[arg_based_service.name] = arg_based_service
+            return True
+        elif raise_on_type:
+            raise TypeError(
+                "Generator or Iterable must provide a "
+                "StackInABoxService in all of its results."
+            )
+        return False
+
+    def prepare(self, args, kwargs):
+        """
+        Patch the client library and register the services.
+
+        :returns: tuple - (tuple, dict) of the arguments for the function
+        """
+        args_copy = list(args)
+        for arg in self.args:
+            args_copy.append(arg)
+        args_finalized = tuple(args_copy)
+        kwargs.update(self.kwargs)
+
+        if self.enable_service_access is not None:
+            kwargs[self.enable_service_access] = self.services
+
+        self.enable()
+
+        StackInABox.reset_services()
+        for service in self.services.values():
+            StackInABox.register_service(service)
+        self.registration(self.uri)
+
+        return (args_finalized, kwargs)
+
+    def cleanup(self):
+        """
+        Reset the services and remove the patch of the client library.
+        """
+        StackInABox.reset_services()
+        self.disable()
+
+    def __call__(self, fn):
+        """
+        Call to actually wrap the function call.
+        """
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapped_async(*args, **kwargs):
+                args_finalized, kwargs = self.prepare(args, kwargs)
+                try:
+                    return await fn(*args_finalized, **kwargs)
+                finally:
+                    self.cleanup()
+
+            return wrapped_async
+
+        @functools.wraps(fn)
+        def wrapped(*args, **kwargs):
+            args_finalized, kwargs = self.prepare(args, kwargs)
+            try:
+                return fn(*args_finalized, **kwargs)
+            finally:
+                self.cleanup()
+
+        return wrapped
@@ -5,6 +5,7 @@ from __future__ import absolute_import
 
 import logging
 import re
+import threading
 
 from httpretty import register_uri
 from httpretty.http import HttpBaseClass
@@ -13,12 +14,83 @@ import six
 
 from stackinabox.stack import StackInABox
 from stackinabox.util import deprecator
-from stackinabox.util.tools import CaseInsensitiveDict
+from stackinabox.util.tools import (
+    CHUNK_SIZE,
+    BodyReader,
+    CaseInsensitiveDict,
+    get_body_bytes,
+    get_body_reader
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+class StreamedBody(object):
+    """Body of a response as httpretty streams it.
+
+    httpretty writes each chunk of a streamed body to the response but also
+    keeps a reference to it, so the chunks are views of a single buffer that
+    is reused for every chunk. Bodies of any size are written in memory
+    proportional to the chunk size.
+    """
+
+    def __init__(self, body, chunk_size=CHUNK_SIZE):
+        """Initialize the body.
+
+        :param body: string, bytes, file-like object, or iterable of bytes
+                     or strings returned by a service
+        :param chunk_size: size of the chunks written to the response
+        """
+        self.body = body
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        # httpretty takes the length of the bodies of callables but does not
+        # send it for streamed responses, which end with the connection
+        return 0
+
+    def __iter__(self):
+        view = memoryview(bytearray(self.chunk_size))
+        reader = get_body_reader(self.body, self.chunk_size)
+        try:
+            while True:
+                size = reader.readinto(view)
+                if not size:
+                    break
+                yield view[:size]
+        finally:
+            reader.close()
+
+
+class StreamingFlag(object):
+    """The `streaming` flag of the URIs registered with httpretty.
+
+    httpretty only evaluates the flag once the callback has produced the
+    response, on the thread writing the response. The flag is true while
+    that thread writes a body the callback streams, so bodies held in
+    memory are sent with a Content-Length like any other httpretty
+    response.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def __bool__(self):
+        return getattr(self.local, 'streaming', False)
+
+    def set(self, streaming):
+        """Set the flag for the response written next on this thread.
+
+        :param streaming: boolean - whether the response is streamed
+        :returns: n/a
+        """
+        self.local.streaming = streaming
+
+
+streaming_flag = StreamingFlag()
+
+
 def httpretty_callback(request, uri, headers):
     """httpretty request handler.
 
@@ -29,10 +101,11 @@ def httpretty_callback(request, uri, headers):
     :param uri: the uri of the request
     :param headers: headers for the response
 
-    :returns: tuple - (int, dict, string) containing:
+    :returns: tuple - (int, dict, body) containing:
                       int - the http response status code
                       dict - the headers for the http response
-                      string - http string response
+                      body - http response body, a StreamedBody for
+                             file-like objects, iterators and generators
 
     """
     method = request.method
@@ -41,10 +114,19 @@ def httpretty_callback(request, uri, headers):
     request_headers = CaseInsensitiveDict()
     request_headers.update(request.headers)
     request.headers = request_headers
-    return StackInABox.call_into(method,
-                                 request,
-                                 uri,
-                                 response_headers)
+    request.body_reader = BodyReader(request.body)
+    status_code, output_headers, body = StackInABox.call_into(
+        method,
+        request,
+        uri,
+        response_headers
+    )
+    if get_body_bytes(body) is not None:
+        streaming_flag.set(False)
+        return (status_code, output_headers, body)
+
+    streaming_flag.set(True)
+    return (status_code, output_headers, StreamedBody(body))
 
 
 def registration(uri):
@@ -78,11 +160,12 @@ def registration(uri):
     StackInABox.update_uri(uri)
 
     # build the regex for the uri and register all http verbs
-    # with httpretty
+    # with httpretty, streaming the bodies that are not held in memory
     regex = re.compile(r'(http)?s?(://)?{0}:?(\d+)?/'.format(uri),
                        re.I)
     for method in HttpBaseClass.METHODS:
-        register_uri(method, regex, body=httpretty_callback)
+        register_uri(method, regex, body=httpretty_callback,
+                     streaming=streaming_flag)
 
 
 @deprecator.DeprecatedInterface("httpretty_registration", "registration")
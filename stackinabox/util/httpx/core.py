@@ -0,0 +1,313 @@
+"""
+Stack-In-A-Box: HTTPX Support
+"""
+from __future__ import absolute_import
+
+import logging
+import re
+
+import httpx
+
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    get_body_bytes,
+    iterate_body,
+    iterate_body_async
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamedBody(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Response body streamed from a file-like object, iterator or
+    generator returned by a service.
+
+    The body is only read as the response is, by either an httpx.Client or
+    an httpx.AsyncClient.
+    """
+
+    def __init__(self, body):
+        """Initialize the stream.
+
+        :param body: file-like object, iterable, or asynchronous iterable of
+                     bytes or strings
+        """
+        self.body = body
+
+    def __iter__(self):
+        for chunk in iterate_body(self.body):
+            yield bytes(chunk)
+
+    async def __aiter__(self):
+        async for chunk in iterate_body_async(self.body):
+            yield bytes(chunk)
+
+    def close(self):
+        close = getattr(self.body, 'close', None)
+        if close is not None:
+            close()
+
+    async def aclose(self):
+        aclose = getattr(self.body, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+        else:
+            self.close()
+
+
+class StackInABoxTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """HTTPX Transport handing requests to Stack-In-A-Box.
+
+    The transport works with both httpx.Client and httpx.AsyncClient. The
+    requests of an httpx.AsyncClient use the asynchronous dispatch path so
+    that many requests may be in flight at the same time:
+
+        client = httpx.AsyncClient(transport=StackInABoxTransport('localhost'))
+
+    Services see the httpx.Request object with its body available as
+    `request.body` and through the BodyReader `request.body_reader`.
+    Iterator and file-like bodies sent by an httpx.Client are only read as
+    the service reads the BodyReader; `request.body` is then the stream of
+    the request. The body_reader is read synchronously, so the body of a
+    request of an httpx.AsyncClient is received in full before it is
+    handed to the service.
+    """
+
+    def __init__(self, uri):
+        """Initialize the transport.
+
+        :param uri: URI used for the base of the HTTP requests
+        """
+        self.uri = uri
+        self.regex = re.compile(
+            r'(http)?s?(://)?{0}:?(\d+)?/'.format(uri), re.I)
+
+    def matches(self, request):
+        """Is the request for the Stack-In-A-Box URI?
+
+        :param request: httpx.Request object
+
+        :returns: boolean
+        """
+        return self.regex.match(str(request.url)) is not None
+
+    @staticmethod
+    def prepare_request(request):
+        """Convert an httpx.Request for use with Stack-In-A-Box.
+
+        :param request: httpx.Request object
+
+        :returns: tuple - (string, string, dict) containing:
+                          string - the HTTP method
+                          string - the URI of the request
+                          dict - the case-insensitive response headers
+        """
+        try:
+            request.body = request.content
+        except httpx.RequestNotRead:
+            # the body is read from the client as the service reads it
+            request.body = request.stream
+        request.body_reader = BodyReader(request.body)
+        return (request.method, str(request.url), CaseInsensitiveDict())
+
+    @staticmethod
+    def build_response(request, stackinabox_result):
+        """Convert the result of Stack-In-A-Box to an httpx.Response.
+
+        :param request: httpx.Request object
+        :param stackinabox_result: tuple - (int, dict, body) returned by
+                                   Stack-In-A-Box
+
+        :returns: httpx.Response object
+        """
+        status_code, output_headers, body = stackinabox_result
+
+        # if the body is a string-type, it's the text
+        if isinstance(body, str):
+            if trace.ENABLED:
+                trace.debug(logger, 'running text result')
+            return httpx.Response(status_code,
+                                  headers=list(output_headers.items()),
+                                  text=body,
+                                  request=request)
+
+        # file-like objects, iterators and generators are streamed
+        if get_body_bytes(body) is None:
+            if trace.ENABLED:
+                trace.debug(logger, 'running streamed result')
+            return httpx.Response(status_code,
+                                  headers=list(output_headers.items()),
+                                  stream=StreamedBody(body),
+                                  request=request)
+
+        # otherwise, it's the content
+        if trace.ENABLED:
+            trace.debug(logger, 'running content result')
+        return httpx.Response(status_code,
+                              headers=list(output_headers.items()),
+                              content=body,
+                              request=request)
+
+    def handle_request(self, request):
+        """Handle a request of an httpx.Client.
+
+        :param request: httpx.Request object
+
+        :returns: httpx.Response object
+        """
+        method, uri, headers = self.prepare_request(request)
+        return self.build_response(
+            request,
+            StackInABox.call_into(method, request, uri, headers)
+        )
+
+    async def handle_async_request(self, request):
+        """Handle a request of an httpx.AsyncClient.
+
+        :param request: httpx.Request object
+
+        :returns: httpx.Response object
+        """
+        # the BodyReader cannot await the stream of the request
+        await request.aread()
+        method, uri, headers = self.prepare_request(request)
+        return self.build_response(
+            request,
+            await StackInABox.call_into_async(method, request, uri, headers)
+        )
+
+
+class HTTPTransportPatch(object):
+    """Patch of the default HTTPX transports.
+
+    While enabled, requests sent by any httpx.Client or httpx.AsyncClient
+    using the default transports are handed to the transport registered
+    with the StackInABox instance of the caller, if the request is for its
+    URI. All other requests are sent as usual.
+    """
+
+    HOLD_NAME = 'httpx_transport'
+
+    def __init__(self):
+        self.original_handle_request = None
+        self.original_handle_async_request = None
+
+    @property
+    def enabled(self):
+        """Is the patch applied?"""
+        return self.original_handle_request is not None
+
+    @staticmethod
+    def get_transport(request):
+        """Get the registered transport handling the request, if any.
+
+        :param request: httpx.Request object
+
+        :returns: StackInABoxTransport instance or None
+        """
+        transport = StackInABox.get_thread_instance().holds.get(
+            HTTPTransportPatch.HOLD_NAME
+        )
+        if transport is not None and transport.matches(request):
+            return transport
+        return None
+
+    def enable(self):
+        """Patch the default HTTPX transports.
+
+        :returns: n/a
+        """
+        if self.enabled:
+            return
+
+        logger.debug('Patching the HTTPX transports')
+        original_handle_request = httpx.HTTPTransport.handle_request
+        original_handle_async_request = (
+            httpx.AsyncHTTPTransport.handle_async_request
+        )
+
+        def handle_request(transport, request):
+            stackinabox_transport = HTTPTransportPatch.get_transport(request)
+            if stackinabox_transport is not None:
+                return stackinabox_transport.handle_request(request)
+            return original_handle_request(transport, request)
+
+        async def handle_async_request(transport, request):
+            stackinabox_transport = HTTPTransportPatch.get_transport(request)
+            if stackinabox_transport is not None:
+                return await stackinabox_transport.handle_async_request(
+                    request
+                )
+            return await original_handle_async_request(transport, request)
+
+        self.original_handle_request = original_handle_request
+        self.original_handle_async_request = original_handle_async_request
+        httpx.HTTPTransport.handle_request = handle_request
+        httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+
+    def disable(self):
+        """Restore the default HTTPX transports.
+
+        :returns: n/a
+        """
+        if not self.enabled:
+            return
+
+        logger.debug('Restoring the HTTPX transports')
+        httpx.HTTPTransport.handle_request = self.original_handle_request
+        httpx.AsyncHTTPTransport.handle_async_request = (
+            self.original_handle_async_request
+        )
+        self.original_handle_request = None
+        self.original_handle_async_request = None
+
+
+transport_patch = HTTPTransportPatch()
+
+
+def enable():
+    """Hand requests of all HTTPX clients to Stack-In-A-Box.
+
+    Only requests for a URI registered with registration() are handled by
+    Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    transport_patch.enable()
+
+
+def disable():
+    """Stop handing requests of all HTTPX clients to Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    transport_patch.disable()
+
+
+def registration(uri):
+    """HTTPX handler registration.
+
+    Registers a transport for a given URI with the StackInABox instance so
+    that requests of HTTPX clients can be intercepted and handed to
+    Stack-In-A-Box while enable() is in effect.
+
+    :param uri: URI used for the base of the HTTP requests
+
+    :returns: StackInABoxTransport instance, which may also be passed to
+              HTTPX clients directly
+    """
+
+    # log the URI that is used to access the Stack-In-A-Box services
+    logger.debug('Registering Stack-In-A-Box at {0} under HTTPX'
+                 .format(uri))
+    # tell Stack-In-A-Box what URI to match with
+    StackInABox.update_uri(uri)
+
+    transport = StackInABoxTransport(uri)
+    StackInABox.hold_onto(HTTPTransportPatch.HOLD_NAME, transport,
+                          pinned=True)
+    return transport
@@ -0,0 +1,305 @@
+"""
+Stack-In-A-Box: Python Requests Support
+"""
+from __future__ import absolute_import
+
+import http.client
+import io
+import logging
+import re
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from stackinabox.server.core import get_reason_for_status
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    BodyReader,
+    get_body_bytes,
+    get_body_reader
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class OriginalResponse(object):
+    """Headers of a response as provided by http.client.
+
+    Python Requests reads the cookies of a response from the headers of the
+    http.client response it was built from.
+    """
+
+    def __init__(self, headers):
+        """Initialize the response headers.
+
+        :param headers: dict of the response headers
+        """
+        self.msg = http.client.HTTPMessage()
+        for key, value in headers.items():
+            self.msg[key] = value
+
+
+class StackInABoxAdapter(HTTPAdapter):
+    """Python Requests Transport Adapter handing requests to Stack-In-A-Box.
+
+    The adapter builds the requests.Response directly from the result of
+    Stack-In-A-Box without going through any mocking library:
+
+        session.mount('http://localhost/', StackInABoxAdapter())
+
+    Services see the requests.PreparedRequest object. Its body is also
+    available through the BodyReader `request.body_reader`, which reads
+    file-like and generator bodies as the service does. The response
+    headers given to the services become the headers of the
+    requests.Response.
+    """
+
+    @staticmethod
+    def get_reason_for_status(status_code):
+        """Lookup the HTTP reason text for a given status code.
+
+        :param status_code: int - HTTP status code
+
+        :returns: string - HTTP reason text
+        """
+        return get_reason_for_status(status_code)
+
+    @staticmethod
+    def get_body(body, encoding):
+        """Get the bytes of a response body held in memory.
+
+        File-like and iterable bodies are streamed through a BodyReader
+        instead.
+
+        :param body: string, bytes-like object, or None
+        :param encoding: encoding of a string body
+
+        :returns: bytes of the response body
+        """
+        if isinstance(body, str):
+            return body.encode(encoding)
+
+        return bytes(get_body_bytes(body))
+
+    def build_response(self, request, stackinabox_result, stream=False):
+        """Convert the result of Stack-In-A-Box to a requests.Response.
+
+        :param request: requests.PreparedRequest object
+        :param stackinabox_result: tuple - (int, dict, body) returned by
+                                   Stack-In-A-Box
+        :param stream: the body is read by the caller as a stream
+
+        :returns: requests.Response object
+        """
+        status_code, output_headers, body = stackinabox_result
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = self.get_reason_for_status(status_code)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+
+        if not isinstance(output_headers, CaseInsensitiveDict):
+            output_headers = CaseInsensitiveDict(output_headers)
+        response.headers = output_headers
+
+        encoding = get_encoding_from_headers(output_headers)
+        if isinstance(body, str) and encoding is None:
+            encoding = 'utf-8'
+        response.encoding = encoding
+
+        if get_body_bytes(body) is None:
+            # file-like objects, iterators and generators are only read as
+            # the response is consumed
+            response.raw = get_body_reader(body)
+        else:
+            content = self.get_body(body, encoding or 'utf-8')
+            response.raw = io.BytesIO(content)
+            if not stream and 'content-encoding' not in output_headers:
+                response._content = content
+                response._content_consumed = True
+
+        if 'content-encoding' in output_headers:
+            # compressed bodies are decoded by urllib3 as they are read, as
+            # they would be by the HTTPAdapter
+            response.raw = urllib3.HTTPResponse(
+                body=response.raw,
+                headers=output_headers,
+                status=status_code,
+                preload_content=False,
+                decode_content=True
+            )
+
+        # the session keeps the cookies of the response as well
+        if 'set-cookie' in output_headers:
+            response.raw._original_response = OriginalResponse(output_headers)
+            extract_cookies_to_jar(response.cookies, request, response.raw)
+
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        """Hand the request to Stack-In-A-Box.
+
+        :param request: requests.PreparedRequest object
+        :param stream: the body is read by the caller as a stream
+        :param timeout: unused
+        :param verify: unused
+        :param cert: unused
+        :param proxies: unused
+
+        :returns: requests.Response object
+        """
+        if trace.ENABLED:
+            trace.debug(logger, 'Adapter: %s - %s', request.method,
+                        request.url)
+        request.body_reader = BodyReader(request.body)
+        return self.build_response(
+            request,
+            StackInABox.call_into(request.method,
+                                  request,
+                                  request.url,
+                                  CaseInsensitiveDict()),
+            stream=stream
+        )
+
+
+def session_registration(uri, session):
+    """Register Stack-In-A-Box with a specific Session.
+
+    :param uri: base URI to match against
+    :param session: Python requests' Session object
+
+    :returns: StackInABoxAdapter instance mounted on the session
+    """
+    # log the URI that is used to access the Stack-In-A-Box services
+    logger.debug('Registering Stack-In-A-Box at {0} under Python Requests'
+                 .format(uri))
+    logger.debug('Session has id {0}'.format(id(session)))
+
+    # tell Stack-In-A-Box what URI to match with
+    StackInABox.update_uri(uri)
+
+    adapter = StackInABoxAdapter()
+
+    if not uri.endswith('/'):
+        uri += '/'
+
+    session.mount('http://{0}'.format(uri), adapter)
+    session.mount('https://{0}'.format(uri), adapter)
+    return adapter
+
+
+class SessionPatch(object):
+    """Patch of requests.Session.get_adapter.
+
+    While enabled, requests of any requests.Session, including those made
+    with `requests.get()` and friends, are handed to the adapter registered
+    with the StackInABox instance of the caller if they are for its URI.
+    All other requests are sent as usual.
+    """
+
+    HOLD_NAME = 'requests_adapter'
+
+    def __init__(self):
+        self.original_get_adapter = None
+
+    @property
+    def enabled(self):
+        """Is the patch applied?"""
+        return self.original_get_adapter is not None
+
+    def enable(self):
+        """Patch requests.Session.get_adapter.
+
+        :returns: n/a
+        """
+        if self.enabled:
+            return
+
+        logger.debug('Patching requests.Session')
+        original_get_adapter = requests.Session.get_adapter
+
+        def get_adapter(session, url):
+            registered = StackInABox.get_thread_instance().holds.get(
+                SessionPatch.HOLD_NAME
+            )
+            if registered is not None:
+                regex, adapter = registered
+                if regex.match(url):
+                    return adapter
+            return original_get_adapter(session, url)
+
+        self.original_get_adapter = original_get_adapter
+        requests.Session.get_adapter = get_adapter
+
+    def disable(self):
+        """Restore requests.Session.get_adapter.
+
+        :returns: n/a
+        """
+        if not self.enabled:
+            return
+
+        logger.debug('Restoring requests.Session')
+        requests.Session.get_adapter = self.original_get_adapter
+        self.original_get_adapter = None
+
+
+session_patch = SessionPatch()
+
+
+def enable():
+    """Hand requests of all requests Sessions to Stack-In-A-Box.
+
+    Only requests for a URI registered with registration() are handled by
+    Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    session_patch.enable()
+
+
+def disable():
+    """Stop handing requests of all requests Sessions to Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    session_patch.disable()
+
+
+def registration(uri):
+    """Python Requests handler registration.
+
+    Registers an adapter for a given URI with the StackInABox instance so
+    that requests of any requests Session can be intercepted and handed to
+    Stack-In-A-Box while enable() is in effect.
+
+    :param uri: URI used for the base of the HTTP requests
+
+    :returns: StackInABoxAdapter instance
+    """
+
+    # log the URI that is used to access the Stack-In-A-Box services
+    logger.debug('Registering Stack-In-A-Box at {0} under Python Requests'
+                 .format(uri))
+    # tell Stack-In-A-Box what URI to match with
+    StackInABox.update_uri(uri)
+
+    adapter = StackInABoxAdapter()
+    StackInABox.hold_onto(
+        SessionPatch.HOLD_NAME,
+        (
+            re.compile(r'(http)?s?(://)?{0}:?(\d+)?/'.format(uri), re.I),
+            adapter
+        ),
+        pinned=True
+    )
+    return adapter
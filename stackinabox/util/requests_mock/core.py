@@ -50,7 +50,7 @@ def session_registration(uri, session):
     StackInABox.update_uri(uri)
 
     # Create a Python Requests Adapter object for handling the session
-    StackInABox.hold_onto('adapter', requests_mock.Adapter())
+    StackInABox.hold_onto('adapter', requests_mock.Adapter(), pinned=True)
     # Add the Request handler object for the URI
     StackInABox.hold_out('adapter').add_matcher(
         reqcallable.RequestMockCallable(uri)
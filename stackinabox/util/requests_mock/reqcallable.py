@@ -7,7 +7,13 @@ import requests_mock.response
 import six
 
 from stackinabox.stack import StackInABox
-from stackinabox.util.tools import CaseInsensitiveDict
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    get_body_bytes,
+    get_body_reader
+)
 
 logger = logging.getLogger(__name__)
 
@@ -96,6 +102,7 @@ class RequestMockCallable(object):
         request_headers = CaseInsensitiveDict()
         request_headers.update(request.headers)
         request.headers = request_headers
+        request.body_reader = BodyReader(getattr(request, 'body', None))
         stackinabox_result = StackInABox.call_into(method,
                                                    request,
                                                    uri,
@@ -110,20 +117,29 @@ class RequestMockCallable(object):
 
         # if the body is a string-type...
         if isinstance(body, six.string_types):
-            logger.debug('running text result')
+            if trace.ENABLED:
+                trace.debug(logger, 'running text result')
             # Try to convert it to JSON
             text_data = body
 
         # if the body is binary, then it's the content
         elif isinstance(body, six.binary_type):
-            logger.debug('running binary result')
+            if trace.ENABLED:
+                trace.debug(logger, 'running binary result')
             content_data = body
 
-        # by default, it's just body data
+        # in-memory bodies of other types are the content
+        elif get_body_bytes(body) is not None:
+            if trace.ENABLED:
+                trace.debug(logger, 'running content result')
+            content_data = bytes(get_body_bytes(body))
+
+        # otherwise the body is streamed from a file-like object, iterator
+        # or generator as the response is read
         else:
-            # default to body data
-            logger.debug('running default result')
-            body_data = body
+            if trace.ENABLED:
+                trace.debug(logger, 'running streamed result')
+            body_data = get_body_reader(body)
 
         # build the Python requests' Response object
         # `raw` and `json` parameters shouldn't be used
@@ -10,7 +10,12 @@ import responses
 
 from stackinabox.stack import StackInABox
 from stackinabox.util import deprecator
-from stackinabox.util.tools import CaseInsensitiveDict
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    get_body_bytes,
+    get_body_reader
+)
 
 
 logger = logging.getLogger(__name__)
@@ -24,21 +29,32 @@ def responses_callback(request):
 
     :param request: request object
 
-    :returns: tuple - (int, dict, string) containing:
+    :returns: tuple - (int, dict, body) containing:
                       int - the HTTP response status code
                       dict - the headers for the HTTP response
-                      string - HTTP string response
+                      body - HTTP string or bytes response, or a
+                             io.BufferedReader streaming the body returned
+                             by the service
     """
     method = request.method
     headers = CaseInsensitiveDict()
     request_headers = CaseInsensitiveDict()
     request_headers.update(request.headers)
     request.headers = request_headers
+    request.body_reader = BodyReader(request.body)
     uri = request.url
-    return StackInABox.call_into(method,
-                                 request,
-                                 uri,
-                                 headers)
+    status_code, output_headers, body = StackInABox.call_into(method,
+                                                              request,
+                                                              uri,
+                                                              headers)
+
+    # Responses only streams bodies it gets as buffered readers
+    content = get_body_bytes(body)
+    if content is None:
+        body = get_body_reader(body)
+    elif not isinstance(content, bytes):
+        body = bytes(content)
+    return (status_code, output_headers, body)
 
 
 def registration(uri):
@@ -1 +1,23 @@
 from stackinabox.util.tools.caseinsensitivedict import CaseInsensitiveDict
+from stackinabox.util.tools.compression import Compression
+from stackinabox.util.tools.conditional import ConditionalRequests
+from stackinabox.util.tools.fileresponse import FileResponse
+from stackinabox.util.tools.holdstore import HoldStore
+from stackinabox.util.tools.lrucache import LRUCache
+from stackinabox.util.tools.ranges import (
+    get_body_view,
+    get_range_response,
+    parse_range
+)
+from stackinabox.util.tools.streaming import (
+    CHUNK_SIZE,
+    BodyReader,
+    IterableReader,
+    close_body,
+    close_body_async,
+    get_body_bytes,
+    get_body_length,
+    get_body_reader,
+    iterate_body,
+    iterate_body_async
+)
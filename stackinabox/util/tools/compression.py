@@ -0,0 +1,275 @@
+"""
+Stack-In-A-Box: Response Compression
+"""
+import gzip
+import zlib
+
+from stackinabox.util.tools.lrucache import LRUCache
+from stackinabox.util.tools.streaming import get_body_bytes
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# content types that are already compressed
+COMPRESSED_CONTENT_TYPES = (
+    'application/gzip',
+    'application/x-gzip',
+    'application/zip',
+    'audio/',
+    'image/',
+    'video/',
+)
+
+# status codes of responses that never have a body, or whose body is part
+# of a representation that must not be encoded again
+UNCOMPRESSED_STATUS_CODES = (204, 206, 304, 416)
+
+
+def compress_gzip(content, level):
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def compress_deflate(content, level):
+    return zlib.compress(content, level)
+
+
+def compress_brotli(content, level):
+    # brotli qualities range from 0 to 11 instead of 0 to 9
+    return brotli.compress(bytes(content), quality=min(11, level + 2))
+
+
+def get_encoders():
+    """Get the content codings that responses may be compressed with.
+
+    :returns: dict of the content codings and their compression functions,
+              in order of preference
+    """
+    encoders = {}
+    if brotli is not None:
+        encoders['br'] = compress_brotli
+    encoders['gzip'] = compress_gzip
+    encoders['deflate'] = compress_deflate
+    return encoders
+
+
+def parse_accept_encoding(value):
+    """Parse the value of an Accept-Encoding header.
+
+    :param value: value of the Accept-Encoding header, f.e 'gzip;q=0.8, br'
+
+    :returns: dict of the lower case content codings and their qualities
+    """
+    codings = {}
+    for item in value.split(','):
+        coding, _, parameters = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            name, _, parameter_value = parameter.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(parameter_value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def negotiate_encoding(value, encodings):
+    """Choose the content coding of a response.
+
+    :param value: value of the Accept-Encoding header of the request
+    :param encodings: content codings available in order of preference
+
+    :returns: string - the preferred content coding accepted with the
+              highest quality, or None to send the response as it is
+    """
+    codings = parse_accept_encoding(value)
+    wildcard = codings.get('*', 0.0)
+    best = None
+    best_quality = 0.0
+    for encoding in encodings:
+        quality = codings.get(encoding, wildcard)
+        if quality > best_quality:
+            best = encoding
+            best_quality = quality
+    return best
+
+
+def add_vary(headers):
+    """Add Accept-Encoding to the Vary header of a response.
+
+    :param headers: headers of the response, updated in place
+
+    :returns: n/a
+    """
+    vary = headers.get('Vary')
+    if not vary:
+        headers['Vary'] = 'Accept-Encoding'
+    elif 'accept-encoding' not in vary.lower() and vary != '*':
+        headers['Vary'] = '{0}, Accept-Encoding'.format(vary)
+
+
+def weaken_etag(headers):
+    """Turn the strong ETag of a response into a weak one.
+
+    The encoded body is only semantically equivalent to the body the strong
+    ETag was computed for.
+
+    :param headers: headers of the response, updated in place
+
+    :returns: n/a
+    """
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        headers['ETag'] = 'W/{0}'.format(etag)
+
+
+class Compression(object):
+    """Compresses the responses of a service as the client accepts it.
+
+    Responses whose bodies are held in memory are encoded with brotli (if
+    the brotli package is installed), gzip, or deflate, whichever the
+    Accept-Encoding of the request prefers. Streamed bodies, small bodies,
+    bodies of content types that are already compressed, partial
+    responses, and responses that already have a Content-Encoding are sent
+    as they are.
+
+    The compressed bytes of strings and bytes are cached by the identity of
+    the body objects, so handlers returning the same fixture over and over
+    again only have it compressed once per content coding.
+    """
+
+    def __init__(self, maxsize=128, min_size=256, level=6):
+        """Initialize the compression.
+
+        :param maxsize: maximum number of compressed bodies to cache
+        :param min_size: minimum size in bytes of the bodies to compress
+        :param level: compression level from 1 (fastest) to 9 (smallest)
+
+        :raises: ValueError if maxsize is less than 1
+        """
+        self.cache = LRUCache(maxsize)
+        self.min_size = min_size
+        self.level = level
+        self.encoders = get_encoders()
+
+    def compress(self, body, encoding):
+        """Compress a body.
+
+        :param body: string or bytes-like body held in memory
+        :param encoding: content coding to compress the body with
+
+        :returns: bytes of the compressed body
+        """
+        # only immutable bodies are cached, the cache holds on to them so
+        # their ids cannot be reused
+        immutable = isinstance(body, (str, bytes))
+        key = (id(body), encoding)
+        if immutable:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] is body:
+                return cached[1]
+
+        compressed = self.encoders[encoding](get_body_bytes(body),
+                                             self.level)
+        if immutable:
+            self.cache.put(key, (body, compressed))
+        return compressed
+
+    def is_compressible(self, status_code, headers, content):
+        """Check whether a response may be compressed.
+
+        :param status_code: status code of the response
+        :param headers: headers of the response
+        :param content: bytes-like body of the response, None if it is
+                        streamed
+
+        :returns: boolean
+        """
+        if content is None or len(content) < self.min_size:
+            return False
+        if status_code in UNCOMPRESSED_STATUS_CODES or status_code < 200:
+            return False
+        if 'Content-Encoding' in headers or 'Content-Range' in headers:
+            return False
+
+        content_type = (headers.get('Content-Type') or '').lower()
+        return not content_type.startswith(COMPRESSED_CONTENT_TYPES)
+
+    def negotiate(self, request_headers):
+        """Choose the content coding of the response to a request.
+
+        :param request_headers: case-insensitive headers of the request
+
+        :returns: string - the content coding, or None to send the response
+                  as it is
+        """
+        return negotiate_encoding(
+            request_headers.get('Accept-Encoding') or '', self.encoders
+        )
+
+    def update_not_modified(self, request_headers, headers):
+        """Give a 304 Not Modified the headers of the compressible response
+        it stands for.
+
+        :param request_headers: case-insensitive headers of the request
+        :param headers: headers of the 304 Not Modified, updated with the
+                        Vary and ETag the full response would have
+
+        :returns: n/a
+        """
+        add_vary(headers)
+        if self.negotiate(request_headers) is not None:
+            weaken_etag(headers)
+
+    def update(self, request_headers, result):
+        """Compress the response of a handler.
+
+        :param request_headers: case-insensitive headers of the request, may
+                                be None
+        :param result: tuple - (int, dict, body) returned by the handler
+
+        :returns: tuple - (int, dict, body) of the response, with the
+                  compressed body, Content-Encoding, and Vary if the client
+                  accepts any of the available content codings
+        """
+        status_code, headers, body = result
+        if (
+            request_headers is None or
+            not self.is_compressible(status_code,
+                                     headers,
+                                     get_body_bytes(body))
+        ):
+            return result
+
+        encoding = self.negotiate(request_headers)
+        add_vary(headers)
+        if encoding is None:
+            return result
+
+        compressed = self.compress(body, encoding)
+        headers['Content-Encoding'] = encoding
+        if 'Content-Length' in headers:
+            headers['Content-Length'] = str(len(compressed))
+        # ranges would be of the encoded body, but are served from the
+        # body the handler returned
+        if 'Accept-Ranges' in headers:
+            del headers['Accept-Ranges']
+
+        weaken_etag(headers)
+        return (status_code, headers, compressed)
+
+    def info(self):
+        """Statistics of the cache of compressed bodies.
+
+        :returns: dict with the hits, misses, evictions, maxsize, and
+                  currsize of the cache
+        """
+        return self.cache.info()
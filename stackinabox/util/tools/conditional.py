@@ -0,0 +1,288 @@
+"""
+Stack-In-A-Box: Conditional Requests
+"""
+import datetime
+import email.utils
+import hashlib
+import os
+
+from stackinabox.util.tools.fileresponse import FileResponse
+from stackinabox.util.tools.lrucache import LRUCache
+from stackinabox.util.tools.streaming import close_body, get_body_bytes
+
+
+# methods whose responses are answered with 304 Not Modified
+CONDITIONAL_METHODS = ('GET', 'HEAD')
+
+# methods that never change what a service responds
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+# headers a 304 Not Modified response carries over from the full response
+VALIDATOR_HEADERS = (
+    'Cache-Control',
+    'Content-Location',
+    'ETag',
+    'Expires',
+    'Last-Modified',
+    'Vary',
+)
+
+
+def parse_http_date(value):
+    """Parse an HTTP date.
+
+    :param value: date as sent in headers, f.e Last-Modified
+
+    :returns: timezone aware datetime, or None if the date is malformed
+    """
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date
+
+
+def etag_matches(if_none_match, etag):
+    """Compare the entity tags of If-None-Match with an ETag.
+
+    The weak comparison is used as RFC 7232 requires for If-None-Match.
+
+    :param if_none_match: value of the If-None-Match header
+    :param etag: ETag of the response, may be None
+
+    :returns: boolean - True if any of the entity tags matches
+    """
+    if if_none_match.strip() == '*':
+        return True
+    if not etag:
+        return False
+
+    if etag.startswith('W/'):
+        etag = etag[2:]
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def is_not_modified(request_headers, validators):
+    """Evaluate the preconditions of a conditional request.
+
+    If-Modified-Since is only evaluated without an If-None-Match.
+
+    :param request_headers: case-insensitive headers of the request
+    :param validators: dict of the validator headers of the response
+
+    :returns: boolean - True if the response may be 304 Not Modified
+    """
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, validators.get('ETag'))
+
+    if_modified_since = request_headers.get('If-Modified-Since')
+    last_modified = validators.get('Last-Modified')
+    if not if_modified_since or not last_modified:
+        return False
+
+    if_modified_since = parse_http_date(if_modified_since)
+    last_modified = parse_http_date(last_modified)
+    if if_modified_since is None or last_modified is None:
+        return False
+    return last_modified <= if_modified_since
+
+
+class ConditionalRequests(object):
+    """Answers the conditional requests of a service with 304 Not Modified.
+
+    Successful GET responses get a strong ETag unless the handler set one:
+    a hash of bodies held in memory, or the identity of the file and range
+    of a FileResponse, which also gets a Last-Modified. The ETags of
+    strings and bytes are cached by the identity of the body objects, so
+    handlers returning the same fixture over and over again only have it
+    hashed once.
+
+    The validators of the last response of each URI are kept as well. A
+    GET or HEAD request whose If-None-Match or If-Modified-Since matches
+    them is answered without calling the handler. When the responses are
+    compressed, a 304 Not Modified carries the Vary and weak ETag the
+    compressed response would have had. Any request with a
+    method other than GET, HEAD, OPTIONS, or TRACE may change the
+    resources of the service and drops the validators; services changing
+    their responses any other way have to call clear().
+    """
+
+    def __init__(self, maxsize=128):
+        """Initialize the caches.
+
+        :param maxsize: maximum number of ETags and of URIs to cache
+                        validators for, the least recently used ones are
+                        evicted first
+
+        :raises: ValueError if maxsize is less than 1
+        """
+        self.etags = LRUCache(maxsize)
+        self.validators = LRUCache(maxsize)
+        self.not_modified = 0
+
+    def clear(self):
+        """Forget the validators of all URIs.
+
+        :returns: n/a
+        """
+        self.validators.clear()
+
+    def get_etag(self, body):
+        """Get the strong ETag of a body.
+
+        :param body: body returned by a service
+
+        :returns: string - quoted entity tag, or None for streamed bodies
+        """
+        if isinstance(body, FileResponse):
+            stat = os.fstat(body.file.fileno())
+            return '"{0:x}-{1:x}-{2:x}-{3:x}"'.format(stat.st_ino,
+                                                      stat.st_mtime_ns,
+                                                      body.offset,
+                                                      len(body))
+
+        # only immutable bodies are cached, the cache holds on to them so
+        # their ids cannot be reused
+        immutable = isinstance(body, (str, bytes))
+        if immutable:
+            cached = self.etags.get(id(body))
+            if cached is not None and cached[0] is body:
+                return cached[1]
+
+        content = get_body_bytes(body)
+        if content is None:
+            return None
+
+        etag = '"{0}"'.format(
+            hashlib.blake2b(content, digest_size=16).hexdigest()
+        )
+        if immutable:
+            self.etags.put(id(body), (body, etag))
+        return etag
+
+    def get_validators(self, headers, body):
+        """Get the validators of a response, adding any that are missing.
+
+        :param headers: headers of the response, updated with the ETag and
+                        Last-Modified found for the body
+        :param body: body of the response
+
+        :returns: dict of the validator headers of the response
+        """
+        if 'ETag' not in headers:
+            etag = self.get_etag(body)
+            if etag is not None:
+                headers['ETag'] = etag
+
+        if 'Last-Modified' not in headers and isinstance(body, FileResponse):
+            headers['Last-Modified'] = email.utils.formatdate(
+                os.fstat(body.file.fileno()).st_mtime, usegmt=True
+            )
+
+        return {
+            name: headers[name] for name in VALIDATOR_HEADERS
+            if name in headers
+        }
+
+    def check(self, method, request_headers, uri, headers,
+              compression=None):
+        """Answer a conditional request from the cached validators.
+
+        :param method: string - HTTP Verb of the request
+        :param request_headers: case-insensitive headers of the request, may
+                                be None
+        :param uri: URI of the request
+        :param headers: headers for the response
+        :param compression: Compression of the responses, if any
+
+        :returns: tuple - (304, dict, '') if the resource has not been
+                  modified, otherwise None and the handler has to be called
+        """
+        if method not in CONDITIONAL_METHODS or request_headers is None:
+            return None
+        if (
+            'If-None-Match' not in request_headers and
+            'If-Modified-Since' not in request_headers
+        ):
+            return None
+
+        cached = self.validators.get(uri)
+        if cached is None:
+            return None
+        validators, compressible = cached
+        if not is_not_modified(request_headers, validators):
+            return None
+
+        self.not_modified += 1
+        headers.update(validators)
+        if compressible and compression is not None:
+            compression.update_not_modified(request_headers, headers)
+        return (304, headers, '')
+
+    def update(self, method, request_headers, uri, result,
+               compression=None):
+        """Validate the response of a handler.
+
+        :param method: string - HTTP Verb of the request
+        :param request_headers: case-insensitive headers of the request, may
+                                be None
+        :param uri: URI of the request
+        :param result: tuple - (int, dict, body) returned by the handler
+        :param compression: Compression the response is going to be
+                            compressed with, if any
+
+        :returns: tuple - (int, dict, body) of the response, with the
+                  validators added, or 304 Not Modified if the request's
+                  preconditions match them
+        """
+        status_code, headers, body = result
+        if method not in SAFE_METHODS:
+            self.clear()
+            return result
+
+        # HEAD responses may not have the body the ETag is computed from
+        if method != 'GET' or status_code != 200:
+            return result
+
+        validators = self.get_validators(headers, body)
+        if 'ETag' not in validators and 'Last-Modified' not in validators:
+            return result
+        # the headers of the compressed response depend on the request, so
+        # only whether it is compressed at all is kept
+        compressible = compression is not None and (
+            compression.is_compressible(status_code,
+                                        headers,
+                                        get_body_bytes(body))
+        )
+        self.validators.put(uri, (validators, compressible))
+
+        if request_headers is not None and is_not_modified(request_headers,
+                                                           validators):
+            close_body(body)
+            if compressible:
+                compression.update_not_modified(request_headers, headers)
+            return (304, headers, '')
+        return result
+
+    def info(self):
+        """Statistics of the caches.
+
+        :returns: dict with the info() of the `etags` and `validators`
+                  caches and the number of requests answered with 304
+                  without calling the handler
+        """
+        return {
+            'etags': self.etags.info(),
+            'validators': self.validators.info(),
+            'not_modified': self.not_modified,
+        }
@@ -0,0 +1,143 @@
+"""
+Stack-In-A-Box: File Responses
+"""
+import mmap
+import os
+
+
+class FileResponse(object):
+    """Response body served from a file on disk without reading it into
+    memory.
+
+    Handlers return it in place of the bytes of the file:
+
+        def fixture(self, request, uri, headers):
+            return (200, headers, FileResponse('fixtures/large.bin'))
+
+    The loopback server sends it with `os.sendfile`, and the ASGI
+    application with the `http.response.zerocopysend` extension when the
+    ASGI server supports it. Everywhere else the file is memory-mapped and
+    its chunks are memoryviews of the mapping, so the only copy made is
+    the one into the buffers of the client.
+
+    The response is closed once it has been sent.
+    """
+
+    def __init__(self, file, offset=0, length=None):
+        """Initialize the response.
+
+        :param file: path of the file, or a file object opened in binary
+                     mode, which is closed with the response
+        :param offset: position in the file of the first byte of the body
+        :param length: number of bytes of the body, defaults to the rest of
+                       the file
+
+        :raises: ValueError if the body does not lie within the file
+        """
+        if isinstance(file, (str, bytes, os.PathLike)):
+            file = open(file, 'rb')
+
+        self.file = file
+        size = os.fstat(file.fileno()).st_size
+        if length is None:
+            length = size - offset
+
+        if offset < 0 or length < 0 or offset + length > size:
+            file.close()
+            raise ValueError(
+                'FileResponse range {0}+{1} lies outside of the {2} bytes of '
+                'the file'.format(offset, length, size)
+            )
+
+        self.offset = offset
+        self.length = length
+        self.position = 0
+        self.__mapping = None
+        self.__view = None
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def view(self):
+        """memoryview of the body, mapping the file into memory on first
+        use
+        """
+        if self.__view is None:
+            if self.length:
+                self.__mapping = mmap.mmap(self.file.fileno(), 0,
+                                           access=mmap.ACCESS_READ)
+                self.__view = memoryview(self.__mapping)[
+                    self.offset:self.offset + self.length
+                ]
+            else:
+                # empty files cannot be mapped
+                self.__view = memoryview(b'')
+        return self.__view
+
+    def slice(self, start=None, stop=None):
+        """Get a part of the body as a response of its own.
+
+        The parts share the file on disk but not the file object, so each
+        of them may be sent and closed on its own.
+
+        :param start: index of the first byte, negative indices count from
+                      the end of the body as for slices
+        :param stop: index after the last byte
+
+        :returns: FileResponse of the part of the body
+        """
+        indices = range(self.length)[start:stop]
+        return FileResponse(os.fdopen(os.dup(self.file.fileno()), 'rb'),
+                            self.offset + indices.start,
+                            len(indices))
+
+    def read(self, size=-1):
+        """Read the next bytes of the body.
+
+        :param size: number of bytes to read, all of the rest of the body if
+                     negative or None
+
+        :returns: bytes
+        """
+        end = self.length
+        if size is not None and size >= 0:
+            end = min(end, self.position + size)
+        chunk = bytes(self.view[self.position:end])
+        self.position = max(self.position, end)
+        return chunk
+
+    def iter_chunks(self, chunk_size):
+        """Iterate over the rest of the body.
+
+        :param chunk_size: maximum size of the chunks
+
+        :returns: iterator of memoryviews of the mapped file
+        """
+        view = self.view
+        while self.position < self.length:
+            chunk = view[self.position:self.position + chunk_size]
+            self.position += len(chunk)
+            yield chunk
+
+    def close(self):
+        """Unmap and close the file.
+
+        The mapping stays open for as long as memoryviews of it are still
+        used elsewhere.
+        """
+        if self.__mapping is not None:
+            try:
+                self.__view.release()
+                self.__mapping.close()
+            except BufferError:
+                pass
+            self.__mapping = None
+        self.__view = None
+        self.file.close()
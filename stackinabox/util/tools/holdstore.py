@@ -0,0 +1,245 @@
+"""
+Stack-In-A-Box: Bounded Hold Store
+"""
+import collections
+import collections.abc
+import sys
+import threading
+import time
+
+
+class HoldStore(collections.abc.MutableMapping):
+    """Bounded storage for the holds of a StackInABox instance.
+
+    The store behaves like the dict StackInABox holds data in by default,
+    but can be given budgets so long running tests stashing everything
+    they create do not grow without limit:
+
+        StackInABox.use_hold_store(
+            HoldStore(max_entries=10000, max_bytes=64 * 1024 * 1024,
+                      ttl=300)
+        )
+
+    Once the store holds more than `max_entries` entries, or the sizes of
+    its values add up to more than `max_bytes`, the least recently used
+    entries are evicted. Entries older than `ttl` seconds expire whether or
+    not the store is full. The size of a value is only as accurate as the
+    `sizer`; the default sys.getsizeof does not include the objects a value
+    refers to.
+
+    Entries stored with pin(), such as the adapters and URI patterns the
+    utilities register, are never evicted or expired and do not count
+    against the budgets, so the requests are still intercepted however
+    much data the services hold.
+
+    Lookups are counted as hits or misses, and evicted or expired entries
+    as evictions. Lookups of pinned entries are not counted, so the
+    utilities finding their registration on every request do not skew the
+    counts of the data the services hold. The store may be shared between
+    threads.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None,
+                 sizer=sys.getsizeof, clock=time.monotonic):
+        """Initialize the store.
+
+        :param max_entries: maximum number of entries held, None for no
+                            limit
+        :param max_bytes: maximum total size of the values held in bytes,
+                          None for no limit
+        :param ttl: seconds after which an entry expires once stored, None
+                    to keep entries until they are evicted
+        :param sizer: callable returning the size of a value in bytes
+        :param clock: callable returning the current time in seconds
+
+        :raises: ValueError if any of the limits is less than 1
+        """
+        for name, limit in (('max_entries', max_entries),
+                            ('max_bytes', max_bytes),
+                            ('ttl', ttl)):
+            if limit is not None and limit <= 0:
+                raise ValueError(
+                    'HoldStore {0} must be positive, not {1}'.format(name,
+                                                                     limit)
+                )
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizer = sizer
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.currbytes = 0
+        # key -> (value, size) in order of use
+        self.__data = collections.OrderedDict()
+        # key -> expiry time in order of storing, which with a fixed ttl is
+        # also the order the entries expire in
+        self.__expiries = collections.OrderedDict()
+        # key -> value of the entries outside of the budgets
+        self.__pinned = {}
+        self.__lock = threading.RLock()
+
+    def __remove(self, key):
+        _, size = self.__data.pop(key)
+        self.__expiries.pop(key, None)
+        self.currbytes -= size
+
+    def __expire(self):
+        if self.ttl is None:
+            return
+
+        now = self.clock()
+        while self.__expiries:
+            key, expiry = next(iter(self.__expiries.items()))
+            if expiry > now:
+                break
+            self.__remove(key)
+            self.evictions += 1
+
+    @property
+    def pinned(self):
+        """Keys of the entries stored with pin()."""
+        with self.__lock:
+            return frozenset(self.__pinned)
+
+    def pin(self, key, value):
+        """Store an entry that is never evicted or expired.
+
+        The entry does not count against the budgets of the store, nor are
+        its lookups counted; it is only removed by deleting it or clearing
+        the store.
+
+        :param key: key to store the value under
+        :param value: value to store
+        :returns: n/a
+        """
+        with self.__lock:
+            if key in self.__data:
+                self.__remove(key)
+            self.__pinned[key] = value
+
+    def __getitem__(self, key):
+        with self.__lock:
+            if key in self.__pinned:
+                return self.__pinned[key]
+
+            self.__expire()
+            try:
+                value, _ = self.__data[key]
+            except KeyError:
+                self.misses += 1
+                raise
+
+            self.__data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        with self.__lock:
+            if key in self.__pinned:
+                self.__pinned[key] = value
+                return
+
+        size = self.sizer(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            raise ValueError(
+                'HoldStore cannot hold {0} of {1} bytes, max_bytes is '
+                '{2}'.format(key, size, self.max_bytes)
+            )
+
+        with self.__lock:
+            if key in self.__data:
+                self.__remove(key)
+            self.__data[key] = (value, size)
+            self.currbytes += size
+            if self.ttl is not None:
+                self.__expiries[key] = self.clock() + self.ttl
+
+            self.__expire()
+            while (
+                (self.max_entries is not None and
+                 len(self.__data) > self.max_entries) or
+                (self.max_bytes is not None and
+                 self.currbytes > self.max_bytes)
+            ):
+                self.__remove(next(iter(self.__data)))
+                self.evictions += 1
+
+    def __delitem__(self, key):
+        with self.__lock:
+            if key in self.__pinned:
+                del self.__pinned[key]
+            else:
+                self.__remove(key)
+
+    def __contains__(self, key):
+        # membership tests are neither counted nor change the order of use
+        with self.__lock:
+            self.__expire()
+            return key in self.__pinned or key in self.__data
+
+    def __iter__(self):
+        with self.__lock:
+            self.__expire()
+            return iter(list(self.__pinned) + list(self.__data))
+
+    def __len__(self):
+        with self.__lock:
+            self.__expire()
+            return len(self.__pinned) + len(self.__data)
+
+    def __eq__(self, other):
+        if not isinstance(other, collections.abc.Mapping):
+            return NotImplemented
+        return self.copy() == dict(other.items())
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, self.copy())
+
+    def copy(self):
+        """Get the entries held without counting them as lookups.
+
+        :returns: dict of the entries held
+        """
+        with self.__lock:
+            self.__expire()
+            entries = dict(self.__pinned)
+            entries.update(
+                (key, value) for key, (value, _) in self.__data.items()
+            )
+            return entries
+
+    def clear(self):
+        """Remove all entries; the hit, miss, and eviction counts are kept.
+
+        :returns: n/a
+        """
+        with self.__lock:
+            self.__pinned.clear()
+            self.__data.clear()
+            self.__expiries.clear()
+            self.currbytes = 0
+
+    def info(self):
+        """Statistics of the store.
+
+        :returns: dict with the hits, misses, evictions, max_entries,
+                  max_bytes, ttl, currsize, and currbytes of the store, and
+                  the number of pinned entries, which are not included in
+                  currsize
+        """
+        with self.__lock:
+            self.__expire()
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'currsize': len(self.__data),
+                'currbytes': self.currbytes,
+                'pinned': len(self.__pinned),
+            }
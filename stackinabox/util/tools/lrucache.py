@@ -0,0 +1,95 @@
+"""
+Stack-In-A-Box: Least Recently Used Cache
+"""
+import collections
+import threading
+
+
+class LRUCache(object):
+    """Bounded Least Recently Used cache.
+
+    Once the cache holds `maxsize` entries, adding another entry evicts the
+    least recently used one. Lookups are counted as hits or misses.
+
+    The cache may be shared between threads.
+    """
+
+    def __init__(self, maxsize=128):
+        """Initialize the cache.
+
+        :param maxsize: maximum number of entries held by the cache
+
+        :raises: ValueError if maxsize is less than 1
+        """
+        if maxsize < 1:
+            raise ValueError(
+                'LRUCache maxsize must be at least 1, not {0}'.format(maxsize)
+            )
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__data = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return key in self.__data
+
+    def get(self, key, default=None):
+        """Look up a key, marking it as the most recently used.
+
+        :param key: key to look up
+        :param default: value returned if the key is not cached
+
+        :returns: the cached value, or default
+        """
+        with self.__lock:
+            try:
+                value = self.__data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.__data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache a value, evicting the least recently used entry if full.
+
+        :param key: key to cache the value under
+        :param value: value to cache
+        :returns: n/a
+        """
+        with self.__lock:
+            self.__data[key] = value
+            self.__data.move_to_end(key)
+            while len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all entries; the hit, miss, and eviction counts are kept.
+
+        :returns: n/a
+        """
+        with self.__lock:
+            self.__data.clear()
+
+    def info(self):
+        """Statistics of the cache.
+
+        :returns: dict with the hits, misses, evictions, maxsize, and
+                  currsize of the cache
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'maxsize': self.maxsize,
+            'currsize': len(self.__data),
+        }
@@ -0,0 +1,209 @@
+"""
+Stack-In-A-Box: Range Requests
+"""
+import io
+import mmap
+import os
+import stat
+import uuid
+
+from stackinabox.util.tools.fileresponse import FileResponse
+from stackinabox.util.tools.streaming import get_body_bytes, get_body_length
+
+
+def parse_range(value, length):
+    """Parse the value of a Range header.
+
+    :param value: value of the Range header, f.e 'bytes=0-499,-500'
+    :param length: length of the body in bytes
+
+    :returns: list of (start, stop) tuples of the satisfiable ranges in the
+              order requested, an empty list if none of the ranges can be
+              satisfied, or None if the header is malformed or not in bytes
+              and has to be ignored
+    """
+    unit, _, specs = value.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+
+        first, dash, last = spec.partition('-')
+        first = first.strip()
+        last = last.strip()
+        if not dash or not (first or last):
+            return None
+        if not (first or '0').isdigit() or not (last or '0').isdigit():
+            return None
+
+        if not first:
+            # suffix range of the last bytes of the body
+            suffix = int(last)
+            if suffix > 0 and length > 0:
+                ranges.append((max(0, length - suffix), length))
+            continue
+
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < length:
+            stop = length if not last else min(int(last) + 1, length)
+            ranges.append((start, stop))
+
+    return ranges
+
+
+def get_body_view(body):
+    """Get a body whose byte ranges can be sliced without copying it.
+
+    :param body: body returned by a service
+
+    :returns: memoryview or FileResponse of the body, or None if the length
+              of the body is not known before it is streamed. Files are
+              wrapped into a FileResponse taking them over.
+    """
+    content = get_body_bytes(body)
+    if content is not None:
+        return memoryview(content).cast('B')
+
+    if isinstance(body, FileResponse):
+        return body
+
+    if isinstance(body, mmap.mmap):
+        return memoryview(body)
+
+    if isinstance(body, io.BytesIO):
+        return body.getbuffer()[body.tell():]
+
+    if isinstance(body, (io.BufferedReader, io.FileIO)):
+        try:
+            if (
+                body.seekable() and
+                stat.S_ISREG(os.fstat(body.fileno()).st_mode)
+            ):
+                return FileResponse(body, body.tell())
+        except (OSError, ValueError):
+            pass
+
+    return None
+
+
+def is_range_current(if_range, headers):
+    """Check the If-Range precondition of a Range request.
+
+    :param if_range: value of the If-Range header, None if there is none
+    :param headers: headers of the response
+
+    :returns: boolean - True if the ranges may be served, False if the full
+              body has to be sent as the representation changed
+    """
+    if if_range is None:
+        return True
+
+    if_range = if_range.strip()
+    if if_range.startswith('W/'):
+        # weak entity tags never match
+        return False
+    return if_range in (headers.get('ETag'), headers.get('Last-Modified'))
+
+
+def get_range_response(method, request_headers, result):
+    """Answer a Range request with the requested byte ranges of a response.
+
+    Only successful GET responses whose length is known before they are
+    sent are answered in part: bytes, strings, memoryviews, mmaps, BytesIO,
+    regular files, and FileResponse. The ranges are memoryview slices of
+    the body, or FileResponse slices of files, so the body is never copied.
+
+    :param method: string - HTTP Verb of the request
+    :param request_headers: case-insensitive headers of the request, may be
+                            None
+    :param result: tuple - (int, dict, body) returned by the service
+
+    :returns: tuple - (int, dict, body) of the response, 206 with the
+              ranges, 416 if none of the ranges can be satisfied, or the
+              result unchanged
+    """
+    status_code, headers, body = result
+    if method != 'GET' or status_code != 200:
+        return result
+
+    value = (
+        request_headers.get('Range') if request_headers is not None
+        else None
+    )
+    if not value or not is_range_current(request_headers.get('If-Range'),
+                                         headers):
+        if get_body_length(body) is not None:
+            headers['Accept-Ranges'] = 'bytes'
+        return result
+
+    view = get_body_view(body)
+    if view is None:
+        return result
+
+    headers['Accept-Ranges'] = 'bytes'
+    length = len(view)
+    ranges = parse_range(value, length)
+    if ranges is None:
+        # files have been taken over by the FileResponse
+        if isinstance(view, FileResponse):
+            body = view
+        return (status_code, headers, body)
+
+    if not ranges:
+        if isinstance(view, FileResponse):
+            view.close()
+        if 'Content-Length' in headers:
+            del headers['Content-Length']
+        headers['Content-Range'] = 'bytes */{0}'.format(length)
+        return (416, headers, b'')
+
+    if len(ranges) == 1:
+        start, stop = ranges[0]
+        if isinstance(view, FileResponse):
+            with view:
+                part = view.slice(start, stop)
+        else:
+            part = view[start:stop]
+        if 'Content-Length' in headers:
+            headers['Content-Length'] = str(stop - start)
+        headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+            start, stop - 1, length
+        )
+        return (206, headers, part)
+
+    # several ranges of a file are sent as memoryviews of the mapped file,
+    # which remain valid once the file is closed
+    file_response = None
+    if isinstance(view, FileResponse):
+        file_response = view
+        view = file_response.view
+
+    boundary = uuid.uuid4().hex
+    part_head = '--{0}\r\n'.format(boundary)
+    if headers.get('Content-Type'):
+        part_head += 'Content-Type: {0}\r\n'.format(headers['Content-Type'])
+
+    parts = []
+    for start, stop in ranges:
+        parts.append(
+            '{0}Content-Range: bytes {1}-{2}/{3}\r\n\r\n'.format(
+                part_head, start, stop - 1, length
+            ).encode('latin-1')
+        )
+        parts.append(view[start:stop])
+        parts.append(b'\r\n')
+    parts.append('--{0}--\r\n'.format(boundary).encode('latin-1'))
+    if file_response is not None:
+        file_response.close()
+
+    headers['Content-Type'] = (
+        'multipart/byteranges; boundary={0}'.format(boundary)
+    )
+    headers['Content-Length'] = str(sum(len(part) for part in parts))
+    return (206, headers, iter(parts))
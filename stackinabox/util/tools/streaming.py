@@ -0,0 +1,359 @@
+"""
+Stack-In-A-Box: Streamed Bodies
+"""
+import collections.abc as collections
+import io
+
+from stackinabox.util.tools.fileresponse import FileResponse
+
+
+# size of the chunks read from file-like bodies
+CHUNK_SIZE = 2 ** 16
+
+
+def get_body_bytes(body):
+    """Get the bytes of a body held in memory.
+
+    :param body: body returned by a service
+
+    :returns: bytes-like object, or None if the body has to be streamed
+    """
+    if body is None:
+        return b''
+
+    if isinstance(body, str):
+        return body.encode('utf-8')
+
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return body
+
+    return None
+
+
+def get_body_length(body):
+    """Get the length of a body that is known before it is sent.
+
+    :param body: body returned by a service
+
+    :returns: int, or None if the length is only known once the body has
+              been streamed
+    """
+    content = get_body_bytes(body)
+    if content is not None:
+        return len(content)
+
+    if isinstance(body, FileResponse):
+        return len(body)
+
+    return None
+
+
+def iterate_body(body, chunk_size=CHUNK_SIZE):
+    """Iterate over the chunks of a body.
+
+    Only a single chunk is held in memory at a time. The body is closed once
+    it has been iterated over, or when the iterator is closed.
+
+    :param body: string, bytes, FileResponse, file-like object, or iterable
+                 of bytes or strings
+    :param chunk_size: size of the chunks read from file-like objects
+
+    :returns: iterator of bytes-like objects
+    """
+    content = get_body_bytes(body)
+    if content is not None:
+        if content:
+            yield content
+        return
+
+    try:
+        if isinstance(body, FileResponse):
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        elif hasattr(body, 'read'):
+            while True:
+                chunk = body.read(chunk_size)
+                if not chunk:
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                yield chunk
+        else:
+            for chunk in body:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                yield chunk
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+async def iterate_body_async(body, chunk_size=CHUNK_SIZE):
+    """Iterate asynchronously over the chunks of a body.
+
+    :param body: string, bytes, file-like object, iterable, or asynchronous
+                 iterable of bytes or strings
+    :param chunk_size: size of the chunks read from file-like objects
+
+    :returns: asynchronous iterator of bytes-like objects
+    """
+    if not isinstance(body, collections.AsyncIterable):
+        chunks = iterate_body(body, chunk_size)
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            chunks.close()
+        return
+
+    try:
+        async for chunk in body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            yield chunk
+    finally:
+        aclose = getattr(body, 'aclose', None)
+        if aclose is not None:
+            await aclose()
+
+
+def close_body(body):
+    """Close a response body that is not going to be sent.
+
+    :param body: body returned by a service
+
+    :returns: n/a
+    """
+    if get_body_bytes(body) is None:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+
+
+async def close_body_async(body):
+    """Close a response body that is not going to be sent, including
+    asynchronous generators.
+
+    :param body: body returned by a service
+
+    :returns: n/a
+    """
+    aclose = getattr(body, 'aclose', None)
+    if aclose is not None:
+        await aclose()
+    else:
+        close_body(body)
+
+
+class IterableReader(io.RawIOBase):
+    """File-like object reading the chunks of an iterable on demand.
+
+    The chunks are only produced as the body is read so that a large body
+    is never held in memory at once.
+    """
+
+    def __init__(self, iterable):
+        """Initialize the reader.
+
+        :param iterable: iterable of bytes or strings, strings are encoded
+                         as UTF-8
+        """
+        super(IterableReader, self).__init__()
+        self.iterator = iter(iterable)
+        self.pending = memoryview(b'')
+        self.offset = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Read the next bytes of the body into a buffer.
+
+        :param buffer: writable buffer
+
+        :returns: number of bytes read, 0 at the end of the body
+        """
+        while self.offset >= len(self.pending):
+            try:
+                chunk = next(self.iterator)
+            except StopIteration:
+                return 0
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            self.pending = memoryview(chunk).cast('B')
+            self.offset = 0
+
+        size = min(len(buffer), len(self.pending) - self.offset)
+        buffer[:size] = self.pending[self.offset:self.offset + size]
+        self.offset += size
+        return size
+
+    def close(self):
+        close = getattr(self.iterator, 'close', None)
+        if close is not None:
+            close()
+        self.pending = memoryview(b'')
+        super(IterableReader, self).close()
+
+
+class BodyReader(io.RawIOBase):
+    """Read-once access to the body of a request.
+
+    The integrations provide it to the services as `request.body_reader`,
+    backed by whatever holds the body: the bytes already received, which
+    are never copied as a whole, or the file-like object or iterable the
+    body is still read from. Services may hash or spool large uploads in
+    constant memory:
+
+        def upload(self, request, uri, headers):
+            digest = hashlib.sha256()
+            for chunk in request.body_reader.iter_chunks():
+                digest.update(chunk)
+    """
+
+    def __init__(self, body, length=None):
+        """Initialize the reader.
+
+        :param body: string, bytes, file-like object, or iterable of bytes
+                     or strings
+        :param length: number of bytes to read from a file-like object,
+                       f.e a socket that must not be read past the body,
+                       defaults to reading until the end of the file
+        """
+        super(BodyReader, self).__init__()
+        self.view = None
+        self.file = None
+        self.offset = 0
+        self.remaining = length
+
+        content = get_body_bytes(body)
+        if content is not None:
+            self.view = memoryview(content).cast('B')
+        elif hasattr(body, 'read'):
+            self.file = body
+        else:
+            self.file = IterableReader(body)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        """Read the next bytes of the body into a buffer.
+
+        :param buffer: writable buffer, f.e a memoryview
+
+        :returns: number of bytes read, less than the size of the buffer
+                  only at the end of the body
+        """
+        with memoryview(buffer) as view:
+            view = view.cast('B')
+            offset = 0
+            while offset < len(view):
+                count = self.readinto1(view[offset:])
+                if not count:
+                    break
+                offset += count
+        return offset
+
+    def readinto1(self, buffer):
+        """Read the next bytes of the body into a buffer with at most one
+        read from the underlying file-like object or iterable.
+
+        :param buffer: writable buffer, f.e a memoryview
+
+        :returns: number of bytes read, 0 at the end of the body
+        """
+        buffer = memoryview(buffer).cast('B')
+        if self.view is not None:
+            size = min(len(buffer), len(self.view) - self.offset)
+            buffer[:size] = self.view[self.offset:self.offset + size]
+            self.offset += size
+            return size
+
+        if self.remaining is not None:
+            buffer = buffer[:self.remaining]
+        if not len(buffer):
+            return 0
+
+        if hasattr(self.file, 'readinto'):
+            size = self.file.readinto(buffer) or 0
+        else:
+            chunk = self.file.read(len(buffer))
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            size = len(chunk)
+            buffer[:size] = chunk
+
+        if self.remaining is not None:
+            self.remaining -= size
+        return size
+
+    def read(self, size=-1):
+        """Read the next bytes of the body.
+
+        :param size: number of bytes to read, all of the rest of the body if
+                     negative or None
+
+        :returns: bytes, fewer than size only at the end of the body
+        """
+        if size is None or size < 0:
+            return self.readall()
+
+        buffer = bytearray(size)
+        del buffer[self.readinto(buffer):]
+        return bytes(buffer)
+
+    def readall(self):
+        """Read the rest of the body.
+
+        :returns: bytes of the rest of the body
+        """
+        if self.view is not None:
+            if not self.offset and isinstance(self.view.obj, bytes):
+                chunk = self.view.obj
+            else:
+                chunk = bytes(self.view[self.offset:])
+            self.offset = len(self.view)
+            return chunk
+
+        return b''.join(self.iter_chunks())
+
+    def iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """Iterate over the remaining chunks of the body.
+
+        Bodies already held in memory are iterated over as memoryviews of
+        the bytes received instead of copies.
+
+        :param chunk_size: maximum size of the chunks
+
+        :returns: iterator of bytes-like objects
+        """
+        if self.view is not None:
+            while self.offset < len(self.view):
+                chunk = self.view[self.offset:self.offset + chunk_size]
+                self.offset += len(chunk)
+                yield chunk
+            return
+
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def get_body_reader(body, chunk_size=CHUNK_SIZE):
+    """Get a buffered file-like object reading a body on demand.
+
+    :param body: string, bytes, file-like object, or iterable of bytes or
+                 strings
+    :param chunk_size: size of the buffer of the reader
+
+    :returns: io.BufferedReader of the body
+    """
+    if isinstance(body, io.BufferedReader):
+        return body
+
+    return io.BufferedReader(IterableReader(iterate_body(body, chunk_size)),
+                             chunk_size)
@@ -0,0 +1,63 @@
+"""
+Stack-In-A-Box: Debug Tracing
+
+The request dispatch path of Stack-In-A-Box logs every step at the DEBUG
+level. The messages are only formatted if DEBUG is enabled for the logger,
+and tracing may be switched off entirely so the dispatch path does not do
+any logging work at all:
+
+    from stackinabox.util import trace
+
+    trace.disable()
+
+Tracing may also be switched off before Stack-In-A-Box is imported by setting
+the `STACKINABOX_TRACE` environment variable to `0`.
+
+Code on the dispatch path checks the switch before anything else:
+
+    if trace.ENABLED:
+        trace.debug(logger, 'Request: %s - %s', method, uri)
+"""
+import logging
+import os
+
+
+ENABLED = os.environ.get('STACKINABOX_TRACE', '1').lower() not in (
+    '0', 'false', 'no', 'off'
+)
+
+
+def enable():
+    """Switch tracing of the dispatch path on."""
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    """Switch tracing of the dispatch path off."""
+    global ENABLED
+    ENABLED = False
+
+
+def is_enabled(logger):
+    """Would a trace message for the logger be emitted?
+
+    :param logger: logging.Logger instance
+
+    :returns: boolean
+    """
+    return ENABLED and logger.isEnabledFor(logging.DEBUG)
+
+
+def debug(logger, msg, *args):
+    """Log a trace message at the DEBUG level.
+
+    The message is only formatted, using `msg % args`, if it is emitted.
+
+    :param logger: logging.Logger instance
+    :param msg: message format string
+    :param args: arguments for the message format string
+    :returns: n/a
+    """
+    if ENABLED and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(msg, *args)
@@ -0,0 +1,292 @@
+"""
+Stack-In-A-Box: urllib3 Support
+"""
+from __future__ import absolute_import
+
+import io
+import logging
+import re
+
+import urllib3
+from urllib3.connectionpool import HTTPConnectionPool
+
+from stackinabox.server.core import get_reason_for_status
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+from stackinabox.util.tools import (
+    BodyReader,
+    CaseInsensitiveDict,
+    IterableReader,
+    get_body_bytes,
+    iterate_body
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Urllib3Request(object):
+    """Request made through a urllib3 connection pool.
+
+    Provides the request to the StackInABoxService handlers. File-like and
+    iterable bodies are only read as the service reads them, either in
+    chunks through the BodyReader `body_reader` or all at once through
+    `body`.
+    """
+
+    def __init__(self, method, url, headers, body):
+        """Initialize the request.
+
+        :param method: HTTP verb
+        :param url: full URL of the request including the query string
+        :param headers: case-insensitive request headers
+        :param body: string, bytes, file-like object, iterable of bytes, or
+                     None
+        """
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self.__body = None
+        if get_body_bytes(body) is not None:
+            body = self.__body = get_request_body(body)
+        self.body_reader = BodyReader(body)
+
+    @property
+    def body(self):
+        """bytes of the request body, whatever is left of it once
+        `body_reader` has been read from
+        """
+        if self.__body is None:
+            self.__body = self.body_reader.read()
+        return self.__body
+
+    @body.setter
+    def body(self, value):
+        self.__body = value
+
+
+def get_request_body(body):
+    """Get the bytes of a request body held in memory.
+
+    File-like and iterable bodies are read through the BodyReader of the
+    Urllib3Request instead.
+
+    :param body: string, bytes-like object, or None
+
+    :returns: bytes of the request body
+    """
+    return bytes(get_body_bytes(body))
+
+
+def get_response_body(body):
+    """Get a body returned by a service as urllib3 expects it.
+
+    urllib3 only decodes the Content-Encoding of bodies it reads, so the body
+    is always provided as a file-like object.
+
+    :param body: string, bytes, file-like object, iterable of bytes, or None
+
+    :returns: file-like object of the response body
+    """
+    content = get_body_bytes(body)
+    if content is not None:
+        return io.BytesIO(content)
+
+    if hasattr(body, 'read'):
+        return body
+
+    return IterableReader(iterate_body(body))
+
+
+class ConnectionPoolPatch(object):
+    """Patch of urllib3.HTTPConnectionPool.urlopen.
+
+    While enabled, requests of any urllib3 connection pool, including those
+    of a PoolManager, are handed to Stack-In-A-Box if they are for the URI
+    registered with the StackInABox instance of the caller. All other
+    requests are sent as usual.
+
+    Redirect responses are returned as they are; a PoolManager follows
+    them as it would for any connection pool.
+    """
+
+    HOLD_NAME = 'urllib3_regex'
+
+    def __init__(self):
+        self.original_urlopen = None
+
+    @property
+    def enabled(self):
+        """Is the patch applied?"""
+        return self.original_urlopen is not None
+
+    @staticmethod
+    def get_url(pool, url):
+        """Get the full URL of a request of a connection pool.
+
+        :param pool: urllib3.HTTPConnectionPool the request is made with
+        :param url: URL, or the path and query string, of the request
+
+        :returns: string - full URL of the request
+        """
+        if not url.startswith('/'):
+            return url
+
+        host = pool.host
+        default_port = pool.ConnectionCls.default_port
+        if pool.port is not None and pool.port != default_port:
+            host = '{0}:{1}'.format(host, pool.port)
+        return '{0}://{1}{2}'.format(pool.scheme, host, url)
+
+    @staticmethod
+    def matches(url):
+        """Is the URL registered with Stack-In-A-Box?
+
+        :param url: full URL of the request
+
+        :returns: boolean
+        """
+        regex = StackInABox.get_thread_instance().holds.get(
+            ConnectionPoolPatch.HOLD_NAME
+        )
+        return regex is not None and regex.match(url) is not None
+
+    @staticmethod
+    def handle_request(method, url, body=None, headers=None,
+                       preload_content=True, decode_content=True):
+        """Handle a request of a urllib3 connection pool.
+
+        :param method: HTTP verb
+        :param url: full URL of the request
+        :param body: request body
+        :param headers: request headers
+        :param preload_content: read the whole response body right away,
+                                otherwise it is read as it is consumed
+        :param decode_content: decode the response body according to its
+                               Content-Encoding
+
+        :returns: urllib3.HTTPResponse object
+        """
+        if trace.ENABLED:
+            trace.debug(logger, 'urllib3: %s - %s', method, url)
+
+        request_headers = CaseInsensitiveDict()
+        if headers is not None:
+            request_headers.update(headers)
+        request = Urllib3Request(method, url, request_headers, body)
+
+        status_code, output_headers, response_body = StackInABox.call_into(
+            method,
+            request,
+            url,
+            CaseInsensitiveDict()
+        )
+
+        return urllib3.HTTPResponse(
+            body=get_response_body(response_body),
+            headers=urllib3.HTTPHeaderDict(
+                {key: str(value) for key, value in output_headers.items()}
+            ),
+            status=status_code,
+            version=11,
+            version_string='HTTP/1.1',
+            reason=get_reason_for_status(status_code),
+            preload_content=preload_content,
+            decode_content=decode_content,
+            request_method=method,
+            request_url=url
+        )
+
+    def enable(self):
+        """Patch urllib3.HTTPConnectionPool.urlopen.
+
+        :returns: n/a
+        """
+        if self.enabled:
+            return
+
+        logger.debug('Patching urllib3.HTTPConnectionPool')
+        original_urlopen = HTTPConnectionPool.urlopen
+
+        def urlopen(pool, method, url, body=None, headers=None,
+                    preload_content=True, decode_content=True, **kwargs):
+            full_url = ConnectionPoolPatch.get_url(pool, url)
+            if ConnectionPoolPatch.matches(full_url):
+                return ConnectionPoolPatch.handle_request(
+                    method,
+                    full_url,
+                    body=body,
+                    headers=headers,
+                    preload_content=preload_content,
+                    decode_content=decode_content
+                )
+            return original_urlopen(pool,
+                                    method,
+                                    url,
+                                    body=body,
+                                    headers=headers,
+                                    preload_content=preload_content,
+                                    decode_content=decode_content,
+                                    **kwargs)
+
+        self.original_urlopen = original_urlopen
+        HTTPConnectionPool.urlopen = urlopen
+
+    def disable(self):
+        """Restore urllib3.HTTPConnectionPool.urlopen.
+
+        :returns: n/a
+        """
+        if not self.enabled:
+            return
+
+        logger.debug('Restoring urllib3.HTTPConnectionPool')
+        HTTPConnectionPool.urlopen = self.original_urlopen
+        self.original_urlopen = None
+
+
+pool_patch = ConnectionPoolPatch()
+
+
+def enable():
+    """Hand requests of all urllib3 connection pools to Stack-In-A-Box.
+
+    Only requests for a URI registered with registration() are handled by
+    Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    pool_patch.enable()
+
+
+def disable():
+    """Stop handing requests of urllib3 connection pools to Stack-In-A-Box.
+
+    :returns: n/a
+    """
+    pool_patch.disable()
+
+
+def registration(uri):
+    """urllib3 handler registration.
+
+    Registers a given URI with the StackInABox instance so that requests of
+    urllib3 connection pools for it are intercepted and handed to
+    Stack-In-A-Box while enable() is in effect.
+
+    :param uri: URI used for the base of the HTTP requests
+
+    :returns: n/a
+    """
+
+    # log the URI that is used to access the Stack-In-A-Box services
+    logger.debug('Registering Stack-In-A-Box at {0} under urllib3'
+                 .format(uri))
+    # tell Stack-In-A-Box what URI to match with
+    StackInABox.update_uri(uri)
+
+    StackInABox.hold_onto(
+        ConnectionPoolPatch.HOLD_NAME,
+        re.compile(r'(http)?s?(://)?{0}:?(\d+)?/'.format(uri), re.I),
+        pinned=True
+    )
@@ -0,0 +1,406 @@
+"""
+Stack-In-A-Box: ASGI Application Test
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+
+import httpx
+import pytest
+
+from stackinabox.server.asgi import ASGIApplication
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from tests.utils.services import (
+    AdvancedService,
+    FileService,
+    UploadService
+)
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingService(StackInABoxService):
+
+    def __init__(self):
+        super(StreamingService, self).__init__('stream')
+        self.produced = 0
+        self.register(StackInABoxService.POST, '/', StreamingService.echo)
+        self.register(StackInABoxService.PUT, '/', StreamingService.upload)
+        self.register(StackInABoxService.GET, '/chunks',
+                      StreamingService.chunks)
+        self.register(StackInABoxService.GET, '/async',
+                      StreamingService.async_chunks)
+        self.register(StackInABoxService.GET, '/file',
+                      StreamingService.file)
+        self.register(StackInABoxService.GET, '/hold',
+                      StreamingService.hold)
+        self.register(StackInABoxService.GET, '/cached',
+                      StreamingService.not_modified)
+
+    def echo(self, request, uri, headers):
+        headers['X-Echo'] = request.headers.get('x-test', '')
+        headers['X-Path'] = request.path
+        return (201, headers, request.body)
+
+    async def upload(self, request, uri, headers):
+        digest = hashlib.sha256()
+        size = 0
+        async for chunk in request.stream():
+            digest.update(chunk)
+            size += len(chunk)
+        headers['X-Size'] = size
+        return (200, headers, digest.hexdigest())
+
+    def chunks(self, request, uri, headers):
+        def generate():
+            for i in range(4):
+                self.produced += 1
+                yield str(i)
+
+        return (200, headers, generate())
+
+    async def async_chunks(self, request, uri, headers):
+        async def generate():
+            for i in range(4):
+                await asyncio.sleep(0)
+                yield str(i).encode('utf-8')
+
+        return (200, headers, generate())
+
+    def file(self, request, uri, headers):
+        return (200, headers, io.BytesIO(b'file body'))
+
+    def hold(self, request, uri, headers):
+        return (200, headers, StackInABox.hold_out('value'))
+
+    def not_modified(self, request, uri, headers):
+        headers['ETag'] = '"cached"'
+        return (304, headers, 'stale')
+
+
+class Receiver(object):
+    """ASGI receive callable sending a body in chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.received = 0
+
+    async def __call__(self):
+        self.received += 1
+        if not self.chunks:
+            return {'type': 'http.disconnect'}
+        chunk = self.chunks.pop(0)
+        return {
+            'type': 'http.request',
+            'body': chunk,
+            'more_body': bool(self.chunks),
+        }
+
+
+def make_scope(method, path, query=b'', headers=()):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode('latin-1'),
+        'query_string': query,
+        'headers': list(headers),
+    }
+
+
+def call(app, method, path, chunks=(b'',), **kwargs):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    receiver = Receiver(chunks)
+    asyncio.run(app(make_scope(method, path, **kwargs), receiver, send))
+    return messages, receiver
+
+
+@pytest.fixture
+def app():
+    StackInABox.reset_services()
+    StackInABox.register_service(HelloService())
+    StackInABox.register_service(AdvancedService())
+    StackInABox.register_service(StreamingService())
+    yield ASGIApplication()
+    StackInABox.reset_services()
+
+
+def test_basic_asgi(app):
+    messages, _ = call(app, 'GET', '/hello/')
+    assert messages == [
+        {
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-length', b'5')],
+        },
+        {'type': 'http.response.body', 'body': b'Hello'},
+    ]
+
+
+@pytest.mark.parametrize('method,path,status', [
+    ('GET', '/advanced/h', 200),
+    ('GET', '/advanced/_234567890', 595),
+    ('PUT', '/advanced/h', 405),
+    ('GET', '/unknown/', 597),
+])
+def test_statuses(app, method, path, status):
+    messages, _ = call(app, method, path)
+    assert messages[0]['status'] == status
+
+
+@pytest.mark.parametrize('method,path,status', [
+    ('DELETE', '/advanced/', 204),
+    ('GET', '/stream/cached', 304),
+])
+def test_bodiless_statuses(app, method, path, status):
+    messages, _ = call(app, method, path)
+    assert messages[0]['status'] == status
+    assert b'content-length' not in dict(messages[0]['headers'])
+    assert messages[1:] == [{'type': 'http.response.body', 'body': b''}]
+
+
+def test_request(app):
+    messages, _ = call(app, 'POST', '/stream/',
+                       chunks=[b'chunked ', b'request ', b'body'],
+                       query=b'a=1',
+                       headers=[(b'x-test', b'tested')])
+    assert messages[0]['status'] == 201
+    headers = dict(messages[0]['headers'])
+    assert headers[b'x-echo'] == b'tested'
+    assert headers[b'x-path'] == b'/stream/?a=1'
+    assert messages[1]['body'] == b'chunked request body'
+
+
+def test_streamed_response_body(app):
+    service = StackInABox.get_thread_instance().services['stream'][1]
+
+    messages, _ = call(app, 'GET', '/stream/chunks')
+    assert service.produced == 4
+    assert messages[0]['headers'] == []
+    assert messages[1:] == [
+        {'type': 'http.response.body', 'body': b'0', 'more_body': True},
+        {'type': 'http.response.body', 'body': b'1', 'more_body': True},
+        {'type': 'http.response.body', 'body': b'2', 'more_body': True},
+        {'type': 'http.response.body', 'body': b'3', 'more_body': True},
+        {'type': 'http.response.body', 'body': b''},
+    ]
+
+    messages, _ = call(app, 'GET', '/stream/async')
+    assert b''.join(message['body'] for message in messages[1:]) == b'0123'
+
+    messages, _ = call(app, 'HEAD', '/stream/chunks')
+    assert messages[1:] == [{'type': 'http.response.body', 'body': b''}]
+
+
+def test_streamed_request_body():
+    StackInABox.reset_services()
+    StackInABox.register_service(StreamingService())
+    app = ASGIApplication(stream_request_body=True)
+
+    chunks = [bytes([i]) * 1024 for i in range(64)]
+    messages, receiver = call(app, 'PUT', '/stream/', chunks=chunks)
+    assert messages[0]['status'] == 200
+    assert dict(messages[0]['headers'])[b'x-size'] == b'65536'
+    assert messages[1]['body'] == (
+        hashlib.sha256(b''.join(chunks)).hexdigest().encode('utf-8')
+    )
+    assert receiver.received == 64
+
+    # handlers reading the body as a whole still work
+    messages, _ = call(app, 'POST', '/stream/', chunks=[b'a', b'b'])
+    assert messages[0]['status'] == 201
+    StackInABox.reset_services()
+
+
+def test_request_body_reader():
+    StackInABox.reset_services()
+    StackInABox.register_service(UploadService())
+    chunks = [bytes([i]) * 1024 for i in range(4)]
+
+    messages, _ = call(ASGIApplication(), 'POST', '/upload/', chunks=chunks)
+    assert messages[0]['status'] == 201
+    assert json.loads(messages[1]['body']) == {
+        'sha256': hashlib.sha256(b''.join(chunks)).hexdigest(),
+        'size': 4096
+    }
+
+    # the body has to be received before it can be read synchronously
+    app = ASGIApplication(stream_request_body=True)
+    messages, _ = call(app, 'POST', '/upload/', chunks=chunks)
+    assert messages[0]['status'] == 596
+    StackInABox.reset_services()
+
+
+def test_file_response(tmp_path):
+    path = tmp_path / 'fixture.bin'
+    path.write_bytes(bytes(range(256)) * 1024)
+    StackInABox.reset_services()
+    service = FileService(str(path))
+    StackInABox.register_service(service)
+    app = ASGIApplication()
+
+    messages, _ = call(app, 'GET', '/files/')
+    assert dict(messages[0]['headers'])[b'content-length'] == b'262144'
+    assert b''.join(message.get('body', b'')
+                    for message in messages[1:]) == path.read_bytes()
+
+    # servers supporting the extension are handed the file itself
+    scope = make_scope('GET', '/files/part')
+    scope['extensions'] = {'http.response.zerocopysend': {}}
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, Receiver([b'']), send))
+    assert dict(messages[0]['headers'])[b'content-length'] == b'10'
+    assert messages[1]['type'] == 'http.response.zerocopysend'
+    assert messages[1]['offset'] == 10
+    assert messages[1]['count'] == 10
+    assert messages[1]['file'] is service.responses[-1].file
+
+    assert all(response.file.closed for response in service.responses)
+    StackInABox.reset_services()
+
+
+def test_client_disconnect():
+    StackInABox.reset_services()
+    StackInABox.register_service(StreamingService())
+    app = ASGIApplication(stream_request_body=True)
+
+    class Disconnecting(Receiver):
+
+        async def __call__(self):
+            message = await super(Disconnecting, self).__call__()
+            message['more_body'] = True
+            return message
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(make_scope('PUT', '/stream/'),
+                    Disconnecting([b'partial']),
+                    send))
+    assert messages[0]['status'] == 596
+    StackInABox.reset_services()
+
+
+def test_lifespan(app):
+    messages = []
+    events = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+
+    async def receive():
+        return events.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app({'type': 'lifespan'}, receive, send))
+    assert messages == [
+        {'type': 'lifespan.startup.complete'},
+        {'type': 'lifespan.shutdown.complete'},
+    ]
+
+
+def test_unsupported_scope(app):
+    with pytest.raises(ValueError):
+        asyncio.run(app({'type': 'websocket'}, None, None))
+
+
+def test_httpx_asgi_transport(app):
+    StackInABox.hold_onto('value', 'held')
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://testserver') as client:
+            responses = await asyncio.gather(*[
+                client.get('/hello/') for _ in range(10)
+            ])
+            assert all(res.text == 'Hello' for res in responses)
+
+            res = await client.get('/stream/hold')
+            assert res.text == 'held'
+
+            res = await client.get('/stream/file')
+            assert res.text == 'file body'
+
+            res = await client.post('/stream/', content=b'posted',
+                                    headers={'X-Test': 'httpx'})
+            assert res.status_code == 201
+            assert res.headers['X-Echo'] == 'httpx'
+            assert res.content == b'posted'
+
+    asyncio.run(run())
+
+
+def test_httpx_asgi_transport_keeps_caller_instance():
+    StackInABox.hold_onto('value', 'caller')
+    other = StackInABox()
+    other.register(StreamingService())
+    other.into_hold('value', 'application')
+
+    async def run():
+        instance = StackInABox.get_thread_instance()
+        transport = httpx.ASGITransport(app=ASGIApplication(other))
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://testserver') as client:
+            # the handlers use the instance of the application while the
+            # task awaiting the application keeps its own
+            res = await client.get('/stream/hold')
+            assert res.text == 'application'
+            assert StackInABox.get_thread_instance() is instance
+            assert StackInABox.hold_out('value') == 'caller'
+
+    try:
+        asyncio.run(run())
+    finally:
+        StackInABox.reset_services()
+
+
+def test_head_closes_async_body():
+    closed = []
+
+    class HeadService(StackInABoxService):
+
+        def __init__(self):
+            super(HeadService, self).__init__('head')
+            self.register(StackInABoxService.HEAD, '/', HeadService.head)
+
+        async def head(self, request, uri, headers):
+            class Chunks(object):
+
+                def __aiter__(self):
+                    return self
+
+                async def __anext__(self):
+                    raise StopAsyncIteration
+
+                async def aclose(self):
+                    closed.append(True)
+
+            return (200, headers, Chunks())
+
+    StackInABox.reset_services()
+    StackInABox.register_service(HeadService())
+    try:
+        messages, _ = call(ASGIApplication(), 'HEAD', '/head/')
+        assert messages[-1] == {'type': 'http.response.body', 'body': b''}
+        assert closed == [True]
+    finally:
+        StackInABox.reset_services()
@@ -0,0 +1,540 @@
+"""
+Stack-In-A-Box: Loopback Server Test
+"""
+import asyncio
+import hashlib
+import http.client
+import logging
+import os
+import socket
+import threading
+
+import mock
+import pytest
+import requests
+
+from stackinabox.server import StackInABoxServer, get_reason_for_status
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from tests.utils.services import (
+    AdvancedService,
+    FileService,
+    UploadService
+)
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+class EchoService(StackInABoxService):
+
+    def __init__(self):
+        super(EchoService, self).__init__('echo')
+        self.release = threading.Event()
+        self.register(StackInABoxService.POST, '/', EchoService.echo)
+        self.register(StackInABoxService.GET, '/stream',
+                      EchoService.stream)
+        self.register(StackInABoxService.GET, '/hold', EchoService.hold)
+        self.register(StackInABoxService.GET, '/async',
+                      EchoService.async_handler)
+        self.register(StackInABoxService.GET, '/wait', EchoService.wait)
+
+    def echo(self, request, uri, headers):
+        headers['X-Echo'] = request.headers.get('x-test', '')
+        headers['X-Path'] = request.path
+        return (201, headers, request.body)
+
+    def stream(self, request, uri, headers):
+        return (200, headers, (str(i) for i in range(5)))
+
+    def hold(self, request, uri, headers):
+        return (200, headers, StackInABox.hold_out('value'))
+
+    async def async_handler(self, request, uri, headers):
+        await asyncio.sleep(0)
+        return (200, headers, 'async')
+
+    async def wait(self, request, uri, headers):
+        while not self.release.is_set():
+            await asyncio.sleep(0.01)
+        return (200, headers, 'released')
+
+
+class BufferedSocket(object):
+    """Socket whose responses are all read through the same buffer.
+
+    http.client closes the file of a response once it has been read, the
+    buffer has to be kept open for the responses that follow it.
+    """
+
+    def __init__(self, sock):
+        self.fp = sock.makefile('rb')
+
+    def makefile(self, *args, **kwargs):
+        return self
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.fp, name)
+
+
+def read_responses(sock, count):
+    """Read a number of responses from a socket."""
+    buffered = BufferedSocket(sock)
+    responses = []
+    for _ in range(count):
+        response = http.client.HTTPResponse(buffered)
+        response.begin()
+        responses.append((response.status, response.read()))
+    return responses
+
+
+@pytest.fixture
+def server():
+    StackInABox.reset_services()
+    StackInABox.register_service(HelloService())
+    StackInABox.register_service(AdvancedService())
+    StackInABox.register_service(EchoService())
+    StackInABox.register_service(UploadService())
+    with StackInABoxServer() as server:
+        yield server
+    StackInABox.reset_services()
+
+
+def test_reason_for_status():
+    assert get_reason_for_status(200) == 'OK'
+    assert get_reason_for_status(595) == 'Route Not Handled'
+    assert get_reason_for_status(596) == 'Service Handler Error'
+    assert get_reason_for_status(597) == 'Unknown Service'
+    assert get_reason_for_status(599) == 'Unknown status code - 599'
+
+
+def test_basic_server(server):
+    assert server.url.startswith('http://127.0.0.1:')
+
+    res = requests.get(server.url + '/hello/')
+    assert res.status_code == 200
+    assert res.text == 'Hello'
+
+
+def test_advanced_server(server):
+    res = requests.get(server.url + '/advanced/h')
+    assert res.status_code == 200
+    assert res.text == 'Good-Bye'
+
+    res = requests.get(server.url + '/advanced/g',
+                       params={'bob': 'alice', 'alice': 'bob'})
+    assert res.status_code == 200
+    assert res.json() == {
+        'bob': 'bob: Good-Bye alice',
+        'alice': 'alice: Good-Bye bob',
+    }
+
+    res = requests.get(server.url + '/advanced/_234567890')
+    assert res.status_code == 595
+    assert res.reason == 'Route Not Handled'
+
+    res = requests.put(server.url + '/advanced/h')
+    assert res.status_code == 405
+
+    res = requests.get(server.url + '/unknown/')
+    assert res.status_code == 597
+    assert res.reason == 'Unknown Service'
+
+    res = requests.head(server.url + '/advanced/')
+    assert res.status_code == 204
+    assert res.text == ''
+
+
+def test_keep_alive(server):
+    host, port = server.address
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        for _ in range(3):
+            connection.request('GET', '/hello/')
+            response = connection.getresponse()
+            assert response.status == 200
+            assert response.read() == b'Hello'
+            sock = connection.sock
+            assert sock is not None
+        connection.request('POST', '/echo/', body=b'data',
+                           headers={'X-Test': 'tested'})
+        response = connection.getresponse()
+        assert response.status == 201
+        assert response.getheader('X-Echo') == 'tested'
+        assert response.read() == b'data'
+        assert connection.sock is sock
+    finally:
+        connection.close()
+
+
+def test_pipelining(server):
+    with socket.create_connection(server.address) as sock:
+        sock.sendall(
+            b'GET /hello/ HTTP/1.1\r\nHost: localhost\r\n\r\n'
+            b'POST /echo/?q=1 HTTP/1.1\r\nHost: localhost\r\n'
+            b'Content-Length: 4\r\n\r\nbody'
+            b'GET /advanced/h HTTP/1.1\r\nHost: localhost\r\n\r\n'
+        )
+        assert read_responses(sock, 3) == [
+            (200, b'Hello'),
+            (201, b'body'),
+            (200, b'Good-Bye'),
+        ]
+
+
+def test_chunked_request_body(server):
+    res = requests.post(server.url + '/echo/',
+                        data=iter([b'chunked ', b'request ', b'body']),
+                        headers={'X-Test': 'chunked'})
+    assert res.status_code == 201
+    assert res.headers['X-Echo'] == 'chunked'
+    assert res.content == b'chunked request body'
+
+
+def test_request_body_reader(server):
+    body = b'upload' * 100000
+    res = requests.put(server.url + '/upload/', data=body)
+    assert res.status_code == 201
+    assert res.json() == {
+        'sha256': hashlib.sha256(body).hexdigest(),
+        'size': len(body)
+    }
+
+
+def test_streamed_response_body(server):
+    res = requests.get(server.url + '/echo/stream')
+    assert res.status_code == 200
+    assert res.headers['Transfer-Encoding'] == 'chunked'
+    assert res.text == '01234'
+
+    with socket.create_connection(server.address) as sock:
+        sock.sendall(b'GET /echo/stream HTTP/1.0\r\n\r\n')
+        response = http.client.HTTPResponse(sock)
+        response.begin()
+        assert response.getheader('Connection') == 'close'
+        assert response.read() == b'01234'
+
+
+def test_file_response(tmp_path):
+    path = tmp_path / 'fixture.bin'
+    path.write_bytes(bytes(range(256)) * 4096)
+    StackInABox.reset_services()
+    service = FileService(str(path))
+    StackInABox.register_service(service)
+
+    sendfile_calls = []
+
+    def sendfile(*args):
+        sendfile_calls.append(args)
+        return real_sendfile(*args)
+
+    real_sendfile = os.sendfile
+    with StackInABoxServer() as server:
+        with mock.patch('os.sendfile', sendfile):
+            res = requests.get(server.url + '/files/')
+        assert res.status_code == 200
+        assert res.headers['Content-Length'] == str(256 * 4096)
+        assert 'Transfer-Encoding' not in res.headers
+        assert res.content == path.read_bytes()
+        assert sendfile_calls
+
+        res = requests.get(server.url + '/files/part')
+        assert res.headers['Content-Length'] == '10'
+        assert res.content == bytes(range(10, 20))
+
+        res = requests.head(server.url + '/files/')
+        assert res.headers['Content-Length'] == str(256 * 4096)
+        assert res.content == b''
+
+    assert all(response.file.closed for response in service.responses)
+    StackInABox.reset_services()
+
+
+def test_unsent_bodies_are_closed():
+    closed = []
+
+    class UnsentService(StackInABoxService):
+
+        def __init__(self):
+            super(UnsentService, self).__init__('unsent')
+            for method in (StackInABoxService.GET, StackInABoxService.HEAD):
+                self.register(method, '/sync', UnsentService.sync_body)
+                self.register(method, '/async', UnsentService.async_body)
+
+        def sync_body(self, request, uri, headers):
+            def generate():
+                try:
+                    yield b'sync'
+                finally:
+                    closed.append('sync')
+
+            body = generate()
+            next(body)
+            status_code = 204 if request.method == 'GET' else 200
+            return (status_code, headers, body)
+
+        def async_body(self, request, uri, headers):
+            class Chunks(object):
+
+                def __init__(self):
+                    self.chunks = iter([b'async'])
+
+                def __aiter__(self):
+                    return self
+
+                async def __anext__(self):
+                    try:
+                        return next(self.chunks)
+                    except StopIteration:
+                        raise StopAsyncIteration
+
+                async def aclose(self):
+                    closed.append('async')
+
+            return (200, headers, Chunks())
+
+    StackInABox.reset_services()
+    StackInABox.register_service(UnsentService())
+    with StackInABoxServer() as server:
+        # no body is sent for HEAD requests and 204 responses, the bodies
+        # of the handlers are closed all the same
+        res = requests.get(server.url + '/unsent/sync')
+        assert res.status_code == 204
+        res = requests.head(server.url + '/unsent/sync')
+        assert res.status_code == 200
+        assert closed == ['sync', 'sync']
+
+        with requests.Session() as session:
+            res = session.head(server.url + '/unsent/async')
+            assert res.content == b''
+            # the connection is kept, so the body has been dealt with
+            res = session.get(server.url + '/unsent/async')
+            assert res.content == b'async'
+        assert closed == ['sync', 'sync', 'async', 'async']
+    StackInABox.reset_services()
+
+
+def test_range_requests(tmp_path):
+    content = bytes(range(256)) * 4096
+    path = tmp_path / 'fixture.bin'
+    path.write_bytes(content)
+    StackInABox.reset_services()
+    service = FileService(str(path))
+    service.enable_range_requests()
+    StackInABox.register_service(service)
+
+    with StackInABoxServer() as server:
+        # download the file range by range as parallel downloaders do
+        with requests.Session() as session:
+            parts = []
+            for start in range(0, len(content), 300000):
+                res = session.get(server.url + '/files/', headers={
+                    'Range': 'bytes={0}-{1}'.format(start, start + 299999)
+                })
+                assert res.status_code == 206
+                assert res.headers['Content-Range'] == (
+                    'bytes {0}-{1}/{2}'.format(
+                        start,
+                        min(start + 300000, len(content)) - 1,
+                        len(content)
+                    )
+                )
+                parts.append(res.content)
+            assert b''.join(parts) == content
+
+            res = session.get(server.url + '/files/',
+                              headers={'Range': 'bytes=0-1,-2'})
+            assert res.status_code == 206
+            assert res.headers['Content-Type'].startswith(
+                'multipart/byteranges; boundary='
+            )
+            assert int(res.headers['Content-Length']) == len(res.content)
+
+            res = session.get(server.url + '/files/',
+                              headers={'Range': 'bytes=2000000-'})
+            assert res.status_code == 416
+            assert res.headers['Content-Range'] == 'bytes */1048576'
+
+    assert all(response.file.closed for response in service.responses)
+    StackInABox.reset_services()
+
+
+def test_conditional_requests():
+    StackInABox.reset_services()
+    service = HelloService()
+    service.enable_conditional_requests()
+    StackInABox.register_service(service)
+
+    with StackInABoxServer() as server:
+        with requests.Session() as session:
+            res = session.get(server.url + '/hello/')
+            assert res.status_code == 200
+            etag = res.headers['ETag']
+
+            res = session.get(server.url + '/hello/',
+                              headers={'If-None-Match': etag})
+            assert res.status_code == 304
+            assert res.headers['ETag'] == etag
+            assert res.content == b''
+
+            # the connection is still usable after the empty response
+            assert session.get(server.url + '/hello/').text == 'Hello'
+
+    assert service.conditional_requests.not_modified == 1
+    StackInABox.reset_services()
+
+
+def test_http_1_0(server):
+    with socket.create_connection(server.address) as sock:
+        sock.sendall(b'GET /hello/ HTTP/1.0\r\n\r\n')
+        assert read_responses(sock, 1) == [(200, b'Hello')]
+        assert sock.recv(1) == b''
+
+    with socket.create_connection(server.address) as sock:
+        sock.sendall(
+            b'GET /hello/ HTTP/1.0\r\nConnection: keep-alive\r\n\r\n'
+            b'GET /hello/ HTTP/1.0\r\n\r\n'
+        )
+        assert read_responses(sock, 2) == [(200, b'Hello'), (200, b'Hello')]
+
+
+def test_expect_continue(server):
+    with socket.create_connection(server.address) as sock:
+        sock.sendall(
+            b'POST /echo/ HTTP/1.1\r\nContent-Length: 2\r\n'
+            b'Expect: 100-continue\r\n\r\n'
+        )
+        assert sock.recv(25) == b'HTTP/1.1 100 Continue\r\n\r\n'
+        sock.sendall(b'ok')
+        assert read_responses(sock, 1) == [(201, b'ok')]
+
+
+@pytest.mark.parametrize('request_data,status_code', [
+    (b'GARBAGE\r\n\r\n', 400),
+    (b'GET / HTTP/2.0\r\n\r\n', 505),
+    (b'GET /hello/ HTTP/1.1\r\nbroken header\r\n\r\n', 400),
+    (b'POST /echo/ HTTP/1.1\r\nContent-Length: x\r\n\r\n', 400),
+    (b'POST /echo/ HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n',
+     400),
+    (b'GET /hello/ HTTP/1.1\r\nX-Large: ' + b'x' * 70000 + b'\r\n\r\n',
+     431),
+])
+def test_malformed_requests(server, request_data, status_code):
+    with socket.create_connection(server.address) as sock:
+        sock.sendall(request_data)
+        response = http.client.HTTPResponse(sock)
+        response.begin()
+        assert response.status == status_code
+        assert response.getheader('Connection') == 'close'
+
+
+def test_max_body_size():
+    StackInABox.reset_services()
+    StackInABox.register_service(EchoService())
+    with StackInABoxServer(max_body_size=4) as server:
+        res = requests.post(server.url + '/echo/', data=b'1234')
+        assert res.status_code == 201
+
+        res = requests.post(server.url + '/echo/', data=b'12345')
+        assert res.status_code == 413
+    StackInABox.reset_services()
+
+
+def test_async_handlers(server):
+    res = requests.get(server.url + '/echo/async')
+    assert res.status_code == 200
+    assert res.text == 'async'
+
+
+def test_instance_of_the_server(server):
+    StackInABox.hold_onto('value', 'held')
+
+    def get():
+        return requests.get(server.url + '/echo/hold').text
+
+    # other threads reach the same instance through the server
+    result = []
+    thread = threading.Thread(target=lambda: result.append(get()))
+    thread.start()
+    thread.join()
+    assert result == ['held']
+
+
+def test_connection_limit():
+    StackInABox.reset_services()
+    service = EchoService()
+    StackInABox.register_service(service)
+    StackInABox.register_service(HelloService())
+    with StackInABoxServer(max_connections=1) as server:
+        waiting = socket.create_connection(server.address)
+        waiting.sendall(b'GET /echo/wait HTTP/1.1\r\n\r\n')
+
+        blocked = socket.create_connection(server.address)
+        blocked.sendall(b'GET /hello/ HTTP/1.1\r\n\r\n')
+        blocked.settimeout(0.2)
+        with pytest.raises(socket.timeout):
+            blocked.recv(1)
+
+        service.release.set()
+        assert read_responses(waiting, 1) == [(200, b'released')]
+        waiting.close()
+
+        blocked.settimeout(5)
+        assert read_responses(blocked, 1) == [(200, b'Hello')]
+        blocked.close()
+    StackInABox.reset_services()
+
+
+def test_stop_closes_connections():
+    StackInABox.reset_services()
+    StackInABox.register_service(HelloService())
+    server = StackInABoxServer().start()
+    address = server.address
+
+    idle = socket.create_connection(address)
+    idle.sendall(b'GET /hello/ HTTP/1.1\r\n\r\n')
+    assert read_responses(idle, 1) == [(200, b'Hello')]
+
+    server.stop()
+    idle.settimeout(5)
+    assert idle.recv(1) == b''
+    idle.close()
+
+    with pytest.raises(ConnectionError):
+        socket.create_connection(address, timeout=1)
+
+    # stopping again does nothing
+    server.stop()
+    StackInABox.reset_services()
+
+
+def test_serving_on_the_running_loop():
+    StackInABox.reset_services()
+    StackInABox.register_service(HelloService())
+
+    async def run():
+        server = StackInABoxServer()
+        await server.start_serving()
+        try:
+            reader, writer = await asyncio.open_connection(*server.address)
+            writer.write(b'GET /hello/ HTTP/1.1\r\nConnection: close\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+        finally:
+            await server.stop_serving()
+        return response
+
+    response = asyncio.run(run())
+    assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert response.endswith(b'\r\n\r\nHello')
+    StackInABox.reset_services()
+
+
+def test_invalid_connection_limit():
+    with pytest.raises(ValueError):
+        StackInABoxServer(max_connections=0)
@@ -0,0 +1,161 @@
+"""
+Stack-In-A-Box: Pre-fork Server Test
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from stackinabox.server.prefork import PreforkServer
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'),
+                                reason='os.fork() is not available')
+
+
+class WorkerService(StackInABoxService):
+
+    def __init__(self):
+        super(WorkerService, self).__init__('worker')
+        self.count = 0
+        self.register(StackInABoxService.GET, '/', WorkerService.pid)
+        self.register(StackInABoxService.POST, '/', WorkerService.increment)
+        self.register(StackInABoxService.GET, '/slow', WorkerService.slow)
+
+    def pid(self, request, uri, headers):
+        return (200, headers, str(os.getpid()))
+
+    def increment(self, request, uri, headers):
+        self.count += 1
+        return (200, headers, str(self.count))
+
+    async def slow(self, request, uri, headers):
+        await asyncio.sleep(0.5)
+        return (200, headers, 'slow')
+
+
+def get_pid(url):
+    res = requests.get(url + '/worker/', headers={'Connection': 'close'})
+    assert res.status_code == 200
+    return int(res.text)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def service():
+    StackInABox.reset_services()
+    service = WorkerService()
+    StackInABox.register_service(service)
+    yield service
+    StackInABox.reset_services()
+
+
+def test_workers(service):
+    with PreforkServer(workers=2) as server:
+        pids = server.worker_pids
+        assert len(pids) == 2
+        assert os.getpid() not in pids
+
+        seen = set(get_pid(server.url) for _ in range(50))
+        assert seen == set(pids)
+
+        # each worker holds its own copy of the services
+        counts = [
+            requests.post(server.url + '/worker/',
+                          headers={'Connection': 'close'}).text
+            for _ in range(10)
+        ]
+        assert len(counts) == 10
+        assert service.count == 0
+
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+def test_stop(service):
+    server = PreforkServer(workers=2).start()
+    address = server.address
+    assert get_pid(server.url) in server.worker_pids
+
+    server.stop()
+    assert server.worker_pids == []
+    with pytest.raises(ConnectionError):
+        socket.create_connection(address, timeout=1)
+
+    # stopping again does nothing
+    server.stop()
+
+
+def test_graceful_stop(service):
+    server = PreforkServer(workers=1).start()
+    result = []
+
+    def slow_request():
+        result.append(requests.get(server.url + '/worker/slow').text)
+
+    thread = threading.Thread(target=slow_request)
+    thread.start()
+    time.sleep(0.2)
+    server.stop()
+    thread.join()
+    assert result == ['slow']
+
+
+def test_restart_worker(service):
+    with PreforkServer(workers=1) as server:
+        old_pid = server.worker_pids[0]
+        new_pid = server.restart_worker(0)
+        assert new_pid != old_pid
+        assert server.worker_pids == [new_pid]
+        assert get_pid(server.url) == new_pid
+
+        server.restart()
+        assert server.worker_pids[0] != new_pid
+        assert get_pid(server.url) == server.worker_pids[0]
+
+
+def test_respawn(service):
+    with PreforkServer(workers=1) as server:
+        old_pid = server.worker_pids[0]
+        os.kill(old_pid, signal.SIGKILL)
+
+        wait_for(lambda: server.worker_pids[0] != old_pid)
+        assert get_pid(server.url) == server.worker_pids[0]
+
+
+def test_initializer():
+    StackInABox.reset_services()
+    with PreforkServer(
+        workers=1,
+        initializer=StackInABox.register_service,
+        initargs=(HelloService(),)
+    ) as server:
+        res = requests.get(server.url + '/hello/')
+        assert res.status_code == 200
+        assert res.text == 'Hello'
+    StackInABox.reset_services()
+
+
+def test_invalid_worker_count():
+    with pytest.raises(ValueError):
+        PreforkServer(workers=0)
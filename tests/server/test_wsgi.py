@@ -0,0 +1,322 @@
+"""
+Stack-In-A-Box: WSGI Application Test
+"""
+import hashlib
+import io
+import json
+import logging
+import re
+import threading
+import wsgiref.simple_server
+import wsgiref.util
+import wsgiref.validate
+
+import pytest
+import requests
+
+from stackinabox.server.wsgi import WSGIApplication
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from tests.utils.services import (
+    AdvancedService,
+    FileService,
+    UploadService
+)
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingService(StackInABoxService):
+
+    CHUNK_COUNT = 16
+
+    def __init__(self):
+        super(StreamingService, self).__init__('stream')
+        self.produced = 0
+        self.register(StackInABoxService.POST, '/', StreamingService.echo)
+        self.register(StackInABoxService.GET, '/chunks',
+                      StreamingService.chunks)
+        self.register(StackInABoxService.GET, '/file',
+                      StreamingService.file)
+        self.register(StackInABoxService.GET, '/hold',
+                      StreamingService.hold)
+        self.register(StackInABoxService.GET, '/hop',
+                      StreamingService.hop_by_hop)
+        self.register(StackInABoxService.GET, '/cached',
+                      StreamingService.not_modified)
+        self.register(StackInABoxService.GET, re.compile('^/typed/.*$'),
+                      StreamingService.typed)
+
+    def echo(self, request, uri, headers):
+        headers['X-Echo'] = request.headers.get('x-test', '')
+        headers['X-Path'] = request.path
+        return (201, headers, request.body)
+
+    def chunks(self, request, uri, headers):
+        def generate():
+            for i in range(StreamingService.CHUNK_COUNT):
+                self.produced += 1
+                yield str(i)
+
+        return (200, headers, generate())
+
+    def file(self, request, uri, headers):
+        return (200, headers, io.BytesIO(b'file body'))
+
+    def hold(self, request, uri, headers):
+        return (200, headers, StackInABox.hold_out('value'))
+
+    def typed(self, request, uri, headers):
+        headers['Content-Type'] = 'text/plain'
+        if uri.endswith('/chunks'):
+            return self.chunks(request, uri, headers)
+        if uri.endswith('/file'):
+            return self.file(request, uri, headers)
+        return (200, headers, 'typed')
+
+    def hop_by_hop(self, request, uri, headers):
+        headers['Connection'] = 'close'
+        headers['X-Kept'] = 'kept'
+        return (200, headers, 'hop')
+
+    def not_modified(self, request, uri, headers):
+        headers['ETag'] = '"cached"'
+        return (304, headers, 'stale')
+
+
+def call(app, method, path, body=b'', headers=None, query='',
+         validate=False):
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': query,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+    }
+    for key, value in (headers or {}).items():
+        environ['HTTP_' + key.upper().replace('-', '_')] = value
+    wsgiref.util.setup_testing_defaults(environ)
+
+    response = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response['status'] = status
+        response['headers'] = dict(response_headers)
+
+    if validate:
+        app = wsgiref.validate.validator(app)
+    result = app(environ, start_response)
+    try:
+        response['chunks'] = list(result)
+    finally:
+        close = getattr(result, 'close', None)
+        if close is not None:
+            close()
+    return response
+
+
+@pytest.fixture
+def app():
+    StackInABox.reset_services()
+    StackInABox.register_service(HelloService())
+    StackInABox.register_service(AdvancedService())
+    StackInABox.register_service(StreamingService())
+    StackInABox.register_service(UploadService())
+    yield WSGIApplication()
+    StackInABox.reset_services()
+
+
+def test_basic_wsgi(app):
+    response = call(app, 'GET', '/hello/')
+    assert response['status'] == '200 OK'
+    assert response['headers']['Content-Length'] == '5'
+    assert response['chunks'] == [b'Hello']
+
+
+@pytest.mark.parametrize('method,path,status', [
+    ('GET', '/advanced/h', '200 OK'),
+    ('GET', '/advanced/_234567890', '595 Route Not Handled'),
+    ('PUT', '/advanced/h', '405 Method Not Allowed'),
+    ('GET', '/unknown/', '597 Unknown Service'),
+    ('DELETE', '/advanced/', '204 No Content'),
+])
+def test_status_lines(app, method, path, status):
+    assert call(app, method, path)['status'] == status
+
+
+@pytest.mark.parametrize('method,path', [
+    ('DELETE', '/advanced/'),
+    ('GET', '/stream/cached'),
+])
+def test_bodiless_statuses(app, method, path):
+    response = call(app, method, path, validate=True)
+    assert 'Content-Length' not in response['headers']
+    assert response['chunks'] == []
+
+
+def test_service_error_status_line(app):
+    class BrokenService(StackInABoxService):
+
+        def __init__(self):
+            super(BrokenService, self).__init__('broken')
+            self.register(StackInABoxService.GET, '/',
+                          BrokenService.handler)
+
+        def handler(self, request, uri, headers):
+            raise RuntimeError('broken')
+
+    StackInABox.register_service(BrokenService())
+    assert call(app, 'GET', '/broken/')['status'] == (
+        '596 Service Handler Error'
+    )
+
+
+def test_request(app):
+    response = call(app, 'POST', '/stream/', body=b'\x00body',
+                    headers={'X-Test': 'tested'}, query='a=1&b=2')
+    assert response['status'] == '201 Created'
+    assert response['headers']['X-Echo'] == 'tested'
+    assert response['headers']['X-Path'] == '/stream/?a=1&b=2'
+    assert response['chunks'] == [b'\x00body']
+
+    response = call(app, 'GET', '/advanced/g', query='bob=alice')
+    assert response['chunks'] == [b'{"bob": "bob: Good-Bye alice"}']
+
+
+def test_streamed_body(app):
+    service = StackInABox.get_thread_instance().services['stream'][1]
+
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/stream/chunks'}
+    wsgiref.util.setup_testing_defaults(environ)
+    statuses = []
+    result = app(environ, lambda status, headers: statuses.append(status))
+    assert statuses == ['200 OK']
+
+    # the chunks are produced as the server iterates over the body
+    iterator = iter(result)
+    assert service.produced == 0
+    assert next(iterator) == b'0'
+    assert service.produced == 1
+    assert b''.join(iterator) == b''.join(
+        str(i).encode('utf-8') for i in range(1, 16)
+    )
+    result.close()
+
+    response = call(app, 'GET', '/stream/chunks')
+    assert len(response['chunks']) == StreamingService.CHUNK_COUNT
+    assert 'Content-Length' not in response['headers']
+
+    response = call(app, 'GET', '/stream/file')
+    assert b''.join(response['chunks']) == b'file body'
+
+    response = call(app, 'HEAD', '/stream/chunks')
+    assert response['chunks'] == []
+
+
+def test_request_body_reader(app):
+    body = b'\x01' * 200000
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': '/upload/',
+        'CONTENT_LENGTH': str(len(body)),
+        # the server input goes on past the body, f.e a keep-alive socket
+        'wsgi.input': io.BytesIO(body + b'next request'),
+    }
+    wsgiref.util.setup_testing_defaults(environ)
+    statuses = []
+    result = app(environ, lambda status, headers: statuses.append(status))
+    assert statuses == ['201 Created']
+    assert json.loads(b''.join(result)) == {
+        'sha256': hashlib.sha256(body).hexdigest(),
+        'size': len(body)
+    }
+    assert environ['wsgi.input'].read() == b'next request'
+
+    response = call(app, 'PUT', '/upload/')
+    assert json.loads(b''.join(response['chunks']))['size'] == 0
+
+
+def test_file_response(app, tmp_path):
+    path = tmp_path / 'fixture.bin'
+    path.write_bytes(bytes(range(256)) * 1024)
+    service = FileService(str(path))
+    StackInABox.get_thread_instance().register_service(service)
+
+    response = call(app, 'GET', '/files/', validate=True)
+    assert response['headers']['Content-Length'] == '262144'
+    assert b''.join(response['chunks']) == path.read_bytes()
+
+    response = call(app, 'GET', '/files/part')
+    assert response['headers']['Content-Length'] == '10'
+    assert response['chunks'] == [bytes(range(10, 20))]
+
+    assert all(response.file.closed for response in service.responses)
+
+
+@pytest.mark.parametrize('path,body', [
+    ('/stream/typed/', b'typed'),
+    ('/stream/typed/chunks', b''.join(str(i).encode() for i in range(16))),
+    ('/stream/typed/file', b'file body'),
+])
+def test_wsgi_compliance(app, path, body):
+    response = call(app, 'GET', path, validate=True)
+    assert response['status'] == '200 OK'
+    assert b''.join(response['chunks']) == body
+
+
+def test_hop_by_hop_headers(app):
+    response = call(app, 'GET', '/stream/hop')
+    assert 'Connection' not in response['headers']
+    assert response['headers']['X-Kept'] == 'kept'
+
+
+def test_wsgi_server(app):
+    StackInABox.hold_onto('value', 'held')
+
+    server = wsgiref.simple_server.make_server(
+        '127.0.0.1', 0, app,
+        handler_class=type('QuietHandler',
+                           (wsgiref.simple_server.WSGIRequestHandler,),
+                           {'log_message': lambda *args: None})
+    )
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:{0}'.format(server.server_port)
+
+        res = requests.get(url + '/hello/')
+        assert res.status_code == 200
+        assert res.text == 'Hello'
+
+        # the server thread uses the instance of the application
+        res = requests.get(url + '/stream/hold')
+        assert res.text == 'held'
+
+        res = requests.get(url + '/stream/chunks')
+        assert res.text == ''.join(str(i) for i in range(16))
+
+        res = requests.get(url + '/stream/file')
+        assert res.text == 'file body'
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_in_process_call_keeps_thread_instance(app):
+    instance = StackInABox.get_thread_instance()
+    StackInABox.hold_onto('value', 'caller')
+    other = StackInABox()
+    other.register(StreamingService())
+    other.into_hold('value', 'application')
+
+    # the handlers use the instance of the application while the caller
+    # keeps its own
+    response = call(WSGIApplication(other), 'GET', '/stream/hold')
+    assert response['chunks'] == [b'application']
+    assert StackInABox.get_thread_instance() is instance
+    assert StackInABox.hold_out('value') == 'caller'
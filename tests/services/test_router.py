@@ -1,3 +1,4 @@
+import asyncio
 import re
 
 import ddt
@@ -196,3 +197,420 @@ class TestStackInABoxRouter(base.TestCase):
             http_uri,
             headers
         )
+
+    def test_call_method_parameters(self):
+        instance = router.StackInABoxServiceRouter(
+            self.name,
+            self.uri,
+            None,
+            self.hello_service
+        )
+        headers = {'Jackie': 'O'}
+        expected_result = (200, headers, 'gone fishing')
+
+        mock_fn = mock.MagicMock()
+        mock_fn.return_value = expected_result
+
+        mock_req = mock.MagicMock()
+
+        instance.methods['GET'] = mock_fn
+        result = instance('GET', mock_req, '/lake/42', headers, pond=42)
+        self.assertEqual(result, expected_result)
+        mock_fn.assert_called_with(
+            self.hello_service,
+            mock_req,
+            '/lake/42',
+            headers,
+            pond=42
+        )
+
+    def test_call_async_method(self):
+        instance = router.StackInABoxServiceRouter(
+            self.name,
+            self.uri,
+            None,
+            self.hello_service
+        )
+        headers = {'Jackie': 'O'}
+        calls = []
+
+        async def handler(svc, request, uri, headers, **parameters):
+            calls.append((svc, request, uri, headers, parameters))
+            await asyncio.sleep(0)
+            return (200, headers, 'gone fishing')
+
+        instance.methods['GET'] = handler
+        expected_calls = [
+            (self.hello_service, None, '/lake/42', headers, {'pond': 42})
+        ]
+
+        # awaited on the asynchronous interface
+        result = asyncio.run(
+            instance.call_async('GET', None, '/lake/42', headers, pond=42)
+        )
+        self.assertEqual(result, (200, headers, 'gone fishing'))
+        self.assertEqual(calls, expected_calls)
+
+        # run to completion on the synchronous interface
+        del calls[:]
+        result = instance('GET', None, '/lake/42', headers, pond=42)
+        self.assertEqual(result, (200, headers, 'gone fishing'))
+        self.assertEqual(calls, expected_calls)
+
+    def test_call_async_sync_method(self):
+        instance = router.StackInABoxServiceRouter(
+            self.name,
+            self.uri,
+            None,
+            self.hello_service
+        )
+        headers = {'Jackie': 'O'}
+        expected_result = (600, headers, 'bear trap')
+
+        mock_fn = mock.MagicMock()
+        mock_fn.return_value = expected_result
+
+        instance.methods['GET'] = mock_fn
+        result = asyncio.run(instance.call_async('GET', None, '/', headers))
+        self.assertEqual(result, expected_result)
+        mock_fn.assert_called_with(self.hello_service, None, '/', headers)
+
+    def test_call_async_sub_object(self):
+        instance = router.StackInABoxServiceRouter(
+            self.name,
+            self.uri,
+            None,
+            None
+        )
+        instance.set_subservice(self.hello_service)
+        headers = {'Jackie': 'O'}
+        result = asyncio.run(instance.call_async('GET', None, '/', headers))
+        self.assertEqual(result, (200, headers, 'Hello'))
+
+    def test_call_async_bad_route(self):
+        instance = router.StackInABoxServiceRouter(
+            self.name,
+            self.uri,
+            None,
+            None
+        )
+        headers = {'Jackie': 'O'}
+        result = asyncio.run(instance.call_async('GET', None, '/', headers))
+        self.assertEqual(len(result), 3)
+        self.assertEqual(result[0], 405)
+        self.assertEqual(result[1], headers)
+
+
+@ddt.ddt
+class TestStackInABoxRouteMatcher(base.TestCase):
+
+    def setUp(self):
+        super(TestStackInABoxRouteMatcher, self).setUp()
+
+    def tearDown(self):
+        super(TestStackInABoxRouteMatcher, self).tearDown()
+
+    @staticmethod
+    def match_router(instance, uri_path):
+        result = instance.match(uri_path)
+        if result is None:
+            return None
+        handlers, parameters = result
+        assert parameters == {}
+        return handlers
+
+    @staticmethod
+    def make_routes(*regexes):
+        return {
+            regex: {
+                'regex': (
+                    re.compile(regex) if isinstance(regex, str) else regex
+                ),
+                'uri': regex,
+                'handlers': 'router-{0}'.format(index)
+            }
+            for index, regex in enumerate(regexes)
+        }
+
+    def test_empty(self):
+        instance = router.StackInABoxRouteMatcher({})
+        self.assertEqual(instance.matchers, [])
+        self.assertIsNone(self.match_router(instance, '/'))
+
+    @ddt.data(
+        ('/', 'router-0'),
+        ('/helix', 'router-1'),
+        ('/123', 'router-2'),
+        ('/123/456', 'router-3'),
+        ('/abc', None),
+    )
+    @ddt.unpack
+    def test_match(self, uri_path, expected_router):
+        instance = router.StackInABoxRouteMatcher(
+            self.make_routes('^/$', '^/helix$', r'^/\d+$', r'^/\d+/')
+        )
+        self.assertEqual(len(instance.matchers), 1)
+        self.assertEqual(
+            self.match_router(instance, uri_path),
+            expected_router
+        )
+
+    @ddt.data(
+        (r'^/\d+$', r'^/1\d*$', '/123', 'router-0'),
+        (r'^/1\d*$', r'^/\d+$', '/123', 'router-0'),
+        (r'^/1\d*$', r'^/\d+$', '/234', 'router-1'),
+    )
+    @ddt.unpack
+    def test_match_first_registered_wins(
+        self, first_regex, second_regex, uri_path, expected_router
+    ):
+        instance = router.StackInABoxRouteMatcher(
+            self.make_routes(first_regex, second_regex)
+        )
+        self.assertEqual(
+            self.match_router(instance, uri_path),
+            expected_router
+        )
+
+    def test_match_named_groups(self):
+        instance = router.StackInABoxRouteMatcher(
+            self.make_routes(r'^/(?P<name>\w+)/a$', r'^/(?P<id>\d+)/b$')
+        )
+        self.assertEqual(len(instance.matchers), 1)
+        self.assertEqual(self.match_router(instance, '/abc/a'), 'router-0')
+        self.assertEqual(self.match_router(instance, '/123/b'), 'router-1')
+
+    @ddt.data(
+        (r'^/(\w+)/\1$', '/abc/abc', '/abc/def'),
+        (r'^/(?P<x>\w+)/(?P=x)$', '/abc/abc', '/abc/def'),
+        (re.compile('^/abc$', re.I), '/ABC', '/def'),
+        (r'(?i)^/abc$', '/ABC', '/def'),
+    )
+    @ddt.unpack
+    def test_match_uncombinable(self, regex, matching_uri, missing_uri):
+        instance = router.StackInABoxRouteMatcher(
+            self.make_routes('^/first$', regex, '^/last$')
+        )
+        self.assertEqual(len(instance.matchers), 3)
+        self.assertEqual(self.match_router(instance, '/first'), 'router-0')
+        self.assertEqual(self.match_router(instance, matching_uri), 'router-1')
+        self.assertEqual(self.match_router(instance, '/last'), 'router-2')
+        self.assertIsNone(self.match_router(instance, missing_uri))
+
+    def test_match_duplicate_group_names(self):
+        instance = router.StackInABoxRouteMatcher(
+            self.make_routes(r'^/(?P<x>\d+)/a$', r'^/(?P<x>\d+)/b$')
+        )
+        self.assertEqual(len(instance.matchers), 2)
+        self.assertEqual(self.match_router(instance, '/1/a'), 'router-0')
+        self.assertEqual(self.match_router(instance, '/1/b'), 'router-1')
+
+    @ddt.data(
+        ('/v1/tokens', True),
+        ('/v1/my-tokens', True),
+        ('/', True),
+        ('/v1/.*', False),
+        ('/v1/(tokens)', False),
+        ('/v1/tokens?', False),
+        ('/v1/tokens$', False),
+        (re.compile('^/v1/tokens$'), False),
+    )
+    @ddt.unpack
+    def test_is_literal(self, uri, expected_result):
+        route = {
+            'regex': service.StackInABoxService.get_service_regex(
+                '/', uri, False
+            ),
+            'uri': uri,
+            'handlers': None
+        }
+        self.assertEqual(
+            router.StackInABoxRouteMatcher.is_literal(route),
+            expected_result
+        )
+
+    def test_is_literal_mismatched_regex(self):
+        route = {
+            'regex': re.compile('^/helix$'),
+            'uri': '/helix-double',
+            'handlers': None
+        }
+        self.assertFalse(router.StackInABoxRouteMatcher.is_literal(route))
+
+    def test_match_literal(self):
+        routes = self.make_routes(r'^/\w+$')
+        routes['/a'] = {
+            'regex': re.compile('^/a$'),
+            'uri': '/a',
+            'handlers': 'literal-router'
+        }
+        instance = router.StackInABoxRouteMatcher(routes)
+        self.assertEqual(instance.literals, {'/a': 'literal-router'})
+        self.assertEqual(len(instance.matchers), 1)
+        self.assertEqual(self.match_router(instance, '/a'), 'literal-router')
+        self.assertEqual(self.match_router(instance, '/b'), 'router-0')
+        self.assertIsNone(self.match_router(instance, '/a/'))
+
+    def test_match_template(self):
+        routes = self.make_routes(r'^/users/\w+$')
+        for template in ('/users/{id:int}', '/users/me'):
+            routes[template] = {
+                'regex': service.StackInABoxService.get_service_regex(
+                    '/', template, False
+                ),
+                'uri': template,
+                'handlers': template
+            }
+        instance = router.StackInABoxRouteMatcher(routes)
+        self.assertEqual(instance.literals, {'/users/me': '/users/me'})
+        self.assertIsInstance(instance.tree, router.StackInABoxRouteTree)
+        self.assertEqual(
+            instance.match('/users/me'), ('/users/me', {})
+        )
+        self.assertEqual(
+            instance.match('/users/42'), ('/users/{id:int}', {'id': 42})
+        )
+        self.assertEqual(
+            instance.match('/users/bob'), ('router-0', {})
+        )
+
+
+@ddt.ddt
+class TestStackInABoxRouteTree(base.TestCase):
+
+    TEMPLATES = (
+        '/containers',
+        '/containers/{container}',
+        '/containers/{container}/objects/{obj:path}',
+        '/containers/{container}/metadata',
+        '/containers/default/metadata',
+        '/users/{id:int}',
+        '/users/{name}',
+        '/users/{name}/',
+    )
+
+    def setUp(self):
+        super(TestStackInABoxRouteTree, self).setUp()
+        self.tree = router.StackInABoxRouteTree()
+        for template in self.TEMPLATES:
+            self.tree.add(template, template)
+
+    def tearDown(self):
+        super(TestStackInABoxRouteTree, self).tearDown()
+
+    @ddt.data(
+        ('/containers/{container}', True),
+        ('/users/{id:int}', True),
+        ('/containers', False),
+        ('/users/{}', False),
+        ('/users/{1}', False),
+        (r'^/users/\d{1,3}$', False),
+        (re.compile('^/users/{id}$'), False),
+    )
+    @ddt.unpack
+    def test_is_template(self, uri, expected_result):
+        self.assertEqual(
+            router.StackInABoxRouteTree.is_template(uri),
+            expected_result
+        )
+
+    @ddt.data(
+        ('/a/{b}', ['', 'a', ('b', 'str')]),
+        ('/a/{b:int}/{c:path}', ['', 'a', ('b', 'int'), ('c', 'path')]),
+        ('/{a}/', ['', ('a', 'str'), '']),
+    )
+    @ddt.unpack
+    def test_parse_template(self, template, expected_segments):
+        self.assertEqual(
+            router.StackInABoxRouteTree.parse_template(template),
+            expected_segments
+        )
+
+    @ddt.data(
+        '/a/b{c}',
+        '/a/{b:float}',
+        '/a/{b}/{b}',
+        '/a/{b:path}/c',
+        '/a/{request}',
+        '/a/{uri:path}',
+        '/a/{headers:int}',
+        '/a/{method}',
+        '/a/{self}',
+    )
+    def test_parse_template_invalid(self, template):
+        with self.assertRaises(exceptions.InvalidRouteTemplateError):
+            router.StackInABoxRouteTree.parse_template(template)
+
+    @ddt.data(
+        ('/a/{b}', '^/a/(?P<b>[^/]+)$'),
+        ('/a.json/{b:int}', r'^/a\.json/(?P<b>\d+)$'),
+        ('/a/{b:path}', '^/a/(?P<b>.+)$'),
+    )
+    @ddt.unpack
+    def test_get_template_regex(self, template, expected_regex):
+        self.assertEqual(
+            router.StackInABoxRouteTree.get_template_regex(template),
+            expected_regex
+        )
+
+    @ddt.data(
+        ('/containers', '/containers', {}),
+        ('/containers/c1', '/containers/{container}', {'container': 'c1'}),
+        (
+            '/containers/c1/objects/o1',
+            '/containers/{container}/objects/{obj:path}',
+            {'container': 'c1', 'obj': 'o1'}
+        ),
+        (
+            '/containers/c1/objects/a/b/c.txt',
+            '/containers/{container}/objects/{obj:path}',
+            {'container': 'c1', 'obj': 'a/b/c.txt'}
+        ),
+        (
+            '/containers/c1/metadata',
+            '/containers/{container}/metadata',
+            {'container': 'c1'}
+        ),
+        (
+            '/containers/default/metadata',
+            '/containers/default/metadata',
+            {}
+        ),
+        (
+            '/containers/default/objects/o1',
+            '/containers/{container}/objects/{obj:path}',
+            {'container': 'default', 'obj': 'o1'}
+        ),
+        ('/users/42', '/users/{id:int}', {'id': 42}),
+        ('/users/bob', '/users/{name}', {'name': 'bob'}),
+        ('/users/bob/', '/users/{name}/', {'name': 'bob'}),
+    )
+    @ddt.unpack
+    def test_match(self, uri_path, expected_template, expected_parameters):
+        self.assertEqual(
+            self.tree.match(uri_path),
+            (expected_template, expected_parameters)
+        )
+
+    @ddt.data(
+        '/',
+        '/containers/',
+        '/containers/c1/objects',
+        '/containers/c1/objects/',
+        '/users',
+        '/users/42/profile',
+    )
+    def test_match_missing(self, uri_path):
+        self.assertIsNone(self.tree.match(uri_path))
+
+    def test_add_first_registered_wins(self):
+        self.tree.add('/users/{id:int}', 'second')
+        self.tree.add('/containers/{container}/objects/{obj:path}', 'second')
+        self.assertEqual(
+            self.tree.match('/users/42')[0],
+            '/users/{id:int}'
+        )
+        self.assertEqual(
+            self.tree.match('/containers/c1/objects/o1')[0],
+            '/containers/{container}/objects/{obj:path}'
+        )
@@ -1,6 +1,9 @@
+import asyncio
+import gzip
 import re
 
 import ddt
+import mock
 
 from stackinabox.services import (
     exceptions,
@@ -8,6 +11,8 @@ from stackinabox.services import (
     router
 )
 
+from stackinabox.util.tools import CaseInsensitiveDict
+
 from tests.services import base
 
 
@@ -34,6 +39,12 @@ class FakeRouter(object):
         return return_value
 
 
+class FakeRequest(object):
+
+    def __init__(self, **headers):
+        self.headers = CaseInsensitiveDict(headers)
+
+
 @ddt.ddt
 class TestStackInABoxService(base.TestCase):
 
@@ -89,6 +100,7 @@ class TestStackInABoxService(base.TestCase):
         ('/', re.compile('^/$'), False, '^/$'),
         ('/', re.compile('^/'), True, '^/'),
         ('/', '/hello', False, '^/hello$'),
+        ('/', '/hello/{name}', False, '^/hello/(?P<name>[^/]+)$'),
     )
     @ddt.unpack
     def test_get_service_regex(
@@ -306,3 +318,344 @@ class TestStackInABoxService(base.TestCase):
             instance.routes[uri]['handlers'],
             router.StackInABoxServiceRouter
         )
+
+    def test_match_route(self):
+        def call_me():
+            pass
+
+        instance = service.StackInABoxService('maze')
+        self.assertIsNone(instance.match_route('/a'))
+
+        instance.register('GET', re.compile(r'^/\w+$'), call_me)
+        instance.register('GET', '/a', call_me)
+        instance.register('GET', '/a.b', call_me)
+
+        # string routes are matched exactly before any regex routes
+        self.assertEqual(
+            instance.match_route('/a')[0],
+            instance.routes['/a']['handlers']
+        )
+        self.assertEqual(
+            instance.match_route('/b')[0],
+            instance.routes[re.compile(r'^/\w+$')]['handlers']
+        )
+        self.assertIsNone(instance.match_route('/a/bc'))
+
+        # string routes using regex syntax are still regex routes
+        self.assertEqual(
+            instance.match_route('/a-b')[0],
+            instance.routes['/a.b']['handlers']
+        )
+
+        instance.register_subservice(
+            re.compile('^/a/'),
+            service.StackInABoxService('cheese')
+        )
+        self.assertEqual(
+            instance.match_route('/a/bc')[0],
+            instance.routes[re.compile('^/a/')]['handlers']
+        )
+
+    def test_route_matcher_rebuilt(self):
+        def call_me():
+            pass
+
+        instance = service.StackInABoxService('maze')
+        instance.register('GET', '/a', call_me)
+        matcher = instance.route_matcher
+        self.assertIs(instance.route_matcher, matcher)
+
+        # registering another method on an existing route keeps the matcher
+        instance.register('POST', '/a', call_me)
+        self.assertIs(instance.route_matcher, matcher)
+
+        instance.register('GET', '/b', call_me)
+        self.assertIsNot(instance.route_matcher, matcher)
+
+        matcher = instance.route_matcher
+        instance.base_url = '/elsewhere'
+        self.assertIsNot(instance.route_matcher, matcher)
+
+        matcher = instance.route_matcher
+        instance.routes = {}
+        self.assertIsNot(instance.route_matcher, matcher)
+        self.assertIsNone(instance.match_route('/a'))
+
+    def test_register_reserved_template_parameter(self):
+        instance = service.StackInABoxService('reserved')
+        with self.assertRaisesRegex(exceptions.InvalidRouteTemplateError,
+                                    'request is reserved'):
+            instance.register(service.StackInABoxService.GET,
+                              '/users/{request}', lambda *args: None)
+        self.assertEqual(instance.routes, {})
+
+    def test_get_service_regex_invalid_template(self):
+        with self.assertRaises(exceptions.InvalidRouteTemplateError):
+            service.StackInABoxService.get_service_regex(
+                '/', '/hello/{name}/{name}', False
+            )
+
+    @ddt.data(
+        ('/containers/c1/objects/a/b', 200, 'c1: a/b'),
+        ('/containers/c1/objects/a/b?format=json', 200, 'c1: a/b'),
+        ('/containers/c1/objects/', 595, None),
+        ('/users/42', 200, 'user 43'),
+        ('/users/bob', 595, None),
+    )
+    @ddt.unpack
+    def test_request_template(self, uri, expected_status, expected_body):
+        def object_handler(svc, request, uri, headers, container, obj):
+            return (200, headers, '{0}: {1}'.format(container, obj))
+
+        def user_handler(svc, request, uri, headers, id):
+            return (200, headers, 'user {0}'.format(id + 1))
+
+        instance = service.StackInABoxService('storage')
+        instance.register(
+            'GET',
+            '/containers/{container}/objects/{obj:path}',
+            object_handler
+        )
+        instance.register('GET', '/users/{id:int}', user_handler)
+
+        status_code, headers, body = instance.request('GET', None, uri, {})
+        self.assertEqual(status_code, expected_status)
+        if expected_body is not None:
+            self.assertEqual(body, expected_body)
+
+    def test_route_cache(self):
+        def call_me(svc, request, uri, headers):
+            return (200, headers, 'called')
+
+        instance = service.StackInABoxService('maze')
+        self.assertIsNone(instance.route_cache)
+        instance.register('GET', '/a', call_me)
+
+        route_cache = instance.enable_route_cache(2)
+        self.assertIs(instance.route_cache, route_cache)
+
+        for _ in range(3):
+            self.assertEqual(
+                instance.request('GET', None, '/a?x=1', {}),
+                (200, {}, 'called')
+            )
+        self.assertEqual(route_cache.misses, 1)
+        self.assertEqual(route_cache.hits, 2)
+
+        # unmatched URI paths are cached too
+        for _ in range(2):
+            self.assertEqual(
+                instance.request('GET', None, '/b', {})[0],
+                595
+            )
+        self.assertEqual(route_cache.misses, 2)
+        self.assertEqual(route_cache.hits, 3)
+
+        instance.disable_route_cache()
+        self.assertIsNone(instance.route_cache)
+        self.assertEqual(instance.request('GET', None, '/a', {})[0], 200)
+        self.assertEqual(route_cache.hits, 3)
+
+    def test_route_cache_stale_entries(self):
+        def call_me(svc, request, uri, headers):
+            return (200, headers, 'called')
+
+        instance = service.StackInABoxService('maze')
+        instance.register('GET', '/a', call_me)
+        route_cache = instance.enable_route_cache()
+        replaced_matcher = instance.route_matcher
+        instance.register('GET', '/b', call_me)
+
+        # a request still using the replaced matcher caches its result after
+        # the routes changed
+        with mock.patch.object(service.StackInABoxService, 'route_matcher',
+                               new_callable=mock.PropertyMock,
+                               return_value=replaced_matcher):
+            self.assertIsNone(instance.match_route('/b'))
+
+        self.assertEqual(instance.request('GET', None, '/b', {})[0], 200)
+        self.assertEqual(route_cache.hits, 0)
+        self.assertEqual(route_cache.misses, 2)
+
+    @ddt.data(
+        'register',
+        'register_subservice',
+        'base_url',
+        'routes'
+    )
+    def test_route_cache_invalidated(self, change):
+        def call_me(svc, request, uri, headers):
+            return (200, headers, 'called')
+
+        instance = service.StackInABoxService('maze')
+        route_cache = instance.enable_route_cache()
+        self.assertEqual(instance.request('GET', None, '/b', {})[0], 595)
+        self.assertEqual(len(route_cache), 1)
+
+        if change == 'register':
+            instance.register('GET', '/b', call_me)
+            expected_status = 200
+        elif change == 'register_subservice':
+            sub_service = service.StackInABoxService('cheese')
+            sub_service.register('GET', '/b', call_me)
+            instance.register_subservice('/b', sub_service)
+            expected_status = 200
+        elif change == 'base_url':
+            instance.base_url = '/elsewhere'
+            expected_status = 595
+        else:
+            instance.routes = {}
+            expected_status = 595
+
+        self.assertEqual(len(route_cache), 0)
+        self.assertEqual(
+            instance.request('GET', None, '/b', {})[0],
+            expected_status
+        )
+
+    def test_range_requests(self):
+        def call_me(svc, request, uri, headers):
+            return (200, headers, '0123456789')
+
+        instance = service.StackInABoxService('maze')
+        self.assertFalse(instance.range_requests)
+        instance.register('GET', '/a', call_me)
+
+        request = FakeRequest(Range='bytes=2-4')
+        self.assertEqual(
+            instance.request('GET', request, '/a', {}),
+            (200, {}, '0123456789')
+        )
+
+        instance.enable_range_requests()
+        status_code, headers, body = instance.request('GET', request, '/a',
+                                                      {})
+        self.assertEqual(status_code, 206)
+        self.assertEqual(headers['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(bytes(body), b'234')
+
+        status_code, headers, body = instance.request('GET', FakeRequest(),
+                                                      '/a', {})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['Accept-Ranges'], 'bytes')
+
+        # requests without any headers are answered in full
+        self.assertEqual(instance.request('GET', None, '/a', {})[0], 200)
+        self.assertEqual(instance.request('GET', None, '/b', {})[0], 595)
+
+        instance.disable_range_requests()
+        self.assertEqual(instance.request('GET', request, '/a', {})[0], 200)
+
+    def test_range_requests_async(self):
+        async def call_me(svc, request, uri, headers):
+            return (200, headers, b'0123456789')
+
+        instance = service.StackInABoxService('maze')
+        instance.register('GET', '/a', call_me)
+        instance.enable_range_requests()
+
+        status_code, headers, body = asyncio.run(instance.request_async(
+            'GET', FakeRequest(Range='bytes=-3'), '/a', {}
+        ))
+        self.assertEqual(status_code, 206)
+        self.assertEqual(headers['Content-Range'], 'bytes 7-9/10')
+        self.assertEqual(body, b'789')
+
+    def test_conditional_requests(self):
+        calls = []
+
+        def call_me(svc, request, uri, headers):
+            calls.append(uri)
+            return (200, headers, 'called')
+
+        def change(svc, request, uri, headers):
+            return (204, headers, '')
+
+        instance = service.StackInABoxService('maze')
+        self.assertIsNone(instance.conditional_requests)
+        instance.register('GET', '/a', call_me)
+        instance.register('PUT', '/a', change)
+        conditional = instance.enable_conditional_requests()
+        self.assertIs(instance.conditional_requests, conditional)
+
+        status_code, headers, _ = instance.request('GET', FakeRequest(),
+                                                   '/a', {})
+        self.assertEqual(status_code, 200)
+        etag = headers['ETag']
+        self.assertEqual(len(calls), 1)
+
+        request = FakeRequest(**{'If-None-Match': etag})
+        self.assertEqual(instance.request('GET', request, '/a', {}),
+                         (304, {'ETag': etag}, ''))
+        self.assertEqual(len(calls), 1)
+
+        # changing the resource makes the handler validate it again
+        self.assertEqual(instance.request('PUT', None, '/a', {})[0], 204)
+        self.assertEqual(instance.request('GET', request, '/a', {})[0], 304)
+        self.assertEqual(len(calls), 2)
+
+        instance.register('GET', '/b', call_me)
+        self.assertEqual(len(conditional.validators), 0)
+
+        instance.disable_conditional_requests()
+        self.assertEqual(instance.request('GET', request, '/a', {})[0], 200)
+
+    def test_conditional_range_requests(self):
+        def call_me(svc, request, uri, headers):
+            return (200, headers, b'0123456789')
+
+        instance = service.StackInABoxService('maze')
+        instance.register('GET', '/a', call_me)
+        instance.enable_conditional_requests()
+        instance.enable_range_requests()
+
+        etag = asyncio.run(instance.request_async(
+            'GET', FakeRequest(), '/a', {}
+        ))[1]['ETag']
+
+        # the ETag is the one of the whole body
+        status_code, headers, body = asyncio.run(instance.request_async(
+            'GET', FakeRequest(Range='bytes=0-1', **{'If-Range': etag}),
+            '/a', {}
+        ))
+        self.assertEqual(status_code, 206)
+        self.assertEqual(headers['ETag'], etag)
+        self.assertEqual(bytes(body), b'01')
+
+        self.assertEqual(asyncio.run(instance.request_async(
+            'GET', FakeRequest(**{'If-None-Match': etag}), '/a', {}
+        ))[0], 304)
+
+    def test_compression(self):
+        def call_me(svc, request, uri, headers):
+            return (200, headers, b'0123456789' * 100)
+
+        instance = service.StackInABoxService('maze')
+        self.assertIsNone(instance.compression)
+        instance.register('GET', '/a', call_me)
+        instance.enable_conditional_requests()
+        compression = instance.enable_compression()
+        self.assertIs(instance.compression, compression)
+
+        request = FakeRequest(**{'Accept-Encoding': 'gzip'})
+        status_code, headers, body = instance.request('GET', request, '/a',
+                                                      {})
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'0123456789' * 100)
+        # the ETag of the uncompressed body still validates the response
+        etag = headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        request = FakeRequest(**{'Accept-Encoding': 'gzip',
+                                 'If-None-Match': etag})
+        status_code, headers, _ = instance.request('GET', request, '/a', {})
+        self.assertEqual(status_code, 304)
+        # the 304 carries the validators of the compressed response
+        self.assertEqual(headers['ETag'], etag)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+        instance.disable_compression()
+        self.assertNotIn(
+            'Content-Encoding',
+            instance.request('GET', FakeRequest(), '/a', {})[1]
+        )
@@ -1,11 +1,17 @@
+import asyncio
+import contextvars
+from concurrent import futures
 import mock
 import re
+import sys
+import threading
 
 import ddt
 import requests
 
 from stackinabox import stack
 from stackinabox.services import service
+from stackinabox.util.tools import HoldStore
 
 from tests import base
 from tests.utils import (
@@ -14,6 +20,19 @@ from tests.utils import (
 )
 
 
+class NamedHelloService(service.StackInABoxService):
+
+    def __init__(self, name, message='Hello'):
+        super(NamedHelloService, self).__init__(name)
+        self.message = message
+        self.register(service.StackInABoxService.GET,
+                      '/',
+                      NamedHelloService.handler)
+
+    def handler(self, request, uri, headers):
+        return (200, headers, self.message)
+
+
 class ExceptionalServices(service.StackInABoxService):
 
     def __init__(self):
@@ -26,6 +45,45 @@ class ExceptionalServices(service.StackInABoxService):
         raise Exception('Exceptional Service Failure')
 
 
+class AsyncHelloService(service.StackInABoxService):
+
+    def __init__(self, name, delay=0, uri='/'):
+        super(AsyncHelloService, self).__init__(name)
+        self.delay = delay
+        self.register(service.StackInABoxService.GET,
+                      uri,
+                      AsyncHelloService.handler)
+        self.register(service.StackInABoxService.POST,
+                      uri,
+                      AsyncHelloService.failure)
+        if uri == '/':
+            self.register_subservice(
+                re.compile('^/nested/'),
+                AsyncHelloService('nested', uri='/nested/')
+            )
+
+    async def handler(self, request, uri, headers):
+        await asyncio.sleep(self.delay)
+        return (200, headers, 'Hello {0}'.format(self.name))
+
+    async def failure(self, request, uri, headers):
+        await asyncio.sleep(0)
+        raise Exception('Exceptional Async Service Failure')
+
+
+class AsyncHoldingService(service.StackInABoxService):
+
+    def __init__(self):
+        super(AsyncHoldingService, self).__init__('holding')
+        self.register(service.StackInABoxService.GET,
+                      '/',
+                      AsyncHoldingService.handler)
+
+    async def handler(self, request, uri, headers):
+        await asyncio.sleep(0)
+        return (200, headers, stack.StackInABox.hold_out('x'))
+
+
 @ddt.ddt
 class TestStack(base.TestCase):
 
@@ -62,7 +120,7 @@ class TestStack(base.TestCase):
             name = 'emo'
             data = 'Fearless'
             stack.StackInABox.hold_onto(name, data)
-            mock_hold.assert_called_once_with(name, data)
+            mock_hold.assert_called_once_with(name, data, False)
 
     def test_hold_out(self):
         with mock.patch(
@@ -144,6 +202,7 @@ class TestStack(base.TestCase):
 
         theStack.reset()
         self.assertEqual(theStack.services, {})
+        self.assertEqual(theStack.service_index, {})
         self.assertEqual(theStack.holds, {})
 
     def test_register(self):
@@ -156,6 +215,24 @@ class TestStack(base.TestCase):
         matcher, stored_service = theStack.services[service.name]
         self.assertEqual(service, stored_service)
         self.assertIsInstance(matcher, type(re.compile('')))
+        self.assertEqual(
+            theStack.service_index,
+            {'hello': (('/hello/', service),)}
+        )
+
+    @ddt.data(
+        ('hello', 'hello'),
+        ('/hello/', 'hello'),
+        ('hello/v1', 'hello'),
+        ('/hello/v1/world', 'hello'),
+        ('', '')
+    )
+    @ddt.unpack
+    def test_get_service_index_key(self, uri, expected_key):
+        self.assertEqual(
+            stack.StackInABox.get_service_index_key(uri),
+            expected_key
+        )
 
     def test_double_service_registration(self):
         service1 = hello.HelloService()
@@ -211,6 +288,416 @@ class TestStack(base.TestCase):
         self.assertEqual(headers, {})
         self.assertEqual('Hello', msg)
 
+    @ddt.data(
+        ('localhost/hello/', 200, 'Hello'),
+        ('localhost/hello/v1/', 200, 'Hello v1'),
+        ('localhost/hello/v2/', 595, None),
+        ('localhost/hello', 597, None),
+        ('localhost/hello-world/', 597, None),
+    )
+    @ddt.unpack
+    def test_call_multi_segment_service(self, uri, status, body):
+        theStack = stack.StackInABox()
+        theStack.register(NamedHelloService('hello/v1', 'Hello v1'))
+        theStack.register(NamedHelloService('hello'))
+        theStack.base_url = 'localhost'
+        self.assertEqual(len(theStack.service_index), 1)
+
+        status_code, headers, msg = theStack.call(
+            'GET', mock.MagicMock(), uri, {}
+        )
+        self.assertEqual(status_code, status)
+        if body is not None:
+            self.assertEqual(msg, body)
+
+    def test_call_many_services(self):
+        theStack = stack.StackInABox()
+        for service_number in range(100):
+            theStack.register(
+                NamedHelloService(
+                    'service{0}'.format(service_number),
+                    'Hello {0}'.format(service_number)
+                )
+            )
+        theStack.base_url = 'localhost'
+        self.assertEqual(len(theStack.service_index), 100)
+
+        status_code, headers, msg = theStack.call(
+            'GET', mock.MagicMock(), 'localhost/service99/', {}
+        )
+        self.assertEqual(status_code, 200)
+        self.assertEqual(msg, 'Hello 99')
+
+    def test_call_while_registering(self):
+        theStack = stack.StackInABox()
+        theStack.base_url = 'localhost'
+        growing_service = NamedHelloService('growing')
+        theStack.register(growing_service)
+
+        service_count = 100
+        thread_count = 8
+        stop = threading.Event()
+        failures = []
+
+        def route_handler(svc, request, uri, headers):
+            return (200, headers, uri)
+
+        def client(thread_number):
+            call_number = 0
+            while not stop.is_set():
+                call_number += 1
+                service_number = (
+                    thread_number * call_number
+                ) % service_count
+                uris = (
+                    (
+                        'localhost/service{0}/'.format(service_number),
+                        (200, 597)
+                    ),
+                    (
+                        'localhost/growing/{0}'.format(service_number),
+                        (200, 595)
+                    ),
+                )
+                for uri, allowed_statuses in uris:
+                    try:
+                        status_code, _, _ = theStack.call(
+                            'GET', mock.MagicMock(), uri, {}
+                        )
+                    except Exception as ex:
+                        failures.append(ex)
+                    else:
+                        if status_code not in allowed_statuses:
+                            failures.append((uri, status_code))
+
+        clients = [
+            threading.Thread(target=client, args=(thread_number + 1,))
+            for thread_number in range(thread_count)
+        ]
+
+        # switch threads as often as possible to provoke races
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        for thread in clients:
+            thread.start()
+
+        try:
+            for service_number in range(service_count):
+                theStack.register(
+                    NamedHelloService('service{0}'.format(service_number))
+                )
+                growing_service.register(
+                    service.StackInABoxService.GET,
+                    '/{0}'.format(service_number),
+                    route_handler
+                )
+                if service_number % 25 == 0:
+                    theStack.base_url = 'localhost'
+        finally:
+            stop.set()
+            for thread in clients:
+                thread.join()
+            sys.setswitchinterval(switch_interval)
+
+        self.assertEqual(failures, [])
+        self.assertEqual(len(theStack.services), service_count + 1)
+        for service_number in range(service_count):
+            status_code, _, _ = theStack.call(
+                'GET',
+                mock.MagicMock(),
+                'localhost/service{0}/'.format(service_number),
+                {}
+            )
+            self.assertEqual(status_code, 200)
+
+            status_code, _, _ = theStack.call(
+                'GET',
+                mock.MagicMock(),
+                'localhost/growing/{0}'.format(service_number),
+                {}
+            )
+            self.assertEqual(status_code, 200)
+
+    def test_thread_pool_uses_own_instances(self):
+        stack.StackInABox.register_service(NamedHelloService('pooled'))
+        stack.StackInABox.update_uri('localhost')
+
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(
+                lambda _: stack.StackInABox.call_into(
+                    'GET', mock.MagicMock(), 'localhost/pooled/', {}
+                )[0],
+                range(4)
+            ))
+        self.assertEqual(results, [597] * 4)
+
+    def test_bind_thread_instance(self):
+        stack.StackInABox.register_service(NamedHelloService('pooled'))
+        stack.StackInABox.update_uri('localhost')
+        instance = stack.StackInABox.get_thread_instance()
+
+        with futures.ThreadPoolExecutor(
+            max_workers=2,
+            initializer=stack.StackInABox.bind_thread_instance,
+            initargs=(instance,)
+        ) as executor:
+            results = list(executor.map(
+                lambda _: (
+                    stack.StackInABox.get_thread_instance(),
+                    stack.StackInABox.call_into(
+                        'GET', mock.MagicMock(), 'localhost/pooled/', {}
+                    )[0]
+                ),
+                range(4)
+            ))
+        self.assertEqual(results, [(instance, 200)] * 4)
+
+    def test_shared_instance(self):
+        stack.StackInABox.register_service(NamedHelloService('pooled'))
+        stack.StackInABox.update_uri('localhost')
+        instance = stack.StackInABox.get_thread_instance()
+
+        try:
+            self.assertIs(stack.StackInABox.enable_shared_instance(),
+                          instance)
+
+            def pooled_call(hold_name):
+                stack.StackInABox.hold_onto(hold_name, hold_name)
+                return stack.StackInABox.call_into(
+                    'GET', mock.MagicMock(), 'localhost/pooled/', {}
+                )[0]
+
+            with futures.ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(pooled_call, range(16)))
+            self.assertEqual(results, [200] * 16)
+            self.assertEqual(instance.holds, {i: i for i in range(16)})
+        finally:
+            self.assertIs(stack.StackInABox.disable_shared_instance(),
+                          instance)
+
+        self.assertIsNone(stack.StackInABox.disable_shared_instance())
+        self.assertIs(stack.StackInABox.get_thread_instance(), instance)
+        thread_instances = []
+        worker = threading.Thread(
+            target=lambda: thread_instances.append(
+                stack.StackInABox.get_thread_instance()
+            )
+        )
+        worker.start()
+        worker.join()
+        self.assertIsNot(thread_instances[0], instance)
+
+    def test_shared_instance_explicit(self):
+        shared = stack.StackInABox()
+        try:
+            stack.StackInABox.enable_shared_instance(shared)
+            self.assertIs(stack.StackInABox.get_thread_instance(), shared)
+        finally:
+            stack.StackInABox.disable_shared_instance()
+        self.assertIsNot(stack.StackInABox.get_thread_instance(), shared)
+
+    def test_shared_instance_with_context_instances(self):
+        shared = stack.StackInABox()
+        other = stack.StackInABox()
+        try:
+            stack.StackInABox.enable_shared_instance(shared)
+            with stack.StackInABox.use_instance(other):
+                self.assertIs(stack.StackInABox.get_thread_instance(), other)
+            self.assertIs(stack.StackInABox.get_thread_instance(), shared)
+
+            async def scenario():
+                return (stack.StackInABox.isolate(),
+                        stack.StackInABox.get_thread_instance())
+
+            isolated, instance = asyncio.run(scenario())
+            self.assertIs(instance, isolated)
+            self.assertIsNot(instance, shared)
+            self.assertIs(stack.StackInABox.get_thread_instance(), shared)
+        finally:
+            stack.StackInABox.disable_shared_instance()
+
+    def test_global_instance_unset(self):
+        store = stack.ContextStore()
+        self.assertFalse(hasattr(store, 'instance'))
+        self.assertIsNone(store.get())
+
+        store.instance = 'phalzbottom'
+        self.assertEqual(store.instance, 'phalzbottom')
+        self.assertEqual(store.get(), 'phalzbottom')
+
+    def test_isolate(self):
+        instance = stack.StackInABox.get_thread_instance()
+
+        def isolate():
+            isolated = stack.StackInABox.isolate()
+            self.assertIsNot(isolated, instance)
+            self.assertIs(stack.StackInABox.get_thread_instance(), isolated)
+
+        contextvars.copy_context().run(isolate)
+        # the instance of the thread is left as it is
+        self.assertIs(stack.local_store.instance, instance)
+        self.assertIs(stack.StackInABox.get_thread_instance(), instance)
+
+    def test_use_instance(self):
+        instance = stack.StackInABox.get_thread_instance()
+        other = stack.StackInABox()
+        with stack.StackInABox.use_instance(other) as bound:
+            self.assertIs(bound, other)
+            self.assertIs(stack.StackInABox.get_thread_instance(), other)
+            with stack.StackInABox.use_instance(instance):
+                self.assertIs(stack.StackInABox.get_thread_instance(),
+                              instance)
+            self.assertIs(stack.StackInABox.get_thread_instance(), other)
+        self.assertIs(stack.StackInABox.get_thread_instance(), instance)
+
+    def test_asyncio_tasks_share_thread_instance(self):
+        # services registered by one task are served in the next task run
+        # on the same thread, f.e by an async fixture and the test
+        loop = asyncio.new_event_loop()
+        try:
+            async def setup():
+                stack.StackInABox.update_uri('localhost')
+                stack.StackInABox.register_service(
+                    NamedHelloService('fixture')
+                )
+
+            async def test():
+                return stack.StackInABox.call_into(
+                    'GET', mock.MagicMock(), 'localhost/fixture/', {}
+                )[0]
+
+            loop.run_until_complete(setup())
+            self.assertEqual(loop.run_until_complete(test()), 200)
+        finally:
+            loop.close()
+
+    def test_async_handler_called_synchronously_in_event_loop(self):
+        # the handler runs on an event loop in another thread, with the
+        # instance of the calling thread
+        stack.StackInABox.update_uri('localhost')
+        stack.StackInABox.register_service(AsyncHoldingService())
+        stack.StackInABox.hold_onto('x', 'held')
+
+        async def test():
+            return stack.StackInABox.call_into(
+                'GET', mock.MagicMock(), 'localhost/holding/', {}
+            )
+
+        status_code, _, body = asyncio.run(test())
+        self.assertEqual(status_code, 200)
+        self.assertEqual(body, 'held')
+
+    def test_asyncio_tasks_inherit_instance(self):
+        instance = stack.StackInABox.get_thread_instance()
+
+        async def scenario():
+            return stack.StackInABox.get_thread_instance()
+
+        async def run_scenarios():
+            return await asyncio.gather(*[scenario() for _ in range(4)])
+
+        self.assertEqual(asyncio.run(run_scenarios()), [instance] * 4)
+
+    def test_asyncio_tasks_isolated(self):
+        instance = stack.StackInABox.get_thread_instance()
+        scenario_count = 200
+
+        async def scenario(scenario_number):
+            stack.StackInABox.isolate()
+            stack.StackInABox.update_uri('localhost')
+            stack.StackInABox.register_service(
+                NamedHelloService('scenario')
+            )
+            stack.StackInABox.hold_onto('scenario', scenario_number)
+
+            # let the other scenarios register their services
+            await asyncio.sleep(0)
+
+            status_code, _, _ = stack.StackInABox.call_into(
+                'GET', mock.MagicMock(), 'localhost/scenario/', {}
+            )
+            return (
+                status_code,
+                stack.StackInABox.hold_out('scenario'),
+                len(stack.StackInABox.get_thread_instance().services)
+            )
+
+        async def run_scenarios():
+            return await asyncio.gather(
+                *[scenario(i) for i in range(scenario_count)]
+            )
+
+        self.assertEqual(
+            asyncio.run(run_scenarios()),
+            [(200, i, 1) for i in range(scenario_count)]
+        )
+        self.assertIs(stack.StackInABox.get_thread_instance(), instance)
+        self.assertEqual(instance.services, {})
+
+    @ddt.data(
+        ('GET', 'localhost/async/', 200, 'Hello async'),
+        ('GET', 'localhost/async/nested/', 200, 'Hello nested'),
+        ('PUT', 'localhost/async/', 405, None),
+        ('GET', 'localhost/async/missing', 595, None),
+        ('GET', 'localhost/unknown/', 597, None),
+    )
+    @ddt.unpack
+    def test_call_async(self, method, uri, status, body):
+        theStack = stack.StackInABox()
+        theStack.base_url = 'localhost'
+        theStack.register(AsyncHelloService('async'))
+
+        for result in (
+            asyncio.run(theStack.call_async(method, mock.MagicMock(), uri,
+                                            {})),
+            theStack.call(method, mock.MagicMock(), uri, {})
+        ):
+            status_code, _, msg = result
+            self.assertEqual(status_code, status)
+            if body is not None:
+                self.assertEqual(msg, body)
+
+    def test_call_async_service_exception(self):
+        theStack = stack.StackInABox()
+        theStack.base_url = 'localhost'
+        theStack.register(AsyncHelloService('async'))
+        theStack.register(ExceptionalServices())
+
+        for uri, method in (
+            ('localhost/async/', 'POST'),
+            ('localhost/except/', 'GET')
+        ):
+            status_code, _, _ = asyncio.run(
+                theStack.call_async(method, mock.MagicMock(), uri, {})
+            )
+            self.assertEqual(status_code, 596)
+
+    def test_call_into_async_concurrent(self):
+        request_count = 1000
+
+        async def run_requests():
+            stack.StackInABox.update_uri('localhost')
+            stack.StackInABox.register_service(
+                AsyncHelloService('slow', delay=0.2)
+            )
+            return await asyncio.gather(*[
+                stack.StackInABox.call_into_async(
+                    'GET', mock.MagicMock(), 'localhost/slow/', {}
+                )
+                for _ in range(request_count)
+            ])
+
+        # the requests wait for the simulated latency concurrently, one
+        # after the other they would take 200 seconds
+        with mock.patch('stackinabox.stack.StackInABox.call') as mock_call:
+            results = asyncio.run(asyncio.wait_for(run_requests(), 20))
+            self.assertEqual(mock_call.call_count, 0)
+
+        self.assertEqual(
+            [(status_code, msg) for status_code, _, msg in results],
+            [(200, 'Hello slow')] * request_count
+        )
+
     def test_into_hold(self):
         theStack = stack.StackInABox()
         self.assertEqual(theStack.holds, {})
@@ -231,3 +718,48 @@ class TestStack(base.TestCase):
 
         theStack.holds[item_name] = item_value
         self.assertEqual(theStack.from_hold(item_name), item_value)
+
+    def test_set_hold_store(self):
+        theStack = stack.StackInABox()
+        theStack.into_hold('adapter', 'registered', pinned=True)
+        theStack.into_hold('cake', 'tiers')
+
+        store = HoldStore(max_entries=2)
+        self.assertIs(theStack.set_hold_store(store), store)
+        self.assertIs(theStack.holds, store)
+        self.assertEqual(store.pinned, {'adapter'})
+        self.assertEqual(theStack.from_hold('adapter'), 'registered')
+
+        # the registrations of the utilities survive the budget
+        for item in ('bride', 'groom'):
+            theStack.into_hold(item, item)
+        self.assertEqual(theStack.holds, {'adapter': 'registered',
+                                          'bride': 'bride',
+                                          'groom': 'groom'})
+        with self.assertRaises(KeyError):
+            theStack.from_hold('cake')
+        self.assertEqual(store.evictions, 1)
+
+        # resetting empties the store but keeps its budget
+        theStack.reset()
+        self.assertIs(theStack.holds, store)
+        self.assertEqual(theStack.holds, {})
+
+    def test_pinned_without_pin_support(self):
+        theStack = stack.StackInABox()
+        theStack.set_hold_store({})
+        theStack.into_hold('adapter', 'registered', pinned=True)
+        self.assertEqual(theStack.holds, {'adapter': 'registered'})
+
+    def test_use_hold_store(self):
+        store = HoldStore(max_bytes=1024)
+        try:
+            stack.StackInABox.use_hold_store(store)
+            stack.StackInABox.hold_onto('ring', 'wedding-band')
+            self.assertEqual(stack.StackInABox.hold_out('ring'),
+                             'wedding-band')
+            self.assertIs(stack.StackInABox.get_thread_instance().holds,
+                          store)
+            self.assertEqual(store.hits, 1)
+        finally:
+            stack.StackInABox.use_hold_store(HoldStore())
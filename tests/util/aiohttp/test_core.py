@@ -0,0 +1,371 @@
+"""
+Stack-In-A-Box: aiohttp Test
+"""
+import asyncio
+import hashlib
+import io
+import logging
+
+import aiohttp
+import mock
+import pytest
+
+import stackinabox.util.aiohttp
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from tests.utils.services import (
+    AdvancedService,
+    StreamingService,
+    UploadService
+)
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+class EchoService(StackInABoxService):
+
+    def __init__(self, delay=0):
+        super(EchoService, self).__init__('echo')
+        self.delay = delay
+        self.register(StackInABoxService.POST, '/', EchoService.echo)
+        self.register(StackInABoxService.GET, '/', EchoService.slow)
+        self.register(StackInABoxService.GET, '/large', EchoService.large)
+        self.register(StackInABoxService.GET, '/chunks', EchoService.chunks)
+        self.register(StackInABoxService.GET, '/broken', EchoService.broken)
+        self.register(StackInABoxService.GET, '/view', EchoService.view)
+        self.register(StackInABoxService.PUT, '/', EchoService.first)
+
+    def echo(self, request, uri, headers):
+        headers['x-content-type'] = request.headers.get('content-type', '')
+        headers['Set-Cookie'] = 'echoed=yes'
+        return (201, headers, request.body)
+
+    async def slow(self, request, uri, headers):
+        await asyncio.sleep(self.delay)
+        return (200, headers, 'slow')
+
+    def large(self, request, uri, headers):
+        return (200, headers, b'line\n' * 100000)
+
+    async def chunks(self, request, uri, headers):
+        async def produce():
+            for chunk in (u'async ', b'chunks'):
+                await asyncio.sleep(0)
+                yield chunk
+
+        return (200, headers, produce())
+
+    def broken(self, request, uri, headers):
+        def produce():
+            yield b'partial'
+            raise ValueError('broken body')
+
+        return (200, headers, produce())
+
+    def first(self, request, uri, headers):
+        return (200, headers, request.body_reader.read(5))
+
+    def view(self, request, uri, headers):
+        return (200, headers, memoryview(bytearray(b'buffered view')))
+
+
+def run(coroutine):
+    StackInABox.reset_services()
+    stackinabox.util.aiohttp.enable()
+    try:
+        return asyncio.run(asyncio.wait_for(coroutine, 20))
+    finally:
+        stackinabox.util.aiohttp.disable()
+        StackInABox.reset_services()
+
+
+def test_basic_aiohttp():
+
+    async def requests():
+        StackInABox.register_service(HelloService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get('http://localhost/hello/') as res:
+                assert res.status == 200
+                assert res.reason == 'OK'
+                assert await res.text() == 'Hello'
+
+    run(requests())
+
+
+def test_advanced_aiohttp():
+
+    async def requests():
+        StackInABox.register_service(AdvancedService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            res = await session.get('http://localhost/advanced/')
+            assert res.status == 200
+            assert await res.text() == 'Hello'
+
+            res = await session.get('http://localhost/advanced/h')
+            assert res.status == 200
+            assert await res.text() == 'Good-Bye'
+
+            expected_result = {
+                'bob': 'bob: Good-Bye alice',
+                'alice': 'alice: Good-Bye bob',
+                'joe': 'joe: Good-Bye jane'
+            }
+            res = await session.get(
+                'http://localhost/advanced/g',
+                params={'bob': 'alice', 'alice': 'bob', 'joe': 'jane'}
+            )
+            assert res.status == 200
+            assert await res.json(content_type=None) == expected_result
+
+            res = await session.get('http://localhost/advanced/1234567890')
+            assert res.status == 200
+            assert await res.text() == 'okay'
+
+            res = await session.get('http://localhost/advanced/_234567890')
+            assert res.status == 595
+            assert res.reason == 'Route Not Handled'
+
+            res = await session.put('http://localhost/advanced/h')
+            assert res.status == 405
+            assert res.reason == 'Method Not Allowed'
+
+            res = await session.put('http://localhost/advanced2/i')
+            assert res.status == 597
+            assert res.reason == 'Unknown Service'
+
+    run(requests())
+
+
+@pytest.mark.parametrize('kwargs, content_type, body', [
+    ({'data': b'\x00binary'}, '', b'\x00binary'),
+    ({'data': 'text'}, '', b'text'),
+    ({'data': {'a': '1', 'b': '2'}},
+     'application/x-www-form-urlencoded', b'a=1&b=2'),
+    ({'json': {'a': 1}}, 'application/json', b'{"a": 1}'),
+])
+def test_request_body(kwargs, content_type, body):
+
+    async def requests():
+        StackInABox.register_service(EchoService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            async with session.post('http://localhost/echo/',
+                                    **kwargs) as res:
+                assert res.status == 201
+                assert res.headers['X-Content-Type'] == content_type
+                assert res.cookies['echoed'].value == 'yes'
+                assert await res.read() == body
+
+    run(requests())
+
+
+def test_request_body_reader():
+    upload = io.BytesIO(b'chunk' * 1000)
+
+    async def requests():
+        StackInABox.register_service(UploadService())
+        StackInABox.register_service(EchoService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            async with session.post('http://localhost/upload/',
+                                    data=io.BytesIO(b'chunk' * 1000)) as res:
+                assert res.status == 201
+                assert await res.json() == {
+                    'sha256': hashlib.sha256(b'chunk' * 1000).hexdigest(),
+                    'size': 5000
+                }
+
+            # the body is only read as far as the service reads it
+            async with session.put('http://localhost/echo/',
+                                   data=upload) as res:
+                assert await res.read() == b'chunk'
+            assert upload.tell() == 5
+
+    run(requests())
+
+
+def test_request_body_unsupported():
+
+    async def requests():
+        StackInABox.register_service(EchoService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            with pytest.raises(TypeError):
+                await session.post('http://localhost/echo/', data=object())
+
+    run(requests())
+
+
+def test_streaming_response():
+
+    async def requests():
+        StackInABox.register_service(EchoService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get('http://localhost/echo/large') as res:
+                assert isinstance(res.content, aiohttp.StreamReader)
+                assert await res.content.readline() == b'line\n'
+
+                chunks = [
+                    chunk async for chunk in res.content.iter_chunked(4096)
+                ]
+                assert len(chunks) > 1
+                assert b''.join(chunks) == b'line\n' * 99999
+
+            async with session.get('http://localhost/echo/view') as res:
+                assert await res.read() == b'buffered view'
+
+    run(requests())
+
+
+def test_streamed_body():
+
+    async def requests():
+        service = StreamingService()
+        StackInABox.register_service(service)
+        StackInABox.register_service(EchoService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            async with session.get('http://localhost/stream/large') as res:
+                assert res.status == 200
+                chunk = await res.content.readexactly(65536)
+                assert chunk == StreamingService.CHUNK
+                await asyncio.sleep(0)
+                # the body is only produced up to the limit of the reader
+                assert service.produced < 8
+
+                total = 65536
+                async for chunk in res.content.iter_chunked(65536):
+                    total += len(chunk)
+                assert total == service.size
+            assert service.closed
+
+            async with session.get('http://localhost/stream/file') as res:
+                assert await res.read() == b'file body'
+
+            async with session.get('http://localhost/echo/chunks') as res:
+                assert await res.text() == u'async chunks'
+
+            async with session.get('http://localhost/echo/broken') as res:
+                with pytest.raises(ValueError):
+                    await res.read()
+
+            # releasing the response stops the body from being produced
+            service.closed = False
+            async with session.get('http://localhost/stream/large') as res:
+                await res.content.readexactly(1)
+            await asyncio.sleep(0)
+            assert service.closed
+            assert not res.content.is_eof()
+
+    run(requests())
+
+
+def test_raise_for_status():
+
+    async def requests():
+        StackInABox.register_service(HelloService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession(raise_for_status=True) as session:
+            res = await session.get('http://localhost/hello/')
+            assert res.status == 200
+
+            with pytest.raises(aiohttp.ClientResponseError) as error:
+                await session.get('http://localhost/unknown/')
+            assert error.value.status == 597
+
+            res = await session.get('http://localhost/unknown/',
+                                    raise_for_status=False)
+            assert res.status == 597
+
+    run(requests())
+
+
+def test_base_url_and_default_headers():
+
+    async def requests():
+        StackInABox.register_service(EchoService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession(
+            base_url='http://localhost',
+            headers={'Content-Type': 'text/plain'}
+        ) as session:
+            async with session.post('/echo/', data=b'based') as res:
+                assert res.status == 201
+                assert res.headers['X-Content-Type'] == 'text/plain'
+                assert await res.read() == b'based'
+
+    run(requests())
+
+
+def test_concurrent_requests():
+    request_count = 1000
+
+    async def requests():
+        StackInABox.register_service(EchoService(delay=0.2))
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async def get(session):
+            async with session.get('http://localhost/echo/') as res:
+                return (res.status, await res.text())
+
+        async with aiohttp.ClientSession() as session:
+            return await asyncio.gather(
+                *[get(session) for _ in range(request_count)]
+            )
+
+    # one after the other the requests would take 200 seconds
+    assert run(requests()) == [(200, 'slow')] * request_count
+
+
+def test_unregistered_uri_passes_through():
+    passed_through = object()
+
+    async def requests():
+        StackInABox.register_service(HelloService())
+        stackinabox.util.aiohttp.registration('localhost')
+
+        async with aiohttp.ClientSession() as session:
+            res = await session.get('http://localhost/hello/')
+            assert res.status == 200
+            assert mock_request.call_count == 0
+
+            res = await session.get('http://remotehost/hello/')
+            assert res is passed_through
+            assert mock_request.call_count == 1
+
+    with mock.patch.object(aiohttp.ClientSession, '_request',
+                           new=mock.AsyncMock(
+                               return_value=passed_through
+                           )) as mock_request:
+        run(requests())
+
+
+def test_enable_disable():
+    original_request = aiohttp.ClientSession._request
+
+    stackinabox.util.aiohttp.enable()
+    patched_request = aiohttp.ClientSession._request
+    assert patched_request is not original_request
+
+    # enabling again keeps the existing patch
+    stackinabox.util.aiohttp.enable()
+    assert aiohttp.ClientSession._request is patched_request
+
+    stackinabox.util.aiohttp.disable()
+    stackinabox.util.aiohttp.disable()
+    assert aiohttp.ClientSession._request is original_request
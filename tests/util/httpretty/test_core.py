@@ -1,9 +1,13 @@
 """
 Stack-In-A-Box: Basic Test
 """
+import gzip
 import logging
 import sys
+import tracemalloc
 import unittest
+import urllib.request
+import zlib
 
 import ddt
 import httpretty
@@ -14,6 +18,7 @@ import stackinabox.util.httpretty
 from stackinabox.stack import StackInABox
 
 from tests.util import base
+from tests.utils import services
 
 
 logger = logging.getLogger(__name__)
@@ -89,3 +94,103 @@ class TestHttprettyAdvanced(base.UtilTestCase):
 
         res = requests.put('http://localhost/advanced2/i')
         self.assertEqual(res.status_code, 597)
+
+
+@ddt.ddt
+class TestHttprettyStreaming(base.UtilTestCase):
+    """Streamed bodies read with urllib.
+
+    httpretty does not support the sockets of urllib3 2 used by requests,
+    and answers requests in threads of its own, so the instance is shared.
+    """
+
+    def setUp(self):
+        super(TestHttprettyStreaming, self).setUp()
+        StackInABox.enable_shared_instance()
+        self.streaming_service = services.StreamingService()
+        StackInABox.register_service(self.streaming_service)
+        httpretty.enable(allow_net_connect=False)
+        stackinabox.util.httpretty.registration('localhost')
+
+    def tearDown(self):
+        super(TestHttprettyStreaming, self).tearDown()
+        httpretty.disable()
+        httpretty.reset()
+        StackInABox.reset_services()
+        StackInABox.disable_shared_instance()
+
+    def test_streamed_body(self):
+        # httpretty writes the whole response before answering, so only its
+        # memory use shows that the body was streamed
+        tracemalloc.start()
+        try:
+            res = urllib.request.urlopen('http://localhost/stream/large')
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(res.status, 200)
+        self.assertTrue(self.streaming_service.closed)
+        self.assertLess(peak, self.streaming_service.size // 4)
+
+        total = 0
+        chunk = res.read(65536)
+        while chunk:
+            total += len(chunk)
+            chunk = res.read(65536)
+        self.assertEqual(total, self.streaming_service.size)
+        res.close()
+
+    @ddt.data(
+        ('file', b'file body'),
+        ('text', b'caf\xc3\xa9 bytes'),
+    )
+    @ddt.unpack
+    def test_body_types(self, route, content):
+        res = urllib.request.urlopen(
+            'http://localhost/stream/{0}'.format(route)
+        )
+        self.assertEqual(res.status, 200)
+        self.assertEqual(res.read(), content)
+        res.close()
+
+    def test_content_length(self):
+        # bodies held in memory are sent as before, only streamed bodies end
+        # with the connection
+        StackInABox.register_service(self.hello_service)
+        res = urllib.request.urlopen('http://localhost/hello/')
+        self.assertEqual(res.headers['Content-Length'], '5')
+        self.assertEqual(res.read(), b'Hello')
+        res.close()
+
+        res = urllib.request.urlopen('http://localhost/stream/file')
+        self.assertIsNone(res.headers['Content-Length'])
+        self.assertEqual(res.read(), b'file body')
+        res.close()
+
+    @ddt.data('gzip', 'deflate')
+    def test_compression(self, encoding):
+        document_service = services.DocumentService()
+        compression = document_service.enable_compression()
+        StackInABox.register_service(document_service)
+
+        for _ in range(2):
+            res = urllib.request.urlopen(urllib.request.Request(
+                'http://localhost/docs/',
+                headers={'Accept-Encoding': encoding}
+            ))
+            self.assertEqual(res.status, 200)
+            self.assertEqual(res.headers['Content-Encoding'], encoding)
+            self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+            decompress = (
+                gzip.decompress if encoding == 'gzip' else zlib.decompress
+            )
+            self.assertEqual(decompress(res.read()).decode('utf-8'),
+                             services.DocumentService.DOCUMENT)
+            res.close()
+        self.assertEqual(compression.info()['hits'], 1)
+
+        res = urllib.request.urlopen('http://localhost/docs/')
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.read().decode('utf-8'),
+                         services.DocumentService.DOCUMENT)
+        res.close()
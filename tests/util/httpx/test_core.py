@@ -0,0 +1,312 @@
+"""
+Stack-In-A-Box: HTTPX Test
+"""
+import asyncio
+import hashlib
+import logging
+
+import httpx
+import mock
+import pytest
+
+import stackinabox.util.httpx
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from tests.utils.services import (
+    AdvancedService,
+    FileService,
+    StreamingService,
+    UploadService
+)
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+class EchoService(StackInABoxService):
+
+    def __init__(self, delay=0):
+        super(EchoService, self).__init__('echo')
+        self.delay = delay
+        self.register(StackInABoxService.POST, '/', EchoService.echo)
+        self.register(StackInABoxService.GET, '/', EchoService.slow)
+        self.register(StackInABoxService.GET, '/chunks', EchoService.chunks)
+        self.register(StackInABoxService.PUT, '/', EchoService.first)
+
+    def echo(self, request, uri, headers):
+        headers['x-echo'] = request.headers['x-test']
+        return (201, headers, request.body)
+
+    def first(self, request, uri, headers):
+        return (200, headers, request.body_reader.read(5))
+
+    async def slow(self, request, uri, headers):
+        await asyncio.sleep(self.delay)
+        return (200, headers, 'slow')
+
+    async def chunks(self, request, uri, headers):
+        async def produce():
+            for chunk in (u'async ', b'chunks'):
+                await asyncio.sleep(0)
+                yield chunk
+
+        return (200, headers, produce())
+
+
+@pytest.fixture
+def httpx_enabled():
+    StackInABox.reset_services()
+    stackinabox.util.httpx.enable()
+    yield
+    stackinabox.util.httpx.disable()
+    StackInABox.reset_services()
+
+
+def test_basic_httpx(httpx_enabled):
+    StackInABox.register_service(HelloService())
+    stackinabox.util.httpx.registration('localhost')
+
+    res = httpx.get('http://localhost/hello/')
+    assert res.status_code == 200
+    assert res.text == 'Hello'
+
+
+def test_advanced_httpx(httpx_enabled):
+    StackInABox.register_service(AdvancedService())
+    stackinabox.util.httpx.registration('localhost')
+
+    with httpx.Client() as client:
+        res = client.get('http://localhost/advanced/')
+        assert res.status_code == 200
+        assert res.text == 'Hello'
+
+        res = client.get('http://localhost/advanced/h')
+        assert res.status_code == 200
+        assert res.text == 'Good-Bye'
+
+        expected_result = {
+            'bob': 'bob: Good-Bye alice',
+            'alice': 'alice: Good-Bye bob',
+            'joe': 'joe: Good-Bye jane'
+        }
+        res = client.get(
+            'http://localhost/advanced/g?bob=alice&alice=bob&joe=jane'
+        )
+        assert res.status_code == 200
+        assert res.json() == expected_result
+
+        res = client.get('http://localhost/advanced/1234567890')
+        assert res.status_code == 200
+        assert res.text == 'okay'
+
+        res = client.get('http://localhost/advanced/_234567890')
+        assert res.status_code == 595
+
+        res = client.put('http://localhost/advanced/h')
+        assert res.status_code == 405
+
+        res = client.put('http://localhost/advanced2/i')
+        assert res.status_code == 597
+
+
+def test_request_body_and_headers(httpx_enabled):
+    StackInABox.register_service(EchoService())
+    stackinabox.util.httpx.registration('localhost')
+
+    res = httpx.post('http://localhost/echo/',
+                     content=b'\x00binary',
+                     headers={'X-Test': 'tested'})
+    assert res.status_code == 201
+    assert res.headers['X-Echo'] == 'tested'
+    assert res.content == b'\x00binary'
+
+
+def test_request_body_reader(httpx_enabled):
+    StackInABox.register_service(UploadService())
+    StackInABox.register_service(EchoService())
+    stackinabox.util.httpx.registration('localhost')
+    expected = {
+        'sha256': hashlib.sha256(b'chunk' * 1000).hexdigest(),
+        'size': 5000
+    }
+    sent = []
+
+    def generate():
+        for _ in range(1000):
+            sent.append(b'chunk')
+            yield b'chunk'
+
+    res = httpx.post('http://localhost/upload/', content=generate())
+    assert res.status_code == 201
+    assert res.json() == expected
+
+    # the body is only read from the client as far as the service reads it
+    del sent[:]
+    res = httpx.put('http://localhost/echo/', content=generate())
+    assert res.content == b'chunk'
+    assert len(sent) == 1
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return await client.put('http://localhost/upload/',
+                                    content=b'chunk' * 1000)
+
+    assert asyncio.run(run()).json() == expected
+
+
+def test_async_client(httpx_enabled):
+    StackInABox.register_service(HelloService())
+    StackInABox.register_service(EchoService())
+    stackinabox.util.httpx.registration('localhost')
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            hello = await client.get('http://localhost/hello/')
+            echo = await client.post('http://localhost/echo/',
+                                     content='async',
+                                     headers={'X-Test': 'awaited'})
+            return hello, echo
+
+    hello, echo = asyncio.run(run())
+    assert hello.status_code == 200
+    assert hello.text == 'Hello'
+    assert echo.status_code == 201
+    assert echo.headers['X-Echo'] == 'awaited'
+    assert echo.text == 'async'
+
+
+def test_async_client_concurrent_requests(httpx_enabled):
+    request_count = 500
+    StackInABox.register_service(EchoService(delay=0.2))
+    transport = stackinabox.util.httpx.registration('localhost')
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await asyncio.gather(*[
+                client.get('http://localhost/echo/')
+                for _ in range(request_count)
+            ])
+
+    # one after the other the requests would take 100 seconds
+    responses = asyncio.run(asyncio.wait_for(run(), 20))
+    assert [(res.status_code, res.text) for res in responses] == [
+        (200, 'slow')
+    ] * request_count
+
+
+def test_streamed_response(httpx_enabled):
+    service = StreamingService()
+    StackInABox.register_service(service)
+    stackinabox.util.httpx.registration('localhost')
+
+    with httpx.stream('GET', 'http://localhost/stream/large') as res:
+        assert res.status_code == 200
+        assert service.produced == 0
+
+        chunks = res.iter_bytes()
+        assert next(chunks) == StreamingService.CHUNK
+        assert service.produced == 1
+
+        total = 65536 + sum(len(chunk) for chunk in chunks)
+        assert total == service.size
+    assert service.closed
+
+    assert httpx.get('http://localhost/stream/file').content == b'file body'
+    assert (httpx.get('http://localhost/stream/text').content ==
+            b'caf\xc3\xa9 bytes')
+
+
+def test_async_streamed_response(httpx_enabled):
+    service = StreamingService()
+    StackInABox.register_service(service)
+    StackInABox.register_service(EchoService())
+    stackinabox.util.httpx.registration('localhost')
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            large = await client.get('http://localhost/stream/large')
+            chunks = await client.get('http://localhost/echo/chunks')
+        return large, chunks
+
+    large, chunks = asyncio.run(run())
+    assert len(large.content) == service.size
+    assert service.closed
+    assert chunks.content == b'async chunks'
+
+
+def test_file_response(httpx_enabled, tmp_path):
+    path = tmp_path / 'fixture.bin'
+    path.write_bytes(bytes(range(256)) * 1024)
+    service = FileService(str(path))
+    StackInABox.register_service(service)
+    stackinabox.util.httpx.registration('localhost')
+
+    with httpx.stream('GET', 'http://localhost/files/') as res:
+        assert b''.join(res.iter_bytes(65536)) == path.read_bytes()
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return await client.get('http://localhost/files/part')
+
+    assert asyncio.run(run()).content == bytes(range(10, 20))
+    assert all(response.file.closed for response in service.responses)
+
+
+def test_transport_without_patching():
+    StackInABox.reset_services()
+    StackInABox.register_service(HelloService())
+    transport = stackinabox.util.httpx.StackInABoxTransport('localhost')
+    StackInABox.update_uri('localhost')
+
+    try:
+        with httpx.Client(transport=transport) as client:
+            res = client.get('http://localhost/hello/')
+        assert res.status_code == 200
+        assert res.text == 'Hello'
+    finally:
+        StackInABox.reset_services()
+
+
+def test_unregistered_uri_passes_through():
+    passed_through = httpx.Response(299)
+    with mock.patch.object(httpx.HTTPTransport, 'handle_request',
+                           return_value=passed_through) as mock_handle:
+        stackinabox.util.httpx.enable()
+        try:
+            StackInABox.register_service(HelloService())
+            stackinabox.util.httpx.registration('localhost')
+
+            assert httpx.get('http://localhost/hello/').status_code == 200
+            assert mock_handle.call_count == 0
+
+            res = httpx.get('http://remotehost/hello/')
+            assert res.status_code == 299
+            assert mock_handle.call_count == 1
+        finally:
+            stackinabox.util.httpx.disable()
+            StackInABox.reset_services()
+
+
+def test_enable_disable():
+    original_handle_request = httpx.HTTPTransport.handle_request
+    original_handle_async_request = (
+        httpx.AsyncHTTPTransport.handle_async_request
+    )
+
+    stackinabox.util.httpx.enable()
+    patched_handle_request = httpx.HTTPTransport.handle_request
+    assert patched_handle_request is not original_handle_request
+
+    # enabling again keeps the existing patch
+    stackinabox.util.httpx.enable()
+    assert httpx.HTTPTransport.handle_request is patched_handle_request
+
+    stackinabox.util.httpx.disable()
+    stackinabox.util.httpx.disable()
+    assert httpx.HTTPTransport.handle_request is original_handle_request
+    assert (
+        httpx.AsyncHTTPTransport.handle_async_request is
+        original_handle_async_request
+    )
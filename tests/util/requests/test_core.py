@@ -0,0 +1,346 @@
+"""
+Stack-In-A-Box: Python Requests Adapter Test
+"""
+import hashlib
+import io
+import logging
+
+import mock
+import pytest
+import requests
+
+import stackinabox.util.requests
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+from stackinabox.util.tools import HoldStore
+
+from tests.utils.services import (
+    AdvancedService,
+    DocumentService,
+    FileService,
+    StreamingService,
+    UploadService
+)
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+class EchoService(StackInABoxService):
+
+    def __init__(self):
+        super(EchoService, self).__init__('echo')
+        self.register(StackInABoxService.POST, '/', EchoService.echo)
+        self.register(StackInABoxService.GET, '/text', EchoService.text)
+        self.register(StackInABoxService.GET, '/chunks', EchoService.chunks)
+
+    def echo(self, request, uri, headers):
+        headers['x-echo'] = request.headers['x-test']
+        headers['Set-Cookie'] = 'echoed=yes; Path=/'
+        return (201, headers, request.body)
+
+    def text(self, request, uri, headers):
+        headers['Content-Type'] = 'text/plain; charset=latin-1'
+        return (200, headers, u'café')
+
+    def chunks(self, request, uri, headers):
+        return (200, headers, iter([b'chunk1', b'chunk2']))
+
+
+@pytest.fixture
+def session():
+    StackInABox.reset_services()
+    with requests.Session() as session:
+        yield session
+    StackInABox.reset_services()
+
+
+def test_basic_session(session):
+    StackInABox.register_service(HelloService())
+    adapter = stackinabox.util.requests.session_registration('localhost',
+                                                             session)
+    assert isinstance(adapter, stackinabox.util.requests.StackInABoxAdapter)
+
+    res = session.get('http://localhost/hello/')
+    assert res.status_code == 200
+    assert res.reason == 'OK'
+    assert res.text == 'Hello'
+    assert res.connection is adapter
+
+    res = session.get('https://localhost/hello/')
+    assert res.status_code == 200
+
+
+def test_advanced_session(session):
+    StackInABox.register_service(AdvancedService())
+    stackinabox.util.requests.session_registration('localhost', session)
+
+    res = session.get('http://localhost/advanced/')
+    assert res.status_code == 200
+    assert res.text == 'Hello'
+
+    res = session.get('http://localhost/advanced/h')
+    assert res.status_code == 200
+    assert res.text == 'Good-Bye'
+
+    expected_result = {
+        'bob': 'bob: Good-Bye alice',
+        'alice': 'alice: Good-Bye bob',
+        'joe': 'joe: Good-Bye jane'
+    }
+    res = session.get(
+        'http://localhost/advanced/g?bob=alice&alice=bob&joe=jane'
+    )
+    assert res.status_code == 200
+    assert res.json() == expected_result
+
+    res = session.get('http://localhost/advanced/1234567890')
+    assert res.status_code == 200
+    assert res.text == 'okay'
+
+    res = session.get('http://localhost/advanced/_234567890')
+    assert res.status_code == 595
+    assert res.reason == 'Route Not Handled'
+
+    res = session.put('http://localhost/advanced/h')
+    assert res.status_code == 405
+    assert res.reason == 'Method Not Allowed'
+
+    res = session.put('http://localhost/advanced2/i')
+    assert res.status_code == 597
+    assert res.reason == 'Unknown Service'
+
+
+def test_request_and_response_details(session):
+    StackInABox.register_service(EchoService())
+    stackinabox.util.requests.session_registration('localhost', session)
+
+    res = session.post('http://localhost/echo/',
+                       data=b'\x00binary',
+                       headers={'X-Test': 'tested'})
+    assert res.status_code == 201
+    assert res.headers['X-Echo'] == 'tested'
+    assert res.content == b'\x00binary'
+    assert res.cookies['echoed'] == 'yes'
+    assert session.cookies['echoed'] == 'yes'
+
+    res = session.get('http://localhost/echo/text')
+    assert res.encoding == 'latin-1'
+    assert res.content == u'café'.encode('latin-1')
+    assert res.text == u'café'
+
+    res = session.get('http://localhost/echo/chunks')
+    assert res.content == b'chunk1chunk2'
+
+
+def test_streamed_response(session):
+    StackInABox.register_service(EchoService())
+    stackinabox.util.requests.session_registration('localhost', session)
+
+    res = session.post('http://localhost/echo/',
+                       data=b'0123456789',
+                       headers={'X-Test': 'streamed'},
+                       stream=True)
+    assert list(res.iter_content(4)) == [b'0123', b'4567', b'89']
+
+
+def test_streamed_body(session):
+    service = StreamingService()
+    StackInABox.register_service(service)
+    stackinabox.util.requests.session_registration('localhost', session)
+
+    res = session.get('http://localhost/stream/large', stream=True)
+    assert res.status_code == 200
+    assert service.produced == 0
+
+    chunks = res.iter_content(65536)
+    assert next(chunks) == StreamingService.CHUNK
+    assert service.produced <= 2
+
+    total = 65536 + sum(len(chunk) for chunk in chunks)
+    assert total == service.size
+    assert service.closed
+
+    res = session.get('http://localhost/stream/file')
+    assert res.content == b'file body'
+
+
+def test_request_body_reader(session):
+    StackInABox.register_service(UploadService())
+    stackinabox.util.requests.session_registration('localhost', session)
+    expected = {
+        'sha256': hashlib.sha256(b'chunk' * 1000).hexdigest(),
+        'size': 5000
+    }
+
+    def generate():
+        for _ in range(1000):
+            yield b'chunk'
+
+    res = session.post('http://localhost/upload/', data=generate())
+    assert res.status_code == 201
+    assert res.json() == expected
+
+    res = session.put('http://localhost/upload/',
+                      data=io.BytesIO(b'chunk' * 1000))
+    assert res.json() == expected
+
+    res = session.put('http://localhost/upload/', data=b'chunk' * 1000)
+    assert res.json() == expected
+
+
+def test_file_response(session, tmp_path):
+    path = tmp_path / 'fixture.bin'
+    path.write_bytes(bytes(range(256)) * 1024)
+    service = FileService(str(path))
+    StackInABox.register_service(service)
+    stackinabox.util.requests.session_registration('localhost', session)
+
+    res = session.get('http://localhost/files/', stream=True)
+    assert b''.join(res.iter_content(65536)) == path.read_bytes()
+
+    res = session.get('http://localhost/files/part')
+    assert res.content == bytes(range(10, 20))
+    assert all(response.file.closed for response in service.responses)
+
+
+def test_conditional_requests(session):
+    service = HelloService()
+    service.enable_conditional_requests()
+    StackInABox.register_service(service)
+    stackinabox.util.requests.session_registration('localhost', session)
+
+    res = session.get('http://localhost/hello/')
+    etag = res.headers['ETag']
+
+    res = session.get('http://localhost/hello/',
+                      headers={'If-None-Match': etag})
+    assert res.status_code == 304
+    assert res.content == b''
+    assert service.conditional_requests.not_modified == 1
+
+
+def test_registration():
+    StackInABox.reset_services()
+    stackinabox.util.requests.enable()
+    try:
+        StackInABox.register_service(HelloService())
+        stackinabox.util.requests.registration('localhost')
+
+        res = requests.get('http://localhost/hello/')
+        assert res.status_code == 200
+        assert res.text == 'Hello'
+
+        with requests.Session() as session:
+            res = session.get('https://localhost/hello/')
+            assert res.status_code == 200
+    finally:
+        stackinabox.util.requests.disable()
+        StackInABox.reset_services()
+
+
+def test_unregistered_uri_passes_through():
+    passed_through = requests.Response()
+    passed_through.status_code = 299
+
+    stackinabox.util.requests.enable()
+    try:
+        StackInABox.register_service(HelloService())
+        stackinabox.util.requests.registration('localhost')
+
+        with mock.patch.object(requests.adapters.HTTPAdapter, 'send',
+                               return_value=passed_through) as mock_send:
+            assert requests.get('http://localhost/hello/').status_code == 200
+            assert mock_send.call_count == 0
+
+            assert requests.get('http://remotehost/hello/') is passed_through
+            assert mock_send.call_count == 1
+    finally:
+        stackinabox.util.requests.disable()
+        StackInABox.reset_services()
+
+
+def test_bounded_hold_store():
+    class StashingService(StackInABoxService):
+
+        def __init__(self):
+            super(StashingService, self).__init__('stash')
+            self.created = 0
+            self.register(StackInABoxService.POST, '/', StashingService.stash)
+
+        def stash(self, request, uri, headers):
+            for _ in range(3):
+                self.created += 1
+                StackInABox.hold_onto('item-{0}'.format(self.created),
+                                      self.created)
+            return (201, headers, '')
+
+    StackInABox.reset_services()
+    store = StackInABox.use_hold_store(HoldStore(max_entries=3))
+    stackinabox.util.requests.enable()
+    try:
+        StackInABox.register_service(StashingService())
+        stackinabox.util.requests.registration('localhost')
+
+        # the data of the service is evicted, the registration is not
+        for _ in range(3):
+            res = requests.post('http://localhost/stash/')
+            assert res.status_code == 201
+        assert store.evictions == 6
+        assert len(store) == 4
+    finally:
+        stackinabox.util.requests.disable()
+        StackInABox.reset_services()
+        StackInABox.use_hold_store(HoldStore())
+
+
+def test_registration_lookups_not_counted():
+    StackInABox.reset_services()
+    store = StackInABox.use_hold_store(HoldStore())
+    stackinabox.util.requests.enable()
+    try:
+        StackInABox.register_service(HelloService())
+        stackinabox.util.requests.registration('localhost')
+
+        res = requests.get('http://localhost/hello/')
+        assert res.status_code == 200
+        assert store.hits == 0
+        assert store.misses == 0
+    finally:
+        stackinabox.util.requests.disable()
+        StackInABox.reset_services()
+        StackInABox.use_hold_store(HoldStore())
+
+
+def test_enable_disable():
+    original_get_adapter = requests.Session.get_adapter
+
+    stackinabox.util.requests.enable()
+    patched_get_adapter = requests.Session.get_adapter
+    assert patched_get_adapter is not original_get_adapter
+
+    # enabling again keeps the existing patch
+    stackinabox.util.requests.enable()
+    assert requests.Session.get_adapter is patched_get_adapter
+
+    stackinabox.util.requests.disable()
+    stackinabox.util.requests.disable()
+    assert requests.Session.get_adapter is original_get_adapter
+
+
+def test_compression(session):
+    service = DocumentService()
+    service.enable_compression()
+    StackInABox.register_service(service)
+    stackinabox.util.requests.session_registration('localhost', session)
+
+    res = session.get('http://localhost/docs/')
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert res.text == DocumentService.DOCUMENT
+
+    res = session.get('http://localhost/docs/',
+                      headers={'Accept-Encoding': 'deflate'}, stream=True)
+    assert res.headers['Content-Encoding'] == 'deflate'
+    content = b''.join(res.iter_content(64))
+    assert content.decode('utf-8') == DocumentService.DOCUMENT
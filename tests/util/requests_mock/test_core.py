@@ -1,6 +1,7 @@
 """
 Stack-In-A-Box: Basic Test
 """
+import hashlib
 import json
 import logging
 
@@ -15,6 +16,7 @@ from stackinabox.util.requests_mock import core
 from stackinabox.stack import StackInABox
 
 from tests.util import base
+from tests.utils import services
 
 
 logger = logging.getLogger(__name__)
@@ -257,3 +259,83 @@ class TestRequestMockAdvanced(base.UtilTestCase):
             res = session.request(http_verb, 'http://localhost/advanced/')
             self.assertEqual(res.status_code, response_status)
             self.assertEqual(res.text, response_body)
+
+
+@ddt.ddt
+class TestRequestMockStreaming(base.UtilTestCase):
+
+    def setUp(self):
+        super(TestRequestMockStreaming, self).setUp()
+        self.streaming_service = services.StreamingService()
+        StackInABox.register_service(self.streaming_service)
+        self.session = requests.Session()
+        stackinabox.util.requests_mock.session_registration('localhost',
+                                                            self.session)
+
+    def tearDown(self):
+        super(TestRequestMockStreaming, self).tearDown()
+        StackInABox.reset_services()
+        self.session.close()
+
+    def test_streamed_body(self):
+        res = self.session.get('http://localhost/stream/large', stream=True)
+        self.assertEqual(res.status_code, 200)
+
+        chunks = res.iter_content(65536)
+        self.assertEqual(next(chunks), services.StreamingService.CHUNK)
+        self.assertLessEqual(self.streaming_service.produced, 2)
+
+        total = 65536 + sum(len(chunk) for chunk in chunks)
+        self.assertEqual(total, self.streaming_service.size)
+        self.assertTrue(self.streaming_service.closed)
+
+    @ddt.data(
+        ('file', b'file body'),
+        ('text', b'caf\xc3\xa9 bytes'),
+    )
+    @ddt.unpack
+    def test_body_types(self, route, content):
+        res = self.session.get('http://localhost/stream/{0}'.format(route))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.content, content)
+
+    def test_range_requests(self):
+        self.streaming_service.enable_range_requests()
+        res = self.session.get('http://localhost/stream/text',
+                               headers={'Range': 'bytes=0-2'})
+        self.assertEqual(res.status_code, 200)
+
+        res = self.session.get('http://localhost/stream/file',
+                               headers={'Range': 'bytes=-4'})
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(res.headers['Content-Range'], 'bytes 5-8/9')
+        self.assertEqual(res.content, b'body')
+
+    def test_compression(self):
+        document_service = services.DocumentService()
+        compression = document_service.enable_compression()
+        StackInABox.register_service(document_service)
+
+        for encoding in ('gzip', 'deflate', 'gzip'):
+            res = self.session.get('http://localhost/docs/',
+                                   headers={'Accept-Encoding': encoding})
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.headers['Content-Encoding'], encoding)
+            self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(res.text, services.DocumentService.DOCUMENT)
+        self.assertEqual(compression.info()['hits'], 1)
+
+        res = self.session.get('http://localhost/docs/',
+                               headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.text, services.DocumentService.DOCUMENT)
+
+    def test_request_body_reader(self):
+        StackInABox.register_service(services.UploadService())
+        res = self.session.post('http://localhost/upload/',
+                                data=iter([b'chunk'] * 1000))
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.json(), {
+            'sha256': hashlib.sha256(b'chunk' * 1000).hexdigest(),
+            'size': 5000
+        })
@@ -11,7 +11,11 @@ import six
 import stackinabox.util.responses
 from stackinabox.stack import StackInABox
 
-from tests.utils.services import AdvancedService
+from tests.utils.services import (
+    AdvancedService,
+    DocumentService,
+    StreamingService
+)
 from tests.utils.hello import HelloService
 
 
@@ -83,3 +87,63 @@ def test_advanced_responses():
     for deprecation_status in [True, False]:
         with responses.RequestsMock():
             run(deprecation_status)
+
+
+def test_streamed_responses():
+
+    @responses.activate
+    def run():
+        StackInABox.reset_services()
+        service = StreamingService()
+        StackInABox.register_service(service)
+        stackinabox.util.responses.registration('localhost')
+
+        res = requests.get('http://localhost/stream/large', stream=True)
+        assert res.status_code == 200
+
+        chunks = res.iter_content(65536)
+        assert next(chunks) == StreamingService.CHUNK
+        assert service.produced <= 2
+
+        total = 65536 + sum(len(chunk) for chunk in chunks)
+        assert total == service.size
+        assert service.closed
+
+        res = requests.get('http://localhost/stream/file')
+        assert res.content == b'file body'
+
+        res = requests.get('http://localhost/stream/text')
+        assert res.content == b'caf\xc3\xa9 bytes'
+
+        StackInABox.reset_services()
+
+    run()
+
+
+def test_compressed_responses():
+
+    @responses.activate
+    def run():
+        StackInABox.reset_services()
+        service = DocumentService()
+        compression = service.enable_compression()
+        StackInABox.register_service(service)
+        stackinabox.util.responses.registration('localhost')
+
+        for encoding in ('gzip', 'deflate', 'gzip'):
+            res = requests.get('http://localhost/docs/',
+                               headers={'Accept-Encoding': encoding})
+            assert res.status_code == 200
+            assert res.headers['Content-Encoding'] == encoding
+            assert res.headers['Vary'] == 'Accept-Encoding'
+            assert res.text == DocumentService.DOCUMENT
+        assert compression.info()['hits'] == 1
+
+        res = requests.get('http://localhost/docs/',
+                           headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in res.headers
+        assert res.text == DocumentService.DOCUMENT
+
+        StackInABox.reset_services()
+
+    run()
@@ -0,0 +1,50 @@
+import asyncio
+import contextvars
+import threading
+
+from stackinabox.util import awaitables
+
+from tests.util import base
+
+
+context_value = contextvars.ContextVar('test_awaitables')
+
+
+async def handler_result(value):
+    await asyncio.sleep(0)
+    return (value, context_value.get(None), threading.current_thread())
+
+
+class TestUtilsAwaitables(base.UtilTestCase):
+
+    def test_resolve_not_awaitable(self):
+        result = (200, {}, 'body')
+        self.assertIs(awaitables.resolve(result), result)
+
+    def test_resolve_without_event_loop(self):
+        token = context_value.set('outer')
+        try:
+            self.assertEqual(
+                awaitables.resolve(handler_result(200)),
+                (200, 'outer', threading.current_thread())
+            )
+        finally:
+            context_value.reset(token)
+
+    def test_resolve_in_event_loop(self):
+        async def run():
+            context_value.set('inner')
+            return awaitables.resolve(handler_result(200))
+
+        value, context, thread = asyncio.run(run())
+        self.assertEqual(value, 200)
+        self.assertEqual(context, 'inner')
+        self.assertIsNot(thread, threading.current_thread())
+
+    def test_resolve_async(self):
+        result = (200, {}, 'body')
+        self.assertIs(asyncio.run(awaitables.resolve_async(result)), result)
+        self.assertEqual(
+            asyncio.run(awaitables.resolve_async(handler_result(200)))[0],
+            200
+        )
@@ -0,0 +1,153 @@
+import gzip
+import unittest
+import zlib
+
+import ddt
+
+from stackinabox.util.tools import CaseInsensitiveDict, Compression
+from stackinabox.util.tools.compression import (
+    brotli,
+    negotiate_encoding,
+    parse_accept_encoding
+)
+
+from tests.util import base
+
+
+CONTENT = b'Stack-In-A-Box ' * 64
+
+
+@ddt.ddt
+class TestCompression(base.TestCase):
+
+    def setUp(self):
+        super(TestCompression, self).setUp()
+        self.compression = Compression(maxsize=4)
+
+    def tearDown(self):
+        super(TestCompression, self).tearDown()
+
+    def update(self, body=CONTENT, headers=None, status_code=200,
+               encoding='gzip'):
+        request_headers = CaseInsensitiveDict()
+        if encoding is not None:
+            request_headers['Accept-Encoding'] = encoding
+        return self.compression.update(
+            request_headers,
+            (status_code, CaseInsensitiveDict(headers or {}), body)
+        )
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(
+            parse_accept_encoding('GZIP;q=0.5, deflate ;Q=0 , br,,*;q=x'),
+            {'gzip': 0.5, 'deflate': 0.0, 'br': 1.0, '*': 0.0}
+        )
+
+    @ddt.data(
+        ('gzip', 'gzip'),
+        ('deflate, gzip', 'gzip'),
+        ('deflate;q=1, gzip;q=0.5', 'deflate'),
+        ('*', 'gzip'),
+        ('*;q=0.1, gzip;q=0', 'deflate'),
+        ('gzip;q=0', None),
+        ('identity', None),
+        ('', None),
+    )
+    @ddt.unpack
+    def test_negotiate_encoding(self, value, expected):
+        self.assertEqual(negotiate_encoding(value, ('gzip', 'deflate')),
+                         expected)
+
+    @ddt.data(
+        ('gzip', gzip.decompress),
+        ('deflate', zlib.decompress),
+    )
+    @ddt.unpack
+    def test_compress(self, encoding, decompress):
+        status_code, headers, body = self.update(
+            headers={'Content-Length': str(len(CONTENT)),
+                     'Accept-Ranges': 'bytes'},
+            encoding=encoding
+        )
+        self.assertEqual(status_code, 200)
+        self.assertEqual(headers['Content-Encoding'], encoding)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        self.assertNotIn('Accept-Ranges', headers)
+        self.assertEqual(decompress(body), CONTENT)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        status_code, headers, body = self.update(encoding='gzip, br')
+        self.assertEqual(headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(body), CONTENT)
+
+    def test_string_and_mutable_bodies(self):
+        text = CONTENT.decode('utf-8')
+        self.assertEqual(gzip.decompress(self.update(body=text)[2]), CONTENT)
+        self.assertEqual(
+            gzip.decompress(self.update(body=bytearray(CONTENT))[2]), CONTENT
+        )
+
+    def test_cached_by_identity(self):
+        for _ in range(3):
+            self.update()
+        self.update(encoding='deflate')
+        info = self.compression.info()
+        self.assertEqual(info['hits'], 2)
+        self.assertEqual(info['misses'], 2)
+
+        # mutable bodies are compressed every time
+        body = bytearray(CONTENT)
+        compressed = self.update(body=body)[2]
+        body[0] = ord('s')
+        self.assertNotEqual(self.update(body=body)[2], compressed)
+
+    def test_vary(self):
+        self.assertEqual(
+            self.update(headers={'Vary': 'Cookie'})[1]['Vary'],
+            'Cookie, Accept-Encoding'
+        )
+        self.assertEqual(
+            self.update(headers={'Vary': 'accept-encoding'})[1]['Vary'],
+            'accept-encoding'
+        )
+
+        # the response depends on Accept-Encoding even when not compressed
+        status_code, headers, body = self.update(encoding='identity')
+        self.assertIs(body, CONTENT)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_weak_etag(self):
+        self.assertEqual(self.update(headers={'ETag': '"a"'})[1]['ETag'],
+                         'W/"a"')
+        self.assertEqual(self.update(headers={'ETag': 'W/"a"'})[1]['ETag'],
+                         'W/"a"')
+
+    @ddt.data(
+        # too small
+        (b'small', {}, 200),
+        # streamed
+        (iter([CONTENT]), {}, 200),
+        # already compressed
+        (CONTENT, {'Content-Encoding': 'gzip'}, 200),
+        (CONTENT, {'Content-Type': 'image/png'}, 200),
+        (CONTENT, {'Content-Type': 'application/zip'}, 200),
+        # partial responses and responses without a body
+        (CONTENT, {'Content-Range': 'bytes 0-9/10'}, 206),
+        (CONTENT, {}, 204),
+        (CONTENT, {}, 304),
+    )
+    @ddt.unpack
+    def test_not_compressed(self, body, headers, status_code):
+        status_code_out, headers, body_out = self.update(
+            body=body, headers=headers, status_code=status_code
+        )
+        self.assertEqual(status_code_out, status_code)
+        self.assertIs(body_out, body)
+        self.assertNotIn('Vary', headers)
+
+    def test_without_request_headers(self):
+        result = (200, CaseInsensitiveDict(), CONTENT)
+        self.assertIs(self.compression.update(None, result), result)
@@ -0,0 +1,233 @@
+import os
+import shutil
+import tempfile
+
+import ddt
+
+from stackinabox.util.tools import (
+    CaseInsensitiveDict,
+    Compression,
+    FileResponse
+)
+from stackinabox.util.tools.conditional import (
+    ConditionalRequests,
+    etag_matches,
+    is_not_modified
+)
+
+from tests.util import base
+
+
+LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+@ddt.ddt
+class TestConditionalRequests(base.TestCase):
+
+    def setUp(self):
+        super(TestConditionalRequests, self).setUp()
+        self.conditional = ConditionalRequests(maxsize=4)
+
+    def tearDown(self):
+        super(TestConditionalRequests, self).tearDown()
+
+    def update(self, method='GET', body=b'body', uri='/a', headers=None,
+               status_code=200, compression=None, **request_headers):
+        return self.conditional.update(
+            method,
+            CaseInsensitiveDict(request_headers),
+            uri,
+            (status_code, CaseInsensitiveDict(headers or {}), body),
+            compression
+        )
+
+    def check(self, method='GET', uri='/a', compression=None,
+              **request_headers):
+        return self.conditional.check(method,
+                                      CaseInsensitiveDict(request_headers),
+                                      uri,
+                                      CaseInsensitiveDict(),
+                                      compression)
+
+    @ddt.data(
+        ('"a"', '"a"', True),
+        ('"b", "a"', '"a"', True),
+        ('W/"a"', '"a"', True),
+        ('"a"', 'W/"a"', True),
+        ('*', None, True),
+        ('"a"', '"b"', False),
+        ('"a"', None, False),
+    )
+    @ddt.unpack
+    def test_etag_matches(self, if_none_match, etag, expected):
+        self.assertEqual(etag_matches(if_none_match, etag), expected)
+
+    @ddt.data(
+        ({'If-Modified-Since': LAST_MODIFIED}, True),
+        ({'If-Modified-Since': 'Tue, 02 Jan 2024 00:00:00 GMT'}, True),
+        ({'If-Modified-Since': 'Sun, 31 Dec 2023 00:00:00 GMT'}, False),
+        ({'If-Modified-Since': 'yesterday'}, False),
+        # If-None-Match takes precedence over If-Modified-Since
+        ({'If-None-Match': '"b"', 'If-Modified-Since': LAST_MODIFIED}, False),
+        ({}, False),
+    )
+    @ddt.unpack
+    def test_is_not_modified(self, request_headers, expected):
+        validators = {'ETag': '"a"', 'Last-Modified': LAST_MODIFIED}
+        self.assertEqual(
+            is_not_modified(CaseInsensitiveDict(request_headers), validators),
+            expected
+        )
+
+    def test_etag(self):
+        status_code, headers, body = self.update()
+        self.assertEqual(status_code, 200)
+        self.assertEqual(body, b'body')
+        etag = headers['ETag']
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+
+        # equal content gets the same ETag, different content another one
+        self.assertEqual(self.update(body=bytearray(b'body'))[1]['ETag'],
+                         etag)
+        self.assertEqual(self.update(body=u'body')[1]['ETag'], etag)
+        self.assertNotEqual(self.update(body=b'other')[1]['ETag'], etag)
+
+        # ETags set by the handler are kept
+        self.assertEqual(
+            self.update(headers={'ETag': '"mine"'})[1]['ETag'], '"mine"'
+        )
+
+    def test_etag_cached_by_identity(self):
+        body = b'x' * 1024
+        for _ in range(3):
+            self.update(body=body)
+        self.assertEqual(self.conditional.etags.hits, 2)
+        self.assertEqual(self.conditional.etags.misses, 1)
+
+        # mutable bodies are hashed every time
+        body = bytearray(b'x')
+        etag = self.update(body=body)[1]['ETag']
+        body[0] = ord('y')
+        self.assertNotEqual(self.update(body=body)[1]['ETag'], etag)
+
+    def test_not_modified_without_calling_the_handler(self):
+        self.assertIsNone(self.check(**{'If-None-Match': '"a"'}))
+        etag = self.update()[1]['ETag']
+
+        self.assertIsNone(self.check())
+        self.assertIsNone(self.check(**{'If-None-Match': '"other"'}))
+        self.assertIsNone(self.check(uri='/b', **{'If-None-Match': etag}))
+        self.assertIsNone(self.check('PUT', **{'If-None-Match': etag}))
+
+        for method in ('GET', 'HEAD'):
+            status_code, headers, body = self.check(
+                method, **{'If-None-Match': etag}
+            )
+            self.assertEqual(status_code, 304)
+            self.assertEqual(headers['ETag'], etag)
+            self.assertEqual(body, '')
+        self.assertEqual(self.conditional.not_modified, 2)
+
+    def test_not_modified_after_calling_the_handler(self):
+        etag = self.update()[1]['ETag']
+        status_code, headers, body = self.update(**{'If-None-Match': etag})
+        self.assertEqual(status_code, 304)
+        self.assertEqual(headers['ETag'], etag)
+        self.assertEqual(body, '')
+
+    def test_compressed_not_modified(self):
+        compression = Compression()
+        body = b'body' * 1024
+        etag = self.update(body=body, compression=compression)[1]['ETag']
+        weak_etag = 'W/{0}'.format(etag)
+
+        # the 304 has the ETag and Vary of the response it stands for
+        for request_headers, expected in (
+            ({'Accept-Encoding': 'gzip'}, weak_etag),
+            ({'Accept-Encoding': 'identity'}, etag),
+        ):
+            request_headers['If-None-Match'] = weak_etag
+            for status_code, headers, _ in (
+                self.check(compression=compression, **request_headers),
+                self.update(body=body, compression=compression,
+                            **request_headers),
+            ):
+                self.assertEqual(status_code, 304)
+                self.assertEqual(headers['ETag'], expected)
+                self.assertEqual(headers['Vary'], 'Accept-Encoding')
+
+        # responses too small to be compressed are left alone
+        etag = self.update(compression=compression)[1]['ETag']
+        _, headers, _ = self.check(compression=compression,
+                                   **{'Accept-Encoding': 'gzip',
+                                      'If-None-Match': etag})
+        self.assertEqual(headers['ETag'], etag)
+        self.assertNotIn('Vary', headers)
+
+    def test_validator_headers(self):
+        self.update(body=iter([b'streamed']), headers={
+            'Last-Modified': LAST_MODIFIED,
+            'Cache-Control': 'max-age=60',
+            'Content-Type': 'text/plain',
+        })
+        status_code, headers, _ = self.check(
+            **{'If-Modified-Since': LAST_MODIFIED}
+        )
+        self.assertEqual(status_code, 304)
+        self.assertEqual(headers['Cache-Control'], 'max-age=60')
+        self.assertNotIn('Content-Type', headers)
+        self.assertNotIn('ETag', headers)
+
+    @ddt.data(
+        # streamed bodies without validators
+        ('GET', iter([b'streamed']), 200),
+        # HEAD responses may not have a body
+        ('HEAD', b'', 200),
+        ('GET', b'body', 404),
+    )
+    @ddt.unpack
+    def test_not_validated(self, method, body, status_code):
+        result = self.update(method, body, status_code=status_code)
+        self.assertNotIn('ETag', result[1])
+        self.assertEqual(len(self.conditional.validators), 0)
+
+    @ddt.data('POST', 'PUT', 'PATCH', 'DELETE')
+    def test_unsafe_methods_drop_the_validators(self, method):
+        etag = self.update()[1]['ETag']
+        self.update('OPTIONS', status_code=204)
+        self.assertEqual(self.check(**{'If-None-Match': etag})[0], 304)
+
+        self.update(method, uri='/elsewhere', status_code=204)
+        self.assertIsNone(self.check(**{'If-None-Match': etag}))
+
+    def test_file_response(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'fixture.bin')
+            with open(path, 'wb') as fixture:
+                fixture.write(b'0123456789')
+            os.utime(path, (1704067200, 1704067200))
+
+            _, headers, response = self.update(body=FileResponse(path))
+            response.close()
+            self.assertEqual(headers['Last-Modified'], LAST_MODIFIED)
+            etag = headers['ETag']
+
+            _, headers, response = self.update(body=FileResponse(path, 1))
+            response.close()
+            self.assertNotEqual(headers['ETag'], etag)
+
+            response = FileResponse(path)
+            status_code, _, _ = self.update(body=response,
+                                            **{'If-None-Match': etag})
+            self.assertEqual(status_code, 304)
+            self.assertTrue(response.file.closed)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_info(self):
+        self.update()
+        info = self.conditional.info()
+        self.assertEqual(info['not_modified'], 0)
+        self.assertEqual(info['validators']['currsize'], 1)
+        self.assertEqual(info['etags']['maxsize'], 4)
@@ -0,0 +1,215 @@
+"""
+Stack-In-A-Box: activate Decorator Test
+
+The activate decorators of the utilities only bind the enable,
+registration, and disable functions of their core modules to the shared
+ActivateDecorator, so they are all tested the same way.
+"""
+import asyncio
+import collections.abc as collections
+import logging
+import types
+
+import aiohttp
+import httpx
+import pytest
+import requests
+import urllib3
+from urllib3.connectionpool import HTTPConnectionPool
+
+from stackinabox.stack import StackInABox
+from stackinabox.util.aiohttp import decorator as aiohttp_decorator
+from stackinabox.util.decorator import ActivateDecorator
+from stackinabox.util.httpx import decorator as httpx_decorator
+from stackinabox.util.requests import decorator as requests_decorator
+from stackinabox.util.urllib3 import decorator as urllib3_decorator
+
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+URL = 'http://localhost/hello/'
+
+
+def get_httpx():
+    res = httpx.get(URL)
+    return (res.status_code, res.text)
+
+
+async def get_httpx_async():
+    async with httpx.AsyncClient() as client:
+        res = await client.get(URL)
+    return (res.status_code, res.text)
+
+
+async def get_aiohttp_async():
+    async with aiohttp.ClientSession() as session:
+        async with session.get(URL) as res:
+            return (res.status, await res.text())
+
+
+def get_aiohttp():
+    return asyncio.run(get_aiohttp_async())
+
+
+def get_requests():
+    res = requests.get(URL)
+    return (res.status_code, res.text)
+
+
+def get_urllib3():
+    res = urllib3.request('GET', URL)
+    return (res.status, res.data.decode('utf-8'))
+
+
+class Integration(object):
+
+    def __init__(self, name, decorator, get, get_async, owner, attribute):
+        """
+        :param name: name of the utility
+        :param decorator: decorator module of the utility
+        :param get: function getting the hello service, returning the
+            status code and text of the response
+        :param get_async: coroutine function doing the same, None if the
+            client has no asynchronous API
+        :param owner: class whose attribute the utility patches
+        :param attribute: name of the patched attribute
+        """
+        self.name = name
+        self.decorator = decorator
+        self.get = get
+        self.get_async = get_async
+        self.owner = owner
+        self.attribute = attribute
+
+    def __repr__(self):
+        return self.name
+
+    def patched(self):
+        return getattr(self.owner, self.attribute)
+
+    async def get_from_coroutine(self):
+        if self.get_async is not None:
+            return await self.get_async()
+        return self.get()
+
+
+INTEGRATIONS = [
+    Integration('aiohttp', aiohttp_decorator, get_aiohttp,
+                get_aiohttp_async, aiohttp.ClientSession, '_request'),
+    Integration('httpx', httpx_decorator, get_httpx, get_httpx_async,
+                httpx.HTTPTransport, 'handle_request'),
+    Integration('requests', requests_decorator, get_requests, None,
+                requests.Session, 'get_adapter'),
+    Integration('urllib3', urllib3_decorator, get_urllib3, None,
+                HTTPConnectionPool, 'urlopen'),
+]
+
+
+@pytest.fixture(params=INTEGRATIONS, ids=repr)
+def integration(request):
+    return request.param
+
+
+def hello_generator():
+    yield HelloService()
+
+
+def hello_list():
+    return [
+        HelloService()
+    ]
+
+
+def test_verify_generator():
+    assert isinstance(hello_generator(), types.GeneratorType)
+
+
+def test_verify_list():
+    assert isinstance(hello_list(), collections.Iterable)
+
+
+def test_binds_core(integration):
+    decor_instance = integration.decorator.activate('localhost')
+    assert isinstance(decor_instance, ActivateDecorator)
+
+    core = integration.decorator.core
+    assert decor_instance.enable is core.enable
+    assert decor_instance.registration is core.registration
+    assert decor_instance.disable is core.disable
+
+
+def test_process_service_parameters(integration):
+    decor_instance = integration.decorator.activate('localhost')
+    with pytest.raises(TypeError):
+        decor_instance.process_service({}, raise_on_type=True)
+
+
+@pytest.mark.parametrize(
+    'services',
+    [HelloService, hello_generator, hello_list],
+    ids=['service', 'generator', 'list']
+)
+def test_basic(integration, services):
+
+    @integration.decorator.activate('localhost', services())
+    def run():
+        return integration.get()
+
+    assert run() == (200, 'Hello')
+
+
+def test_basic_with_stack_acccess(integration):
+
+    @integration.decorator.activate('localhost', HelloService(),
+                                    200, value='Hello',
+                                    access_services="stack")
+    def run(*args, **kwargs):
+        response_code = args[0]
+        value = kwargs.get('value', 'alpha')
+        stack = kwargs.get('stack', None)
+        assert integration.get() == (response_code, value)
+        assert len(stack) == 1
+        assert 'hello' in stack
+
+    run()
+
+
+def test_async_function(integration):
+
+    @integration.decorator.activate('localhost', HelloService())
+    async def run():
+        return await integration.get_from_coroutine()
+
+    assert asyncio.run(run()) == (200, 'Hello')
+
+
+def test_cleanup(integration):
+    original = integration.patched()
+
+    @integration.decorator.activate('localhost', HelloService())
+    def run():
+        assert integration.patched() is not original
+        raise RuntimeError('failed test')
+
+    with pytest.raises(RuntimeError):
+        run()
+
+    assert integration.patched() is original
+    assert StackInABox.get_thread_instance().services == {}
+
+
+def test_async_cleanup(integration):
+    original = integration.patched()
+
+    @integration.decorator.activate('localhost', HelloService())
+    async def run():
+        assert integration.patched() is not original
+        raise RuntimeError('failed test')
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+    assert integration.patched() is original
+    assert StackInABox.get_thread_instance().services == {}
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+
+import ddt
+
+from stackinabox.util.tools import (
+    FileResponse,
+    get_body_bytes,
+    get_body_length,
+    get_body_reader,
+    iterate_body
+)
+
+from tests.util import base
+
+
+CONTENT = bytes(range(256)) * 1024
+
+
+@ddt.ddt
+class TestFileResponse(base.TestCase):
+
+    def setUp(self):
+        super(TestFileResponse, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'fixture.bin')
+        with open(self.path, 'wb') as fixture:
+            fixture.write(CONTENT)
+
+    def tearDown(self):
+        super(TestFileResponse, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_path_and_file(self):
+        with FileResponse(self.path) as response:
+            self.assertEqual(len(response), len(CONTENT))
+            self.assertEqual(response.view, CONTENT)
+
+        fixture = open(self.path, 'rb')
+        with FileResponse(fixture, 1000, 24) as response:
+            self.assertEqual(len(response), 24)
+            self.assertEqual(response.view, CONTENT[1000:1024])
+        self.assertTrue(fixture.closed)
+
+    @ddt.data((-1, None), (0, len(CONTENT) + 1), (len(CONTENT), 1), (10, -1))
+    @ddt.unpack
+    def test_invalid_range(self, offset, length):
+        with self.assertRaises(ValueError):
+            FileResponse(self.path, offset, length)
+
+    def test_view_is_mapped(self):
+        with FileResponse(self.path, 256) as response:
+            view = response.view
+            self.assertIsInstance(view, memoryview)
+            self.assertIs(response.view, view)
+            self.assertEqual(view[:256], CONTENT[:256])
+
+    def test_empty_file(self):
+        empty = os.path.join(self.directory, 'empty.bin')
+        open(empty, 'wb').close()
+        with FileResponse(empty) as response:
+            self.assertEqual(len(response), 0)
+            self.assertEqual(response.read(), b'')
+            self.assertEqual(list(iterate_body(response)), [])
+
+    def test_read(self):
+        with FileResponse(self.path, 10, 100) as response:
+            self.assertEqual(response.read(40), CONTENT[10:50])
+            self.assertEqual(response.read(), CONTENT[50:110])
+            self.assertEqual(response.read(10), b'')
+
+    @ddt.data(
+        (None, None),
+        (10, 20),
+        (-100, None),
+        (None, -100),
+        (5000, 1000),
+    )
+    @ddt.unpack
+    def test_slice(self, start, stop):
+        with FileResponse(self.path, 1000, 10000) as response:
+            expected = CONTENT[1000:11000][start:stop]
+            part = response.slice(start, stop)
+
+        # the part remains usable once the whole has been closed
+        with part:
+            self.assertEqual(len(part), len(expected))
+            self.assertEqual(part.read(), expected)
+
+    def test_iterate_body(self):
+        response = FileResponse(self.path)
+        chunks = list(iterate_body(response, 100000))
+        self.assertEqual([len(chunk) for chunk in chunks],
+                         [100000, 100000, len(CONTENT) - 200000])
+        self.assertTrue(all(isinstance(chunk, memoryview)
+                            for chunk in chunks))
+        self.assertEqual(b''.join(chunks), CONTENT)
+
+        # the file is closed once the body has been iterated over
+        self.assertTrue(response.file.closed)
+        del chunks
+
+    def test_get_body_reader(self):
+        response = FileResponse(self.path, 10, 1000)
+        reader = get_body_reader(response, 256)
+        self.assertEqual(reader.read(100), CONTENT[10:110])
+        self.assertEqual(reader.read(), CONTENT[110:1010])
+        reader.close()
+        self.assertTrue(response.file.closed)
+
+    def test_body_length(self):
+        with FileResponse(self.path, 10, 1000) as response:
+            self.assertIsNone(get_body_bytes(response))
+            self.assertEqual(get_body_length(response), 1000)
+        self.assertEqual(get_body_length(u'caf\xe9'), 5)
+        self.assertIsNone(get_body_length(iter([b'chunk'])))
+
+    def test_close_with_views_in_use(self):
+        response = FileResponse(self.path)
+        chunk = next(response.iter_chunks(1024))
+        response.close()
+        self.assertTrue(response.file.closed)
+        self.assertEqual(chunk, CONTENT[:1024])
@@ -0,0 +1,181 @@
+import threading
+
+import ddt
+
+from stackinabox.util.tools import HoldStore
+
+from tests.util import base
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@ddt.ddt
+class TestHoldStore(base.TestCase):
+
+    def setUp(self):
+        super(TestHoldStore, self).setUp()
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        super(TestHoldStore, self).tearDown()
+
+    @ddt.data(
+        {'max_entries': 0},
+        {'max_bytes': -1},
+        {'ttl': 0},
+    )
+    def test_invalid_limits(self, limits):
+        with self.assertRaises(ValueError):
+            HoldStore(**limits)
+
+    def test_mapping(self):
+        store = HoldStore()
+        self.assertEqual(store, {})
+        store['a'] = 1
+        store.update(b=2)
+        self.assertEqual(store, {'a': 1, 'b': 2})
+        self.assertEqual(store.get('c', 'default'), 'default')
+        with self.assertRaises(KeyError):
+            store['c']
+        del store['a']
+        self.assertEqual(list(store), ['b'])
+        self.assertEqual(store.pop('b'), 2)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(repr(store), 'HoldStore({})')
+
+        info = store.info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 2)
+        self.assertEqual(info['currbytes'], 0)
+
+    def test_max_entries(self):
+        store = HoldStore(max_entries=2)
+        store['a'] = 1
+        store['b'] = 2
+        # using 'a' makes 'b' the least recently used
+        self.assertEqual(store['a'], 1)
+        # membership tests do not count as use
+        self.assertIn('b', store)
+        store['c'] = 3
+        self.assertEqual(store, {'a': 1, 'c': 3})
+        self.assertEqual(store.evictions, 1)
+
+    def test_max_bytes(self):
+        store = HoldStore(max_bytes=10, sizer=len)
+        store['a'] = b'1234'
+        store['b'] = b'5678'
+        self.assertEqual(store.currbytes, 8)
+        store['c'] = b'90'
+        self.assertEqual(store.currbytes, 10)
+
+        # replacing a value accounts for the new size only
+        store['a'] = b'12345'
+        self.assertEqual(store, {'c': b'90', 'a': b'12345'})
+        self.assertEqual(store.currbytes, 7)
+        self.assertEqual(store.evictions, 1)
+
+        with self.assertRaises(ValueError):
+            store['d'] = b'x' * 11
+        self.assertEqual(len(store), 2)
+
+    def test_ttl(self):
+        store = HoldStore(ttl=10, clock=self.clock)
+        store['a'] = 1
+        self.clock.now = 5
+        store['b'] = 2
+        # using an entry does not extend its life, storing it again does
+        self.assertEqual(store['a'], 1)
+        self.clock.now = 10
+        self.assertEqual(store, {'b': 2})
+        self.assertNotIn('a', store)
+        store['b'] = 3
+        self.clock.now = 19
+        self.assertEqual(store['b'], 3)
+        self.clock.now = 20
+        self.assertEqual(store.get('b'), None)
+        self.assertEqual(store.evictions, 2)
+        self.assertEqual(store.currbytes, 0)
+
+    def test_pinned(self):
+        store = HoldStore(max_entries=1, max_bytes=64, ttl=10,
+                          clock=self.clock)
+        store['adapter'] = b'unpinned'
+        store.pin('adapter', b'x' * 1024)
+        self.assertEqual(store.pinned, {'adapter'})
+        self.assertEqual(store.currbytes, 0)
+
+        # pinned entries are neither evicted, expired, nor budgeted
+        store['a'] = 1
+        store['b'] = 2
+        self.clock.now = 5
+        store['c'] = 3
+        self.clock.now = 100
+        self.assertEqual(store, {'adapter': b'x' * 1024})
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.info()['currsize'], 0)
+
+        # storing a pinned key again keeps it pinned
+        store['adapter'] = b'replaced'
+        self.assertEqual(store['adapter'], b'replaced')
+        self.assertEqual(store.hits, 0)
+        self.assertEqual(store.pinned, {'adapter'})
+
+        del store['adapter']
+        self.assertEqual(store.pinned, set())
+        store.pin('adapter', 1)
+        store.clear()
+        self.assertEqual(store, {})
+
+    def test_clear(self):
+        store = HoldStore(ttl=10, clock=self.clock)
+        store['a'] = 1
+        self.assertEqual(store['a'], 1)
+        store.clear()
+        self.assertEqual(store, {})
+        self.assertEqual(store.info()['currbytes'], 0)
+        self.assertEqual(store.hits, 1)
+
+    def test_info(self):
+        store = HoldStore(max_entries=4, max_bytes=1024, ttl=60)
+        store['a'] = 'value'
+        self.assertEqual(
+            store.info(),
+            {
+                'hits': 0,
+                'misses': 0,
+                'evictions': 0,
+                'max_entries': 4,
+                'max_bytes': 1024,
+                'ttl': 60,
+                'currsize': 1,
+                'currbytes': store.sizer('value'),
+                'pinned': 0
+            }
+        )
+
+    def test_threads(self):
+        store = HoldStore(max_entries=8)
+
+        def worker(offset):
+            for i in range(1000):
+                store[offset + i] = i
+                store.get(offset + i)
+
+        threads = [
+            threading.Thread(target=worker, args=(offset * 1000,))
+            for offset in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(store), 8)
+        self.assertEqual(store.evictions, 4000 - 8)
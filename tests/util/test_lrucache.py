@@ -0,0 +1,92 @@
+import threading
+
+import ddt
+
+from stackinabox.util.tools import LRUCache
+
+from tests.util import base
+
+
+@ddt.ddt
+class TestLRUCache(base.TestCase):
+
+    def setUp(self):
+        super(TestLRUCache, self).setUp()
+
+    def tearDown(self):
+        super(TestLRUCache, self).tearDown()
+
+    @ddt.data(0, -1)
+    def test_invalid_maxsize(self, maxsize):
+        with self.assertRaises(ValueError):
+            LRUCache(maxsize)
+
+    def test_get_put(self):
+        cache = LRUCache(2)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', 'default'), 'default')
+        cache.put('a', 1)
+        self.assertIn('a', cache)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(
+            cache.info(),
+            {
+                'hits': 1,
+                'misses': 2,
+                'evictions': 0,
+                'maxsize': 2,
+                'currsize': 1
+            }
+        )
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        # using 'a' makes 'b' the least recently used
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('b', cache)
+        self.assertIn('a', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.evictions, 1)
+
+    def test_put_existing(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.put('a', 3)
+        cache.put('c', 4)
+        self.assertEqual(cache.get('a'), 3)
+        self.assertNotIn('b', cache)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits, 1)
+
+    def test_threads(self):
+        cache = LRUCache(8)
+
+        def worker(offset):
+            for value in range(1000):
+                key = (offset + value) % 16
+                if cache.get(key) is None:
+                    cache.put(key, value)
+
+        threads = [
+            threading.Thread(target=worker, args=(offset,))
+            for offset in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(len(cache), 8)
+        self.assertEqual(cache.hits + cache.misses, 8000)
@@ -0,0 +1,242 @@
+import io
+import mmap
+import os
+import shutil
+import tempfile
+
+import ddt
+
+from stackinabox.util.tools import (
+    CaseInsensitiveDict,
+    FileResponse,
+    get_body_view,
+    get_range_response,
+    parse_range
+)
+
+from tests.util import base
+
+
+CONTENT = bytes(range(100))
+
+
+def range_request(value, body=CONTENT, method='GET', status_code=200):
+    request_headers = CaseInsensitiveDict()
+    if value is not None:
+        request_headers['Range'] = value
+    return get_range_response(method,
+                              request_headers,
+                              (status_code, CaseInsensitiveDict(), body))
+
+
+def parse_multipart(headers, chunks):
+    boundary = headers['Content-Type'].split('boundary=')[1].encode()
+    body = b''.join(chunks)
+    assert body.endswith(b'--' + boundary + b'--\r\n')
+    parts = []
+    for part in body.split(b'--' + boundary)[1:-1]:
+        head, content = part.split(b'\r\n\r\n', 1)
+        assert content.endswith(b'\r\n')
+        parts.append((head.split(b'\r\n')[1:], content[:-2]))
+    return parts
+
+
+@ddt.ddt
+class TestRanges(base.TestCase):
+
+    def setUp(self):
+        super(TestRanges, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'fixture.bin')
+        with open(self.path, 'wb') as fixture:
+            fixture.write(CONTENT)
+
+    def tearDown(self):
+        super(TestRanges, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    @ddt.data(
+        ('bytes=0-9', [(0, 10)]),
+        ('bytes=90-', [(90, 100)]),
+        ('bytes=-10', [(90, 100)]),
+        ('bytes=-1000', [(0, 100)]),
+        ('bytes=95-1000', [(95, 100)]),
+        ('bytes = 0-0, 10-19 ,-1', [(0, 1), (10, 20), (99, 100)]),
+        ('BYTES=0-1', [(0, 2)]),
+        ('bytes=100-', []),
+        ('bytes=-0', []),
+        ('bytes=100-200,-0', []),
+        ('bytes=100-200,5-5', [(5, 6)]),
+        ('items=0-9', None),
+        ('bytes=', None),
+        ('bytes=9-0', None),
+        ('bytes=a-9', None),
+        ('bytes=-', None),
+        ('bytes=0-9,10', None),
+        ('0-9', None),
+    )
+    @ddt.unpack
+    def test_parse_range(self, value, expected):
+        self.assertEqual(parse_range(value, 100), expected)
+
+    def test_single_range(self):
+        status_code, headers, body = range_request('bytes=10-19')
+        self.assertEqual(status_code, 206)
+        self.assertEqual(headers['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(headers['Accept-Ranges'], 'bytes')
+        self.assertIsInstance(body, memoryview)
+        self.assertIs(body.obj, CONTENT)
+        self.assertEqual(body, CONTENT[10:20])
+
+    def test_content_length_is_updated(self):
+        result = (200, CaseInsensitiveDict({'Content-Length': '100'}),
+                  CONTENT)
+        _, headers, _ = get_range_response(
+            'GET', CaseInsensitiveDict({'Range': 'bytes=0-4'}), result
+        )
+        self.assertEqual(headers['Content-Length'], '5')
+
+        result = (200, CaseInsensitiveDict({'Content-Length': '100'}),
+                  CONTENT)
+        status_code, headers, _ = get_range_response(
+            'GET', CaseInsensitiveDict({'Range': 'bytes=200-'}), result
+        )
+        self.assertEqual(status_code, 416)
+        self.assertNotIn('Content-Length', headers)
+
+    def test_not_satisfiable(self):
+        status_code, headers, body = range_request('bytes=100-')
+        self.assertEqual(status_code, 416)
+        self.assertEqual(headers['Content-Range'], 'bytes */100')
+        self.assertEqual(body, b'')
+
+    def test_multiple_ranges(self):
+        status_code, headers, body = range_request('bytes=0-4,-5')
+        self.assertEqual(status_code, 206)
+        self.assertTrue(
+            headers['Content-Type'].startswith('multipart/byteranges; ')
+        )
+        chunks = list(body)
+        self.assertEqual(int(headers['Content-Length']),
+                         sum(len(chunk) for chunk in chunks))
+        self.assertEqual(parse_multipart(headers, chunks), [
+            ([b'Content-Range: bytes 0-4/100'], CONTENT[:5]),
+            ([b'Content-Range: bytes 95-99/100'], CONTENT[95:]),
+        ])
+
+    def test_multiple_ranges_content_type(self):
+        result = (200, CaseInsensitiveDict({'Content-Type': 'text/plain'}),
+                  u'caf\xe9 au lait')
+        _, headers, body = get_range_response(
+            'GET', CaseInsensitiveDict({'Range': 'bytes=0-4,6-7'}), result
+        )
+        self.assertEqual(parse_multipart(headers, list(body)), [
+            ([b'Content-Type: text/plain', b'Content-Range: bytes 0-4/13'],
+             u'caf\xe9'.encode('utf-8')),
+            ([b'Content-Type: text/plain', b'Content-Range: bytes 6-7/13'],
+             b'au'),
+        ])
+
+    @ddt.data(
+        # no range requested
+        (None, 'GET', 200),
+        # malformed ranges are ignored
+        ('bytes=9-0', 'GET', 200),
+        # only GET responses are sent in part
+        ('bytes=0-9', 'HEAD', 200),
+        ('bytes=0-9', 'PUT', 200),
+        ('bytes=0-9', 'GET', 404),
+    )
+    @ddt.unpack
+    def test_unchanged(self, value, method, status_code):
+        status_code_out, headers, body = range_request(
+            value, method=method, status_code=status_code
+        )
+        self.assertEqual(status_code_out, status_code)
+        self.assertIs(body, CONTENT)
+        self.assertNotIn('Content-Range', headers)
+
+    def test_streamed_body_is_unchanged(self):
+        chunks = iter([b'chunk'])
+        status_code, headers, body = range_request('bytes=0-1', chunks)
+        self.assertEqual(status_code, 200)
+        self.assertIs(body, chunks)
+        self.assertNotIn('Accept-Ranges', headers)
+
+    @ddt.data(
+        ('"v1"', 206),
+        ('Mon, 01 Jan 2024 00:00:00 GMT', 206),
+        ('"v2"', 200),
+        ('W/"v1"', 200),
+    )
+    @ddt.unpack
+    def test_if_range(self, if_range, expected_status):
+        result = (
+            200,
+            CaseInsensitiveDict({
+                'ETag': '"v1"',
+                'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'
+            }),
+            CONTENT
+        )
+        status_code, _, _ = get_range_response(
+            'GET',
+            CaseInsensitiveDict({'Range': 'bytes=0-1', 'If-Range': if_range}),
+            result
+        )
+        self.assertEqual(status_code, expected_status)
+
+    def test_file_response(self):
+        response = FileResponse(self.path, 10)
+        status_code, headers, body = range_request('bytes=5-9', response)
+        self.assertEqual(status_code, 206)
+        self.assertEqual(headers['Content-Range'], 'bytes 5-9/90')
+        self.assertIsInstance(body, FileResponse)
+        self.assertTrue(response.file.closed)
+        with body:
+            self.assertEqual(body.read(), CONTENT[15:20])
+
+        response = FileResponse(self.path)
+        _, headers, body = range_request('bytes=0-1,-2', response)
+        self.assertTrue(response.file.closed)
+        self.assertEqual(parse_multipart(headers, list(body)), [
+            ([b'Content-Range: bytes 0-1/100'], CONTENT[:2]),
+            ([b'Content-Range: bytes 98-99/100'], CONTENT[98:]),
+        ])
+
+    def test_file(self):
+        fixture = open(self.path, 'rb')
+        fixture.seek(50)
+        status_code, headers, body = range_request('bytes=0-9', fixture)
+        self.assertEqual(status_code, 206)
+        self.assertEqual(headers['Content-Range'], 'bytes 0-9/50')
+        self.assertTrue(fixture.closed)
+        with body:
+            self.assertEqual(body.read(), CONTENT[50:60])
+
+        # malformed ranges still send the whole file
+        fixture = open(self.path, 'rb')
+        status_code, _, body = range_request('bytes=9-0', fixture)
+        self.assertEqual(status_code, 200)
+        with body:
+            self.assertEqual(body.read(), CONTENT)
+
+    def test_mmap_and_bytesio(self):
+        with open(self.path, 'rb') as fixture:
+            mapping = mmap.mmap(fixture.fileno(), 0, access=mmap.ACCESS_READ)
+        status_code, _, body = range_request('bytes=-3', mapping)
+        self.assertEqual(status_code, 206)
+        self.assertIs(body.obj, mapping)
+        self.assertEqual(body, CONTENT[97:])
+        body.release()
+        mapping.close()
+
+        buffer = io.BytesIO(CONTENT)
+        status_code, _, body = range_request('bytes=1-2', buffer)
+        self.assertEqual(status_code, 206)
+        self.assertEqual(body, CONTENT[1:3])
+
+    def test_get_body_view(self):
+        self.assertEqual(get_body_view(u'caf\xe9'), u'caf\xe9'.encode())
+        self.assertIsNone(get_body_view(iter([b'chunk'])))
+        self.assertIsNone(get_body_view(io.StringIO(u'text')))
@@ -0,0 +1,209 @@
+import asyncio
+import io
+
+import ddt
+
+from stackinabox.util.tools import (
+    BodyReader,
+    IterableReader,
+    get_body_bytes,
+    get_body_reader,
+    iterate_body,
+    iterate_body_async
+)
+
+from tests.util import base
+
+
+class ClosingIO(io.BytesIO):
+
+    def __init__(self, *args, **kwargs):
+        super(ClosingIO, self).__init__(*args, **kwargs)
+        self.was_closed = False
+
+    def close(self):
+        self.was_closed = True
+        super(ClosingIO, self).close()
+
+
+@ddt.ddt
+class TestStreaming(base.TestCase):
+
+    def setUp(self):
+        super(TestStreaming, self).setUp()
+        self.closed = []
+
+    def tearDown(self):
+        super(TestStreaming, self).tearDown()
+
+    def chunks(self):
+        try:
+            yield u'caf\xe9 '
+            yield b''
+            yield bytearray(b'bytes')
+        finally:
+            self.closed.append(True)
+
+    @ddt.data(
+        (None, b''),
+        (u'caf\xe9', b'caf\xc3\xa9'),
+        (b'bytes', b'bytes'),
+        (bytearray(b'bytes'), b'bytes'),
+        (memoryview(b'bytes'), b'bytes'),
+    )
+    @ddt.unpack
+    def test_body_bytes(self, body, content):
+        self.assertEqual(bytes(get_body_bytes(body)), content)
+        self.assertEqual(
+            b''.join(bytes(chunk) for chunk in iterate_body(body)),
+            content
+        )
+
+    def test_streamed_body_bytes(self):
+        self.assertIsNone(get_body_bytes(io.BytesIO(b'file')))
+        self.assertIsNone(get_body_bytes(iter([b'chunk'])))
+
+    def test_iterate_body(self):
+        self.assertEqual(
+            [bytes(chunk) for chunk in iterate_body(self.chunks())],
+            [b'caf\xc3\xa9 ', b'', b'bytes']
+        )
+        self.assertEqual(self.closed, [True])
+
+        body = ClosingIO(b'0123456789')
+        self.assertEqual(list(iterate_body(body, 4)),
+                         [b'0123', b'4567', b'89'])
+        self.assertTrue(body.was_closed)
+
+        chunks = iterate_body(self.chunks())
+        next(chunks)
+        chunks.close()
+        self.assertEqual(self.closed, [True, True])
+
+    def test_iterate_body_async(self):
+
+        async def produce():
+            yield u'async '
+            yield b'chunks'
+
+        async def collect(body):
+            return [
+                bytes(chunk) async for chunk in iterate_body_async(body, 4)
+            ]
+
+        self.assertEqual(asyncio.run(collect(produce())),
+                         [b'async ', b'chunks'])
+        self.assertEqual(asyncio.run(collect(io.BytesIO(b'file body'))),
+                         [b'file', b' bod', b'y'])
+        self.assertEqual(asyncio.run(collect(self.chunks())),
+                         [b'caf\xc3\xa9 ', b'', b'bytes'])
+        self.assertEqual(self.closed, [True])
+
+    def test_iterable_reader(self):
+        reader = IterableReader(self.chunks())
+        self.assertEqual(reader.read(3), b'caf')
+        self.assertEqual(reader.read(), b'\xc3\xa9 bytes')
+        self.assertEqual(reader.read(), b'')
+
+        reader = IterableReader(self.chunks())
+        buffer = bytearray(4)
+        self.assertEqual(reader.readinto(memoryview(buffer)), 4)
+        self.assertEqual(buffer, b'caf\xc3')
+        reader.close()
+        self.assertEqual(self.closed, [True, True])
+
+    def test_body_reader(self):
+        reader = get_body_reader(self.chunks(), 4)
+        self.assertIsInstance(reader, io.BufferedReader)
+        self.assertEqual(reader.read(), b'caf\xc3\xa9 bytes')
+        reader.close()
+        self.assertEqual(self.closed, [True])
+
+        self.assertEqual(get_body_reader(u'text').read(), b'text')
+
+        body = io.BufferedReader(io.BytesIO(b'buffered'))
+        self.assertIs(get_body_reader(body), body)
+
+
+@ddt.ddt
+class TestBodyReader(base.TestCase):
+
+    def setUp(self):
+        super(TestBodyReader, self).setUp()
+
+    def tearDown(self):
+        super(TestBodyReader, self).tearDown()
+
+    @ddt.data(
+        b'0123456789',
+        u'0123456789',
+        bytearray(b'0123456789'),
+        io.BytesIO(b'0123456789'),
+        iter([b'012', u'3456', b'', b'789']),
+    )
+    def test_read(self, body):
+        reader = BodyReader(body)
+        self.assertTrue(reader.readable())
+        self.assertEqual(reader.read(4), b'0123')
+
+        buffer = bytearray(4)
+        self.assertEqual(reader.readinto(memoryview(buffer)), 4)
+        self.assertEqual(buffer, b'4567')
+
+        self.assertEqual(reader.read(), b'89')
+        self.assertEqual(reader.read(), b'')
+        self.assertEqual(reader.readinto(bytearray(4)), 0)
+
+    @ddt.data(
+        b'0123456789',
+        io.BytesIO(b'0123456789'),
+        iter([b'0123456789']),
+    )
+    def test_iter_chunks(self, body):
+        chunks = list(BodyReader(body).iter_chunks(4))
+        self.assertEqual([bytes(chunk) for chunk in chunks],
+                         [b'0123', b'4567', b'89'])
+
+    def test_in_memory_body_is_not_copied(self):
+        body = b'0123456789'
+        reader = BodyReader(body)
+        chunk = next(reader.iter_chunks(4))
+        self.assertIsInstance(chunk, memoryview)
+        self.assertIs(chunk.obj, body)
+        self.assertIs(BodyReader(body).read(), body)
+
+    def test_none(self):
+        self.assertEqual(BodyReader(None).read(), b'')
+        self.assertEqual(list(BodyReader(None).iter_chunks()), [])
+
+    def test_length(self):
+        stream = io.BytesIO(b'0123456789next request')
+        reader = BodyReader(stream, 10)
+        self.assertEqual(b''.join(reader.iter_chunks(4)), b'0123456789')
+        self.assertEqual(reader.read(), b'')
+        self.assertEqual(stream.read(), b'next request')
+
+    def test_file_without_readinto(self):
+
+        class TextFile(object):
+
+            def __init__(self):
+                self.data = io.StringIO(u'text file')
+
+            def read(self, size):
+                return self.data.read(size)
+
+        self.assertEqual(BodyReader(TextFile()).read(), b'text file')
+
+    def test_lazy(self):
+        produced = []
+
+        def chunks():
+            for chunk in (b'one', b'two'):
+                produced.append(chunk)
+                yield chunk
+
+        reader = BodyReader(chunks())
+        self.assertEqual(produced, [])
+        self.assertEqual(reader.read(3), b'one')
+        self.assertEqual(produced, [b'one'])
@@ -0,0 +1,96 @@
+import logging
+
+import mock
+
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+
+from tests.util import base
+
+
+class CountingArgument(object):
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return 'counted'
+
+
+class TestUtilsTrace(base.UtilTestCase):
+
+    def setUp(self):
+        super(TestUtilsTrace, self).setUp()
+        self.logger = logging.getLogger('tests.util.test_trace')
+        self.original_level = self.logger.level
+
+    def tearDown(self):
+        super(TestUtilsTrace, self).tearDown()
+        trace.enable()
+        self.logger.setLevel(self.original_level)
+        StackInABox.reset_services()
+
+    def test_enable_disable(self):
+        trace.disable()
+        self.assertFalse(trace.ENABLED)
+        trace.enable()
+        self.assertTrue(trace.ENABLED)
+
+    def test_is_enabled(self):
+        self.logger.setLevel(logging.DEBUG)
+        self.assertTrue(trace.is_enabled(self.logger))
+
+        trace.disable()
+        self.assertFalse(trace.is_enabled(self.logger))
+
+        trace.enable()
+        self.logger.setLevel(logging.INFO)
+        self.assertFalse(trace.is_enabled(self.logger))
+
+    def test_debug_formats_when_emitted(self):
+        argument = CountingArgument()
+        self.logger.setLevel(logging.DEBUG)
+        with self.assertLogs(self.logger, logging.DEBUG) as logs:
+            trace.debug(self.logger, 'value %s', argument)
+        self.assertEqual(logs.output, ['DEBUG:{0}:value counted'.format(
+            self.logger.name
+        )])
+        self.assertEqual(argument.formatted, 1)
+
+    def test_debug_not_formatted_when_not_emitted(self):
+        argument = CountingArgument()
+
+        self.logger.setLevel(logging.INFO)
+        trace.debug(self.logger, 'value %s', argument)
+
+        self.logger.setLevel(logging.DEBUG)
+        trace.disable()
+        with mock.patch.object(self.logger, 'debug') as mock_debug:
+            trace.debug(self.logger, 'value %s', argument)
+            self.assertEqual(mock_debug.call_count, 0)
+
+        self.assertEqual(argument.formatted, 0)
+
+    def test_dispatch_does_not_log_when_disabled(self):
+        StackInABox.register_service(self.hello_service)
+        StackInABox.update_uri('localhost')
+        logging.getLogger('stackinabox').setLevel(logging.DEBUG)
+        try:
+            # the first call builds the route matcher
+            StackInABox.call_into('GET', None, 'localhost/hello/', {})
+
+            trace.disable()
+            with mock.patch('logging.Logger.isEnabledFor') as mock_enabled:
+                status, _, body = StackInABox.call_into(
+                    'GET', None, 'localhost/hello/', {}
+                )
+                self.assertEqual(mock_enabled.call_count, 0)
+            self.assertEqual((status, body), (200, 'Hello'))
+
+            trace.enable()
+            with self.assertLogs('stackinabox', logging.DEBUG) as logs:
+                StackInABox.call_into('GET', None, 'localhost/hello/', {})
+            self.assertTrue(logs.output)
+        finally:
+            logging.getLogger('stackinabox').setLevel(logging.NOTSET)
@@ -0,0 +1,270 @@
+"""
+Stack-In-A-Box: urllib3 Test
+"""
+import gzip
+import hashlib
+import io
+import json
+import logging
+
+import mock
+import pytest
+import urllib3
+from urllib3.connectionpool import HTTPConnectionPool
+
+import stackinabox.util.urllib3
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+from tests.utils.services import AdvancedService, UploadService
+from tests.utils.hello import HelloService
+
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingService(StackInABoxService):
+
+    CHUNK = b'x' * 65536
+    CHUNK_COUNT = 1024
+
+    def __init__(self):
+        super(StreamingService, self).__init__('stream')
+        self.produced = 0
+        self.register(StackInABoxService.POST, '/', StreamingService.echo)
+        self.register(StackInABoxService.GET, '/large',
+                      StreamingService.large)
+        self.register(StackInABoxService.GET, '/file',
+                      StreamingService.file)
+        self.register(StackInABoxService.GET, '/gzip',
+                      StreamingService.compressed)
+
+    def echo(self, request, uri, headers):
+        headers['x-echo'] = request.headers['x-test']
+        return (201, headers, request.body)
+
+    def large(self, request, uri, headers):
+        def chunks():
+            for _ in range(StreamingService.CHUNK_COUNT):
+                self.produced += 1
+                yield StreamingService.CHUNK
+
+        return (200, headers, chunks())
+
+    def file(self, request, uri, headers):
+        return (200, headers, io.BytesIO(b'file body'))
+
+    def compressed(self, request, uri, headers):
+        headers['Content-Encoding'] = 'gzip'
+        return (200, headers, gzip.compress(b'decompressed'))
+
+
+@pytest.fixture
+def http():
+    StackInABox.reset_services()
+    stackinabox.util.urllib3.enable()
+    yield urllib3.PoolManager()
+    stackinabox.util.urllib3.disable()
+    StackInABox.reset_services()
+
+
+def test_basic_urllib3(http):
+    StackInABox.register_service(HelloService())
+    stackinabox.util.urllib3.registration('localhost')
+
+    res = http.request('GET', 'http://localhost/hello/')
+    assert res.status == 200
+    assert res.reason == 'OK'
+    assert res.data == b'Hello'
+
+    res = http.request('GET', 'https://localhost/hello/')
+    assert res.status == 200
+
+
+def test_advanced_urllib3(http):
+    StackInABox.register_service(AdvancedService())
+    stackinabox.util.urllib3.registration('localhost')
+
+    res = http.request('GET', 'http://localhost/advanced/')
+    assert res.status == 200
+    assert res.data == b'Hello'
+
+    res = http.request('GET', 'http://localhost/advanced/h')
+    assert res.status == 200
+    assert res.data == b'Good-Bye'
+
+    expected_result = {
+        'bob': 'bob: Good-Bye alice',
+        'alice': 'alice: Good-Bye bob',
+        'joe': 'joe: Good-Bye jane'
+    }
+    res = http.request('GET', 'http://localhost/advanced/g',
+                       fields={'bob': 'alice', 'alice': 'bob', 'joe': 'jane'})
+    assert res.status == 200
+    assert res.json() == expected_result
+
+    res = http.request('GET', 'http://localhost/advanced/1234567890')
+    assert res.status == 200
+    assert res.data == b'okay'
+
+    res = http.request('GET', 'http://localhost/advanced/_234567890')
+    assert res.status == 595
+    assert res.reason == 'Route Not Handled'
+
+    res = http.request('PUT', 'http://localhost/advanced/h')
+    assert res.status == 405
+    assert res.reason == 'Method Not Allowed'
+
+    res = http.request('PUT', 'http://localhost/advanced2/i')
+    assert res.status == 597
+    assert res.reason == 'Unknown Service'
+
+
+def test_request_body_and_headers(http):
+    StackInABox.register_service(StreamingService())
+    stackinabox.util.urllib3.registration('localhost')
+
+    res = http.request('POST', 'http://localhost/stream/',
+                       body=b'\x00binary',
+                       headers={'X-Test': 'tested'})
+    assert res.status == 201
+    assert res.headers['X-Echo'] == 'tested'
+    assert res.data == b'\x00binary'
+
+    res = http.request('POST', 'http://localhost/stream/',
+                       body=iter([b'chunked ', 'body']),
+                       headers={'X-Test': 'chunks'})
+    assert res.data == b'chunked body'
+
+
+def test_request_body_reader(http):
+    StackInABox.register_service(UploadService())
+    stackinabox.util.urllib3.registration('localhost')
+
+    def generate():
+        for _ in range(1000):
+            yield b'chunk'
+
+    res = http.request('POST', 'http://localhost/upload/', body=generate())
+    assert res.status == 201
+    assert json.loads(res.data) == {
+        'sha256': hashlib.sha256(b'chunk' * 1000).hexdigest(),
+        'size': 5000
+    }
+
+
+def test_connection_pool(http):
+    StackInABox.register_service(HelloService())
+    stackinabox.util.urllib3.registration('localhost')
+
+    with urllib3.HTTPConnectionPool('localhost') as pool:
+        res = pool.urlopen('GET', '/hello/')
+        assert res.status == 200
+        assert res.data == b'Hello'
+
+
+def test_streaming_response(http):
+    service = StreamingService()
+    StackInABox.register_service(service)
+    stackinabox.util.urllib3.registration('localhost')
+
+    res = http.request('GET', 'http://localhost/stream/large',
+                       preload_content=False)
+    assert service.produced == 0
+
+    first = res.read(1024)
+    assert first == StreamingService.CHUNK[:1024]
+    assert service.produced == 1
+
+    total = len(first)
+    for chunk in res.stream(65536):
+        total += len(chunk)
+        assert service.produced < StreamingService.CHUNK_COUNT or (
+            total > 65536 * (StreamingService.CHUNK_COUNT - 2)
+        )
+    res.release_conn()
+
+    assert total == len(StreamingService.CHUNK) * StreamingService.CHUNK_COUNT
+    assert service.produced == StreamingService.CHUNK_COUNT
+
+    res = http.request('GET', 'http://localhost/stream/file',
+                       preload_content=False)
+    assert res.read() == b'file body'
+
+    res = http.request('GET', 'http://localhost/stream/large')
+    assert len(res.data) == (
+        len(StreamingService.CHUNK) * StreamingService.CHUNK_COUNT
+    )
+
+
+def test_decode_content(http):
+    StackInABox.register_service(StreamingService())
+    stackinabox.util.urllib3.registration('localhost')
+
+    res = http.request('GET', 'http://localhost/stream/gzip')
+    assert res.data == b'decompressed'
+
+    res = http.request('GET', 'http://localhost/stream/gzip',
+                       decode_content=False)
+    assert gzip.decompress(res.data) == b'decompressed'
+
+
+def test_unregistered_uri_passes_through():
+    passed_through = urllib3.HTTPResponse(body=b'', status=299)
+
+    with mock.patch.object(HTTPConnectionPool, 'urlopen',
+                           return_value=passed_through) as mock_urlopen:
+        stackinabox.util.urllib3.enable()
+        try:
+            StackInABox.register_service(HelloService())
+            stackinabox.util.urllib3.registration('localhost')
+            http = urllib3.PoolManager()
+
+            res = http.request('GET', 'http://localhost/hello/')
+            assert res.status == 200
+            assert mock_urlopen.call_count == 0
+
+            res = http.request('GET', 'http://remotehost/hello/')
+            assert res is passed_through
+            assert mock_urlopen.call_count == 1
+        finally:
+            stackinabox.util.urllib3.disable()
+            StackInABox.reset_services()
+
+
+def test_enable_disable():
+    original_urlopen = HTTPConnectionPool.urlopen
+
+    stackinabox.util.urllib3.enable()
+    patched_urlopen = HTTPConnectionPool.urlopen
+    assert patched_urlopen is not original_urlopen
+
+    # enabling again keeps the existing patch
+    stackinabox.util.urllib3.enable()
+    assert HTTPConnectionPool.urlopen is patched_urlopen
+
+    stackinabox.util.urllib3.disable()
+    stackinabox.util.urllib3.disable()
+    assert HTTPConnectionPool.urlopen is original_urlopen
+
+
+def test_iterable_reader():
+    closed = []
+
+    def chunks():
+        try:
+            yield 'text '
+            yield b''
+            yield b'bytes'
+        finally:
+            closed.append(True)
+
+    reader = stackinabox.util.urllib3.IterableReader(chunks())
+    assert reader.read(3) == b'tex'
+    assert reader.read() == b't bytes'
+    assert reader.read() == b''
+
+    reader = stackinabox.util.urllib3.IterableReader(chunks())
+    assert reader.read(1) == b't'
+    reader.close()
+    assert closed == [True, True]
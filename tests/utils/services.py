@@ -1,3 +1,5 @@
+import hashlib
+import io
 import json
 import logging
 import re
@@ -6,6 +8,7 @@ import six
 from six.moves.urllib import parse
 
 from stackinabox.services.service import StackInABoxService
+from stackinabox.util.tools import FileResponse
 
 
 logger = logging.getLogger(__name__)
@@ -82,3 +85,93 @@ class AdvancedService(StackInABoxService):
 
     def regex_handler(self, request, uri, headers):
         return (200, headers, 'okay')
+
+
+class StreamingService(StackInABoxService):
+
+    CHUNK = b'x' * 65536
+    CHUNK_COUNT = 256
+
+    def __init__(self):
+        super(StreamingService, self).__init__('stream')
+        self.produced = 0
+        self.closed = False
+        self.register(StackInABoxService.GET, '/large',
+                      StreamingService.large)
+        self.register(StackInABoxService.GET, '/file',
+                      StreamingService.file)
+        self.register(StackInABoxService.GET, '/text',
+                      StreamingService.text)
+
+    @property
+    def size(self):
+        return len(StreamingService.CHUNK) * StreamingService.CHUNK_COUNT
+
+    def large(self, request, uri, headers):
+        def chunks():
+            try:
+                for _ in range(StreamingService.CHUNK_COUNT):
+                    self.produced += 1
+                    yield StreamingService.CHUNK
+            finally:
+                self.closed = True
+
+        return (200, headers, chunks())
+
+    def file(self, request, uri, headers):
+        return (200, headers, io.BytesIO(b'file body'))
+
+    def text(self, request, uri, headers):
+        return (200, headers, iter([u'caf', u'\xe9 ', b'bytes']))
+
+
+class UploadService(StackInABoxService):
+
+    def __init__(self):
+        super(UploadService, self).__init__('upload')
+        self.register(StackInABoxService.POST, '/', UploadService.upload)
+        self.register(StackInABoxService.PUT, '/', UploadService.upload)
+
+    def upload(self, request, uri, headers):
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in request.body_reader.iter_chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        headers['Content-Type'] = 'application/json'
+        return (201, headers, json.dumps({'sha256': digest.hexdigest(),
+                                          'size': size}))
+
+
+class FileService(StackInABoxService):
+
+    def __init__(self, path):
+        super(FileService, self).__init__('files')
+        self.path = path
+        self.responses = []
+        self.register(StackInABoxService.GET, '/', FileService.whole)
+        self.register(StackInABoxService.HEAD, '/', FileService.whole)
+        self.register(StackInABoxService.GET, '/part', FileService.part)
+
+    def whole(self, request, uri, headers):
+        headers['Content-Type'] = 'application/octet-stream'
+        self.responses.append(FileResponse(self.path))
+        return (200, headers, self.responses[-1])
+
+    def part(self, request, uri, headers):
+        with FileResponse(self.path) as response:
+            self.responses.append(response.slice(10, 20))
+        return (200, headers, self.responses[-1])
+
+
+class DocumentService(StackInABoxService):
+
+    DOCUMENT = u'Stack-In-A-Box compresses this document. ' * 64
+
+    def __init__(self):
+        super(DocumentService, self).__init__('docs')
+        self.register(StackInABoxService.GET, '/', DocumentService.document)
+
+    def document(self, request, uri, headers):
+        headers['Content-Type'] = 'text/plain; charset=utf-8'
+        return (200, headers, DocumentService.DOCUMENT)
@@ -0,0 +1,74 @@
+"""
+Stack-In-A-Box: Dispatch Logging Benchmark
+
+Measures the cost of the debug logging on the request dispatch path by
+calling into StackInABox with:
+
+- DEBUG logging enabled and emitted to an in-memory stream
+- the default logging configuration, where DEBUG is not enabled
+- tracing switched off via `stackinabox.util.trace.disable()`
+
+Usage:
+
+    python tools/benchmarks/dispatch_logging.py [iterations]
+"""
+import io
+import logging
+import sys
+import timeit
+
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+
+
+class BenchmarkService(StackInABoxService):
+
+    def __init__(self):
+        super(BenchmarkService, self).__init__('benchmark')
+        self.register(StackInABoxService.GET, '/', BenchmarkService.handler)
+
+    def handler(self, request, uri, headers):
+        return (200, headers, 'benchmark')
+
+
+def measure(iterations):
+    uri = 'localhost/benchmark/?x=1'
+    elapsed = min(
+        timeit.repeat(
+            lambda: StackInABox.call_into('GET', None, uri, {}),
+            number=iterations,
+            repeat=5
+        )
+    )
+    return elapsed / iterations * 1000000
+
+
+def main(iterations=20000):
+    StackInABox.register_service(BenchmarkService())
+    StackInABox.update_uri('localhost')
+
+    stackinabox_logger = logging.getLogger('stackinabox')
+    handler = logging.StreamHandler(io.StringIO())
+
+    results = []
+
+    stackinabox_logger.addHandler(handler)
+    stackinabox_logger.setLevel(logging.DEBUG)
+    results.append(('DEBUG emitted', measure(iterations // 10)))
+    stackinabox_logger.removeHandler(handler)
+    stackinabox_logger.setLevel(logging.NOTSET)
+
+    results.append(('DEBUG not enabled', measure(iterations)))
+
+    trace.disable()
+    results.append(('tracing off', measure(iterations)))
+    trace.enable()
+
+    print('{0:>20} {1:>14}'.format('configuration', 'usec/call'))
+    for name, usec in results:
+        print('{0:>20} {1:>14.3f}'.format(name, usec))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
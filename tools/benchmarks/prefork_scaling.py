@@ -0,0 +1,130 @@
+"""
+Stack-In-A-Box: Pre-fork Server Scaling Benchmark
+
+Measures the requests per second answered by `PreforkServer` for an
+increasing number of worker processes, and the speed-up over a single
+worker. The load is generated by client processes each driving several
+keep-alive connections, so both the workers and the clients need cores of
+their own for the scaling to show.
+
+Usage:
+
+    python tools/benchmarks/prefork_scaling.py [requests] [max workers] \
+        [client processes]
+"""
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+from stackinabox.server.prefork import PreforkServer
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+
+
+REQUEST = b'GET /benchmark/ HTTP/1.1\r\nHost: localhost\r\n\r\n'
+CONNECTIONS_PER_CLIENT = 8
+
+
+class BenchmarkService(StackInABoxService):
+
+    def __init__(self):
+        super(BenchmarkService, self).__init__('benchmark')
+        self.register(StackInABoxService.GET, '/', BenchmarkService.handler)
+
+    def handler(self, request, uri, headers):
+        headers['Content-Type'] = 'text/plain'
+        return (200, headers, 'benchmark')
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200 '), head
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+
+
+async def connection(address, count):
+    reader, writer = await asyncio.open_connection(*address)
+    for _ in range(count):
+        writer.write(REQUEST)
+        await read_response(reader)
+    writer.close()
+
+
+def client(address, count, start):
+    start.wait()
+    per_connection = count // CONNECTIONS_PER_CLIENT
+
+    async def run():
+        await asyncio.gather(*[
+            connection(address, per_connection)
+            for _ in range(CONNECTIONS_PER_CLIENT)
+        ])
+
+    asyncio.run(run())
+
+
+def measure(address, requests, clients):
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    processes = [
+        context.Process(target=client,
+                        args=(address, requests // clients, start))
+        for _ in range(clients)
+    ]
+    for process in processes:
+        process.start()
+
+    started = time.perf_counter()
+    start.set()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    per_connection = requests // clients // CONNECTIONS_PER_CLIENT
+    return per_connection * CONNECTIONS_PER_CLIENT * clients / elapsed
+
+
+def main(requests=40000, max_workers=None, clients=None):
+    cpus = os.cpu_count() or 1
+    max_workers = max_workers or max(1, cpus // 2)
+    clients = clients or max(1, cpus - max_workers)
+
+    trace.disable()
+    StackInABox.register_service(BenchmarkService())
+
+    worker_counts = []
+    workers = 1
+    while workers < max_workers:
+        worker_counts.append(workers)
+        workers *= 2
+    worker_counts.append(max_workers)
+
+    results = []
+    for workers in worker_counts:
+        with PreforkServer(workers=workers,
+                           keep_alive_timeout=None) as server:
+            # warm up
+            measure(server.address, clients * CONNECTIONS_PER_CLIENT * 10,
+                    clients)
+            results.append(
+                (workers, measure(server.address, requests, clients))
+            )
+
+    print('{0} CPUs, {1} client processes'.format(cpus, clients))
+    print('{0:>10} {1:>14} {2:>10}'.format('workers', 'requests/s',
+                                           'speed-up'))
+    for workers, rate in results:
+        print('{0:>10} {1:>14.0f} {2:>9.2f}x'.format(workers,
+                                                     rate,
+                                                     rate / results[0][1]))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
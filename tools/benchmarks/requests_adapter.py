@@ -0,0 +1,82 @@
+"""
+Stack-In-A-Box: Python Requests Adapter Benchmark
+
+Measures the cost of a `requests.Session.get()` handled by Stack-In-A-Box
+through:
+
+- the requests-mock utility, `stackinabox.util.requests_mock`
+- the first-party adapter, `stackinabox.util.requests.StackInABoxAdapter`
+
+The session does not look at the environment for proxy settings, which
+would otherwise dominate the cost of both paths.
+
+Usage:
+
+    python tools/benchmarks/requests_adapter.py [iterations]
+"""
+import sys
+import timeit
+
+import requests
+
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+import stackinabox.util.requests
+import stackinabox.util.requests_mock
+
+
+class BenchmarkService(StackInABoxService):
+
+    def __init__(self):
+        super(BenchmarkService, self).__init__('benchmark')
+        self.register(StackInABoxService.GET, '/', BenchmarkService.handler)
+
+    def handler(self, request, uri, headers):
+        headers['Content-Type'] = 'text/plain'
+        return (200, headers, 'benchmark')
+
+
+def measure(registration, iterations):
+    StackInABox.reset_services()
+    StackInABox.register_service(BenchmarkService())
+
+    with requests.Session() as session:
+        session.trust_env = False
+        registration('localhost', session)
+
+        url = 'http://localhost/benchmark/'
+        response = session.get(url)
+        assert response.status_code == 200, response.status_code
+        assert response.text == 'benchmark', response.text
+
+        elapsed = min(
+            timeit.repeat(
+                lambda: session.get(url),
+                number=iterations,
+                repeat=5
+            )
+        )
+    return elapsed / iterations * 1000000
+
+
+def main(iterations=5000):
+    results = [
+        (
+            'requests-mock',
+            measure(stackinabox.util.requests_mock.session_registration,
+                    iterations)
+        ),
+        (
+            'StackInABoxAdapter',
+            measure(stackinabox.util.requests.session_registration,
+                    iterations)
+        ),
+    ]
+
+    print('{0:>20} {1:>14}'.format('path', 'usec/call'))
+    for name, usec in results:
+        print('{0:>20} {1:>14.3f}'.format(name, usec))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,112 @@
+"""
+Stack-In-A-Box: Loopback Server Throughput Benchmark
+
+Measures the requests per second answered by `StackInABoxServer` with:
+
+- one request at a time on each keep-alive connection
+- pipelined requests, several requests sent before reading the responses
+
+The server runs in a process of its own so that the clients do not compete
+with it for the GIL.
+
+Usage:
+
+    python tools/benchmarks/server_throughput.py [requests] [connections] \
+        [pipeline depth]
+"""
+import asyncio
+import multiprocessing
+import sys
+import time
+
+from stackinabox.server import StackInABoxServer
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+from stackinabox.util import trace
+
+
+REQUEST = b'GET /benchmark/ HTTP/1.1\r\nHost: localhost\r\n\r\n'
+
+
+class BenchmarkService(StackInABoxService):
+
+    def __init__(self):
+        super(BenchmarkService, self).__init__('benchmark')
+        self.register(StackInABoxService.GET, '/', BenchmarkService.handler)
+
+    def handler(self, request, uri, headers):
+        headers['Content-Type'] = 'text/plain'
+        return (200, headers, 'benchmark')
+
+
+def serve(addresses, stop):
+    trace.disable()
+    StackInABox.register_service(BenchmarkService())
+    with StackInABoxServer(keep_alive_timeout=None) as server:
+        addresses.put(server.address)
+        stop.wait()
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200 '), head
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+
+
+async def client(address, count, depth):
+    reader, writer = await asyncio.open_connection(*address)
+    sent = 0
+    while sent < count:
+        batch = min(depth, count - sent)
+        writer.write(REQUEST * batch)
+        for _ in range(batch):
+            await read_response(reader)
+        sent += batch
+    writer.close()
+
+
+async def measure(address, requests, connections, depth):
+    per_connection = requests // connections
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(address, per_connection, depth)
+        for _ in range(connections)
+    ])
+    elapsed = time.perf_counter() - start
+    return per_connection * connections / elapsed
+
+
+def main(requests=20000, connections=8, depth=16):
+    addresses = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve, args=(addresses, stop))
+    process.start()
+    try:
+        address = addresses.get(timeout=30)
+
+        # warm up
+        asyncio.run(measure(address, connections * 10, connections, 1))
+
+        results = [
+            ('keep-alive', asyncio.run(
+                measure(address, requests, connections, 1)
+            )),
+            ('pipelined x{0}'.format(depth), asyncio.run(
+                measure(address, requests, connections, depth)
+            )),
+        ]
+    finally:
+        stop.set()
+        process.join()
+
+    print('{0:>20} {1:>14}'.format('mode', 'requests/s'))
+    for name, rate in results:
+        print('{0:>20} {1:>14.0f}'.format(name, rate))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,63 @@
+"""
+Stack-In-A-Box: Service Dispatch Benchmark
+
+Measures the cost of StackInABox.call() resolving the service for a request
+as the number of registered services grows. The request always targets the
+last registered service, the worst case for a linear scan.
+
+Usage:
+
+    python tools/benchmarks/service_dispatch.py [iterations]
+"""
+import sys
+import timeit
+
+from stackinabox.services.service import StackInABoxService
+from stackinabox.stack import StackInABox
+
+
+SERVICE_COUNTS = (1, 10, 100, 1000)
+
+
+class BenchmarkService(StackInABoxService):
+
+    def __init__(self, name):
+        super(BenchmarkService, self).__init__(name)
+        self.register(StackInABoxService.GET, '/', BenchmarkService.handler)
+
+    def handler(self, request, uri, headers):
+        return (200, headers, 'benchmark')
+
+
+def build_stack(service_count):
+    stack = StackInABox()
+    for service_number in range(service_count):
+        stack.register(BenchmarkService('service{0}'.format(service_number)))
+    stack.base_url = 'localhost'
+    return stack
+
+
+def main(iterations=10000):
+    print('{0:>10} {1:>14}'.format('services', 'usec/call'))
+    for service_count in SERVICE_COUNTS:
+        stack = build_stack(service_count)
+        uri = 'localhost/service{0}/'.format(service_count - 1)
+
+        status, _, _ = stack.call('GET', None, uri, {})
+        assert status == 200, status
+
+        elapsed = min(
+            timeit.repeat(
+                lambda: stack.call('GET', None, uri, {}),
+                number=iterations,
+                repeat=5
+            )
+        )
+        print('{0:>10} {1:>14.3f}'.format(
+            service_count,
+            elapsed / iterations * 1000000
+        ))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])